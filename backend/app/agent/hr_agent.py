@@ -1,48 +1,94 @@
+import contextvars
 import json
 import re
-from typing import Dict, List, Any, Optional
-from langchain_community.chat_models import ChatOllama
+import threading
+import time
+import numpy as np
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, Any, Optional, Callable
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from app.config import settings
-from app.database import execute_sql_query, validate_sql_query
+from app.database import execute_sql_query, result_cache, SQLExecutionError
 from app.agent.prompts import (
-    SQL_GENERATION_PROMPT,
-    TABLE_COLUMN_IDENTIFICATION_PROMPT,
-    VISUALIZATION_RECOMMENDATION_PROMPT,
-    INSIGHTS_GENERATION_PROMPT
+    SQL_GENERATION_USER_PROMPT,
+    FUSED_GENERATION_USER_PROMPT,
+    VISUALIZATION_RECOMMENDATION_SYSTEM_PROMPT,
+    VISUALIZATION_RECOMMENDATION_USER_PROMPT,
+    INSIGHTS_SYSTEM_PROMPT,
+    INSIGHTS_GENERATION_PROMPT,
+    SQL_REPAIR_USER_PROMPT
 )
+from app.agent.intent_router import intent_router
+from app.agent.schema_linker import schema_linker
+from app.agent.insight_engine import insight_engine, topic_recommendations
+from app.agent.result_profiler import ResultProfile
+from app.agent.schema_catalog import schema_catalog, SchemaSnapshot
+from app.agent.sql_parser import sql_column_extractor, check_sql
 from app.services.token_counter import token_counter
+from app.services.sql_cache import sql_cache
+from app.services.semantic_cache import semantic_cache
+from app.services.executor import stage_executor
+from app.services.llm_pool import ollama_pool
+from app.services.admission import AdmissionRejected
+from app.services.deadline import Deadline
+from app.services.circuit_breaker import ollama_breaker
 
 
+def clear_sql_caches(snapshot: SchemaSnapshot):
+    """Drop cached SQL and results when the schema changes: they may name tables or columns that
+    no longer exist, and schema changes do not move the result cache's data versions"""
+    sql_cache.clear()
+    semantic_cache.clear()
+    result_cache.clear()
+    print(f"✓ Cleared SQL caches for schema version {snapshot.version}")
+
+
+schema_catalog.on_change(clear_sql_caches)
+# Department slots are checked against the live Department values before a template is used
+intent_router.department_names = schema_catalog.department_names
+
 class HRAgent:
     """HR Analytics Agent using LangChain and Ollama"""
     
     def __init__(self):
         try:
-            self.llm = ChatOllama(
-                base_url=settings.OLLAMA_BASE_URL,
-                model=settings.OLLAMA_MODEL,
-                temperature=0.1
-            )
+            # Chat calls are load-balanced across the configured Ollama backends
+            self.llm = ollama_pool
             self.output_parser = StrOutputParser()
         except Exception as e:
             raise Exception(f"Failed to initialize LLM: {str(e)}. Make sure Ollama is running at {settings.OLLAMA_BASE_URL}")
     
+    def format_history(self, conversation_history: List[Dict] = None) -> str:
+        """Format the conversation history that is fed into SQL generation"""
+        history_text = ""
+        if conversation_history:
+            for msg in conversation_history[-5:]:  # Last 5 messages for context
+                role = msg.get("role", "user")
+                content = msg.get("content", "")
+                history_text += f"{role}: {content}\n"
+        return history_text
+    
     def generate_sql(self, question: str, conversation_history: List[Dict] = None) -> Dict[str, Any]:
         """Generate SQL query from natural language question
-        Returns: {"sql": str, "tokens": int}
+        Returns: {"sql": str, "tokens": int, "schema_linking": {"tables": [], "prompt_tokens_saved": int} or None}
         """
         try:
             # Format conversation history
-            history_text = ""
-            if conversation_history:
-                for msg in conversation_history[-5:]:  # Last 5 messages for context
-                    role = msg.get("role", "user")
-                    content = msg.get("content", "")
-                    history_text += f"{role}: {content}\n"
-            
-            prompt = ChatPromptTemplate.from_template(SQL_GENERATION_PROMPT)
+            history_text = self.format_history(conversation_history)
+            
+            # Only send the tables and guidelines relevant to this question
+            linking = None
+            system_prompt = schema_catalog.snapshot().sql_generation_prompt
+            if settings.SCHEMA_LINKING_ENABLED:
+                link = schema_linker.link(question, history_text)
+                system_prompt = link["prompt"]
+                linking = {"tables": link["tables"], "prompt_tokens_saved": link["prompt_tokens_saved"]}
+            
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", system_prompt),
+                ("human", SQL_GENERATION_USER_PROMPT)
+            ])
             chain = prompt | self.llm | self.output_parser
             
             # Build full prompt for token counting
@@ -69,45 +115,111 @@ class HRAgent:
             
             return {
                 "sql": sql_query,
-                "tokens": total_tokens
+                "tokens": total_tokens,
+                "schema_linking": linking
             }
+        except AdmissionRejected:
+            raise
         except Exception as e:
             raise Exception(f"SQL generation failed: {str(e)}")
     
-    def identify_tables_columns(self, question: str, sql_query: str) -> Dict[str, Any]:
-        """Identify tables and columns used in the query
-        Returns: {"tables": [], "columns": {}, "tokens": int}
+    def generate_fused(self, question: str, conversation_history: List[Dict] = None) -> Dict[str, Any]:
+        """Generate SQL, a visualization plan and an insight plan in a single LLM call
+        Returns: {"sql": str, "visualization": dict or None, "insight_plan": str or None, "tokens": int}
         """
-        tokens_used = 0
         try:
-            prompt = ChatPromptTemplate.from_template(TABLE_COLUMN_IDENTIFICATION_PROMPT)
-            chain = prompt | self.llm | self.output_parser
+            history_text = self.format_history(conversation_history)
             
-            full_prompt = prompt.format(question=question, sql_query=sql_query)
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", schema_catalog.snapshot().fused_generation_prompt),
+                ("human", FUSED_GENERATION_USER_PROMPT)
+            ])
+            chain = prompt | self.llm | self.output_parser
+            full_prompt = prompt.format(question=question, conversation_history=history_text)
             
             response = chain.invoke({
                 "question": question,
-                "sql_query": sql_query
+                "conversation_history": history_text
             })
+            total_tokens = token_counter.count_tokens(full_prompt) + token_counter.count_tokens(response)
             
-            # Count tokens
-            tokens_used = token_counter.count_tokens(full_prompt) + token_counter.count_tokens(response)
+            # Parse the JSON object; if the model ignored the format, treat the response as plain SQL
+            plan = {}
+            json_match = re.search(r'\{.*\}', response, re.DOTALL)
+            if json_match:
+                try:
+                    plan = json.loads(json_match.group())
+                except json.JSONDecodeError:
+                    plan = {}
+            sql_query = plan.get("sql") if isinstance(plan.get("sql"), str) else response
+            sql_query = re.sub(r'```sql\n?', '', sql_query.strip())
+            sql_query = re.sub(r'```\n?', '', sql_query).strip()
             
-            # Try to parse JSON response
-            try:
-                # Extract JSON from response
-                json_match = re.search(r'\{.*\}', response, re.DOTALL)
-                if json_match:
-                    parsed = json.loads(json_match.group())
-                    if parsed.get("tables") and parsed.get("columns"):
-                        parsed["tokens"] = tokens_used
-                        return parsed
-            except Exception as e:
-                print(f"Warning: Failed to parse LLM response for table/column identification: {e}")
+            if not sql_query:
+                raise Exception("LLM returned empty SQL query")
+            
+            visualization = plan.get("visualization")
+            insight_plan = plan.get("insight_plan")
+            return {
+                "sql": sql_query,
+                "visualization": visualization if isinstance(visualization, dict) else None,
+                "insight_plan": insight_plan if isinstance(insight_plan, str) and insight_plan.strip() else None,
+                "tokens": total_tokens
+            }
+        except AdmissionRejected:
+            raise
         except Exception as e:
-            print(f"Warning: LLM call failed for table/column identification: {e}")
+            raise Exception(f"Fused generation failed: {str(e)}")
+    
+    def repair_sql(self, question: str, sql_query: str, error: str) -> Dict[str, Any]:
+        """Fix a SQL query using the error the database reported for it (short, focused prompt)
+        Returns: {"sql": str, "tokens": int}
+        """
+        try:
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", schema_catalog.snapshot().sql_repair_prompt),
+                ("human", SQL_REPAIR_USER_PROMPT)
+            ])
+            chain = prompt | self.llm | self.output_parser
+            inputs = {"question": question, "sql_query": sql_query, "error": error}
+            
+            full_prompt = prompt.format(**inputs)
+            response = chain.invoke(inputs)
+            total_tokens = token_counter.count_tokens(full_prompt) + token_counter.count_tokens(response)
+            
+            repaired = response.strip()
+            repaired = re.sub(r'```sql\n?', '', repaired)
+            repaired = re.sub(r'```\n?', '', repaired)
+            repaired = repaired.strip()
+            
+            if not repaired:
+                raise Exception("LLM returned empty SQL query")
+            
+            return {
+                "sql": repaired,
+                "tokens": total_tokens
+            }
+        except AdmissionRejected:
+            # Includes CircuitOpenError: overload is reported as 503, not as unrepairable SQL
+            raise
+        except Exception as e:
+            raise Exception(f"SQL repair failed: {str(e)}")
+    
+    def identify_tables_columns(self, question: str, sql_query: str) -> Dict[str, Any]:
+        """Identify tables and columns used in the query by parsing the SQL (no LLM call)
+        Returns: {"tables": [], "columns": {}, "select_columns": {}, "filter_columns": {},
+                  "group_by_columns": {}, "join_keys": [], "tokens": 0}
+        """
+        tokens_used = 0
+        try:
+            parsed = sql_column_extractor.extract(sql_query)
+            if parsed["tables"]:
+                parsed["tokens"] = tokens_used
+                return parsed
+        except Exception as e:
+            print(f"Warning: Failed to parse SQL for table/column identification: {e}")
         
-        # Fallback: parse from SQL query directly (improved parsing)
+        # Fallback: regex parsing for SQL the parser cannot handle
         tables = []
         columns = {}
         
@@ -166,7 +278,9 @@ class HRAgent:
             "tokens": tokens_used
         }
     
-    def recommend_visualization(self, query: str, results: List[Dict], columns: List[str]) -> Dict[str, Any]:
+    def recommend_visualization(
+        self, query: str, results: List[Dict], columns: List[str], profile: Optional[ResultProfile] = None
+    ) -> Dict[str, Any]:
         """Recommend visualization type based on query results
         Returns: {"visualization_type": str, ..., "tokens": int}
         """
@@ -181,10 +295,15 @@ class HRAgent:
             }
         
         result_count = len(results)
-        sample_data = json.dumps(results[:3], indent=2) if results else "[]"
+        profile = profile or ResultProfile(results)
+        # default=str for the Decimal and date values PostgreSQL returns
+        sample_data = json.dumps(results[:3], indent=2, default=str) if results else "[]"
         
         try:
-            prompt = ChatPromptTemplate.from_template(VISUALIZATION_RECOMMENDATION_PROMPT)
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", VISUALIZATION_RECOMMENDATION_SYSTEM_PROMPT),
+                ("human", VISUALIZATION_RECOMMENDATION_USER_PROMPT)
+            ])
             chain = prompt | self.llm | self.output_parser
             
             full_prompt = prompt.format(
@@ -212,7 +331,7 @@ class HRAgent:
                     viz_data["tokens"] = tokens_used
                     
                     # Override visualization based on query type
-                    if result_columns:
+                    if columns:
                         query_lower = query.lower()
                         
                         # Check for distribution queries - force pie chart
@@ -220,29 +339,23 @@ class HRAgent:
                             ['distribution', 'percentage', 'proportion', 'share', 'breakdown'])
                         
                         # Check for time-series - force line chart
-                        has_time_column = any(
-                            'month' in col.lower() or 'date' in col.lower() or 'time' in col.lower() or 'timestamp' in col.lower()
-                            for col in result_columns
-                        )
+                        has_time_column = bool(profile.time_columns)
                         is_trend = any(keyword in query_lower for keyword in 
                             ['trend', 'over time', 'by month', 'monthly'])
                         
                         # Override based on query type
-                        if is_distribution and len(result_columns) >= 2:
-                            category_col = result_columns[0]
-                            value_col = result_columns[1] if len(result_columns) > 1 else result_columns[0]
+                        if is_distribution and len(columns) >= 2:
+                            category_col = columns[0]
+                            value_col = columns[1] if len(columns) > 1 else columns[0]
                             viz_data["visualization_type"] = "pie"
                             viz_data["x_axis"] = category_col
                             viz_data["y_axis"] = value_col
                             viz_data["explanation"] = "Pie chart for distribution data"
-                        elif (has_time_column or is_trend) and len(result_columns) >= 2:
-                            date_col = next(
-                                (col for col in result_columns if 'month' in col.lower() or 'date' in col.lower() or 'time' in col.lower()),
-                                result_columns[0]
-                            )
+                        elif (has_time_column or is_trend) and len(columns) >= 2:
+                            date_col = profile.time_columns[0] if has_time_column else columns[0]
                             value_col = next(
-                                (col for col in result_columns if col != date_col),
-                                result_columns[1] if len(result_columns) > 1 else result_columns[0]
+                                (col for col in profile.measure_columns + columns if col != date_col),
+                                columns[1] if len(columns) > 1 else columns[0]
                             )
                             viz_data["visualization_type"] = "line"
                             viz_data["x_axis"] = date_col
@@ -256,13 +369,26 @@ class HRAgent:
             print(f"Warning: Visualization recommendation failed: {e}")
         
         # Fallback: simple heuristic with smart detection
+        viz_data = self.heuristic_visualization(query, results, columns, profile)
+        viz_data["tokens"] = tokens_used
+        return viz_data
+    
+    def heuristic_visualization(
+        self, query: str, results: List[Dict], columns: List[str], profile: Optional[ResultProfile] = None
+    ) -> Dict[str, Any]:
+        """Recommend a visualization from result shape and query keywords without calling the LLM
+        Returns: {"visualization_type": str, "x_axis": str, "y_axis": str, "explanation": str}
+        """
+        result_count = len(results)
+        profile = profile or ResultProfile(results)
+        time_columns = profile.time_columns
+        
         if result_count == 1 and len(columns) <= 2:
             return {
                 "visualization_type": "none",
                 "x_axis": None,
                 "y_axis": None,
-                "explanation": "Single value result",
-                "tokens": tokens_used
+                "explanation": "Single value result"
             }
         elif len(columns) >= 2:
             # Check query for keywords
@@ -273,10 +399,7 @@ class HRAgent:
                 ['distribution', 'percentage', 'proportion', 'share', 'breakdown'])
             
             # Check if we have a date/time column
-            has_date_column = any(
-                'month' in col.lower() or 'date' in col.lower() or 'time' in col.lower() or 'timestamp' in col.lower()
-                for col in columns
-            )
+            has_date_column = bool(time_columns)
             
             # Check if query asks for trends
             is_trend = any(keyword in query_lower for keyword in 
@@ -284,20 +407,16 @@ class HRAgent:
             
             if is_trend and has_date_column:
                 # Time series - use line chart
-                date_col = next(
-                    (col for col in columns if 'month' in col.lower() or 'date' in col.lower() or 'time' in col.lower()),
-                    columns[0]
-                )
+                date_col = time_columns[0]
                 value_col = next(
-                    (col for col in columns if col != date_col),
+                    (col for col in profile.measure_columns + columns if col != date_col),
                     columns[1] if len(columns) > 1 else columns[0]
                 )
                 return {
                     "visualization_type": "line",
                     "x_axis": date_col,
                     "y_axis": value_col,
-                    "explanation": "Line chart for time series data",
-                    "tokens": tokens_used
+                    "explanation": "Line chart for time series data"
                 }
             elif is_distribution or (len(columns) == 2 and result_count <= 10):
                 # Distribution - use pie chart
@@ -307,8 +426,7 @@ class HRAgent:
                     "visualization_type": "pie",
                     "x_axis": category_col,
                     "y_axis": value_col,
-                    "explanation": "Pie chart for distribution/percentage data",
-                    "tokens": tokens_used
+                    "explanation": "Pie chart for distribution/percentage data"
                 }
             else:
                 # Categorical comparison - use bar chart
@@ -316,23 +434,42 @@ class HRAgent:
                     "visualization_type": "bar",
                     "x_axis": columns[0],
                     "y_axis": columns[1] if len(columns) > 1 else None,
-                    "explanation": "Bar chart for categorical comparison",
-                    "tokens": tokens_used
+                    "explanation": "Bar chart for categorical comparison"
                 }
         else:
             return {
                 "visualization_type": "table",
                 "x_axis": None,
                 "y_axis": None,
-                "explanation": "Table view for detailed data",
-                "tokens": tokens_used
+                "explanation": "Table view for detailed data"
             }
     
-    def generate_insights(self, query: str, results: List[Dict]) -> Dict[str, Any]:
+    def generate_insights(
+        self,
+        query: str,
+        results: List[Dict],
+        on_token: Optional[Callable[[str], None]] = None,
+        insight_plan: Optional[str] = None,
+        use_llm: bool = True,
+        profile: Optional[ResultProfile] = None
+    ) -> Dict[str, Any]:
         """Generate insights and explanation from query results
+        If on_token is given, the LLM response is streamed and each text chunk is passed to it.
+        insight_plan (from fused generation) tells the LLM what the insights should focus on.
+        With use_llm=False, only the data-driven (stats) insights are produced, without an LLM call.
+        Results with a recognized shape (scalar, categorical, time series) are described by the
+        insight engine and never reach the LLM. profile is built from results if not given.
         Returns: {"insights": [], "explanation": str, "tokens": int}
         """
         tokens_used = 0
+        profile = profile or ResultProfile(results)
+        numeric_cols = profile.measure_columns
+        date_cols = profile.time_columns
+        if settings.INSIGHT_ENGINE_ENABLED:
+            computed = insight_engine.analyze(results, profile)
+            if computed:
+                print(f"✓ Using computed insights ({computed['shape']} result) - skipped LLM")
+                return {"insights": computed["insights"], "explanation": computed["explanation"], "tokens": 0}
         try:
             # Limit results to reduce token usage (only send first 5-10 rows)
             results_sample = results[:5] if len(results) > 5 else results
@@ -357,60 +494,42 @@ class HRAgent:
             if results and result_count > 0:
                 # Calculate basic stats to help LLM
                 try:
-                    numeric_cols = []
-                    for col in results[0].keys():
-                        try:
-                            sample_val = results[0].get(col)
-                            if sample_val and (isinstance(sample_val, (int, float)) or 
-                                              (isinstance(sample_val, str) and sample_val.replace('.', '').replace('-', '').isdigit())):
-                                numeric_cols.append(col)
-                        except:
-                            pass
-                    
                     if numeric_cols:
-                        values = [float(row.get(numeric_cols[0], 0) or 0) for row in results]
-                        max_val = max(values)
-                        min_val = min(values)
-                        total = sum(values)
-                        avg_val = total / len(values) if values else 0
+                        values = profile.values(numeric_cols[0], nulls_as_zero=True)
+                        max_val = float(values.max())
+                        min_val = float(values.min())
+                        total = float(values.sum())
+                        avg_val = float(values.mean())
                         summary_stats = f"Stats: max={max_val:.0f}, min={min_val:.0f}, total={total:.0f}, avg={avg_val:.0f}"
                 except:
                     pass
             
-            # Use shorter prompt template
-            prompt_text = f"""Analyze this HR query and provide insights.
-
-Query: {query}
+            # Use shorter prompt template (static instructions as the system message, data last)
+            data_text = f"""Query: {query}
 Result Count: {result_count}
 {summary_stats}
 Sample Data (first {len(results_sample)} rows):
-{results_str}
-
-Provide ALL sections:
-
-INSIGHTS:
-- [Specific insight with numbers from data]
-- [Another insight with numbers]
-- [Third insight]
-
-EXPLANATION:
-[3-4 sentences explaining what data shows, what it means for HR, reference specific numbers]
-
-NOTABLE PATTERNS & TRENDS:
-[2-3 sentences on patterns, trends, anomalies with numbers]
-
-ACTIONABLE RECOMMENDATIONS:
-- [Recommendation 1]
-- [Recommendation 2]
-- [Recommendation 3]
-
-Use ACTUAL numbers from the data. Avoid generic statements."""
+{results_str}"""
+            if insight_plan:
+                data_text += f"\nFocus: {insight_plan}"
+            messages = [("system", INSIGHTS_SYSTEM_PROMPT), ("human", data_text)]
+            prompt_text = f"{INSIGHTS_SYSTEM_PROMPT}\n{data_text}"
             
-            response = self.llm.invoke(prompt_text)
-            response_text = response.content if hasattr(response, 'content') else str(response)
+            if not use_llm:
+                response_text = ""
+            elif on_token:
+                response_text = ""
+                for chunk in self.llm.stream(messages):
+                    piece = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                    response_text += piece
+                    on_token(piece)
+            else:
+                response = self.llm.invoke(messages)
+                response_text = response.content if hasattr(response, 'content') else str(response)
             
             # Count tokens
-            tokens_used = token_counter.count_tokens(prompt_text) + token_counter.count_tokens(response_text)
+            if use_llm:
+                tokens_used = token_counter.count_tokens(prompt_text) + token_counter.count_tokens(response_text)
             
             # Parse all sections from response
             insights = []
@@ -437,7 +556,8 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
             else:
                 # If no INSIGHTS: section, try to extract from the whole response
                 # Sometimes LLM doesn't follow format exactly
-                print("⚠️  No INSIGHTS: section found in LLM response, trying to extract from full response")
+                if use_llm:
+                    print("⚠️  No INSIGHTS: section found in LLM response, trying to extract from full response")
                 # Look for bullet points in the whole response
                 for line in response_text.split("\n"):
                     line = line.strip()
@@ -513,7 +633,8 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
             
             # If insights are generic, try to generate real insights from data
             if is_generic and results and result_count > 0:
-                print("Warning: LLM generated generic insights. Generating data-driven insights from results...")
+                if use_llm:
+                    print("Warning: LLM generated generic insights. Generating data-driven insights from results...")
                 
                 # Generate real insights from actual data
                 if result_count == 1:
@@ -528,69 +649,35 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
                     
                     # Find highest value
                     try:
-                        numeric_cols = []
-                        for col in results[0].keys():
-                            try:
-                                # Try to find numeric columns
-                                sample_val = results[0].get(col)
-                                if sample_val and (isinstance(sample_val, (int, float)) or 
-                                                  (isinstance(sample_val, str) and sample_val.replace('.', '').replace('-', '').isdigit())):
-                                    numeric_cols.append(col)
-                            except:
-                                pass
-                        
                         if numeric_cols:
-                            # Find max value
-                            max_val = 0
-                            max_row = None
-                            for row in results:
-                                for col in numeric_cols:
-                                    try:
-                                        val = float(row.get(col, 0) or 0)
-                                        if val > max_val:
-                                            max_val = val
-                                            max_row = row
-                                    except:
-                                        pass
-                            
-                            if max_row:
-                                category_col = next((k for k in max_row.keys() if k not in numeric_cols), list(max_row.keys())[0])
-                                insights.append(f"{max_row.get(category_col, 'Unknown')} has the highest value of {max_val:,.0f}")
-                        
-                        # Find lowest value
-                        if len(results) > 1:
-                            min_val = float('inf')
-                            min_row = None
-                            for row in results:
-                                for col in numeric_cols:
-                                    try:
-                                        val = float(row.get(col, 0) or 0)
-                                        if val < min_val:
-                                            min_val = val
-                                            min_row = row
-                                    except:
-                                        pass
+                            # Highest and lowest value across the numeric columns, with the row's label
+                            matrix = np.column_stack([profile.values(col, nulls_as_zero=True) for col in numeric_cols])
+                            category_col = next((col for col in profile.column_names if col not in numeric_cols), profile.column_names[0])
+                            max_index = int(matrix.argmax()) // len(numeric_cols)
+                            max_val = float(matrix.max())
+                            if max_val > 0:
+                                insights.append(f"{results[max_index].get(category_col, 'Unknown')} has the highest value of {max_val:,.0f}")
                             
-                            if min_row and min_val != float('inf'):
-                                category_col = next((k for k in min_row.keys() if k not in numeric_cols), list(min_row.keys())[0])
-                                insights.append(f"{min_row.get(category_col, 'Unknown')} has the lowest value of {min_val:,.0f}")
+                            # Find lowest value
+                            if len(results) > 1:
+                                min_index = int(matrix.argmin()) // len(numeric_cols)
+                                min_val = float(matrix.min())
+                                insights.append(f"{results[min_index].get(category_col, 'Unknown')} has the lowest value of {min_val:,.0f}")
                         
                         # For time series, calculate trend; for categorical, show total
                         if numeric_cols:
-                            # Check if this is time series data
-                            has_time_col = any('month' in col.lower() or 'date' in col.lower() for col in results[0].keys())
+                            values = profile.values(numeric_cols[0], nulls_as_zero=True)
+                            date_col = date_cols[0] if date_cols else None
                             
-                            if has_time_col and len(results) > 1:
+                            if date_col and len(results) > 1:
                                 # Time series - calculate trend
-                                first_val = float(results[0].get(numeric_cols[0], 0) or 0)
-                                last_val = float(results[-1].get(numeric_cols[0], 0) or 0)
+                                first_val = float(values[0])
+                                last_val = float(values[-1])
                                 change = last_val - first_val
                                 change_pct = (change / first_val * 100) if first_val > 0 else 0
                                 
-                                # Get date columns safely (handle date objects)
-                                date_col = next((col for col in results[0].keys() if 'month' in col.lower() or 'date' in col.lower()), None)
-                                first_date = str(results[0].get(date_col, 'start')) if date_col else 'start'
-                                last_date = str(results[-1].get(date_col, 'end')) if date_col else 'end'
+                                first_date = str(results[0].get(date_col, 'start'))
+                                last_date = str(results[-1].get(date_col, 'end'))
                                 
                                 if change > 0:
                                     insights.append(f"Trend: Increased by {change:,.0f} ({change_pct:.1f}%) from {first_date} to {last_date}")
@@ -600,22 +687,16 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
                                     insights.append(f"Trend: Stable at {first_val:,.0f} across the period")
                                 
                                 # Add average
-                                avg_val = sum(float(row.get(numeric_cols[0], 0) or 0) for row in results) / len(results)
-                                insights.append(f"Average value: {avg_val:,.0f}")
+                                insights.append(f"Average value: {float(values.mean()):,.0f}")
                                 
                                 # Add peak and low points
-                                max_row = max(results, key=lambda r: float(r.get(numeric_cols[0], 0) or 0))
-                                min_row = min(results, key=lambda r: float(r.get(numeric_cols[0], 0) or 0))
-                                max_val = float(max_row.get(numeric_cols[0], 0) or 0)
-                                min_val = float(min_row.get(numeric_cols[0], 0) or 0)
-                                max_date = str(max_row.get(date_col, '')) if date_col else ''
-                                min_date = str(min_row.get(date_col, '')) if date_col else ''
-                                insights.append(f"Peak: {max_val:,.0f} in {max_date}" if max_date else f"Peak: {max_val:,.0f}")
-                                insights.append(f"Low: {min_val:,.0f} in {min_date}" if min_date else f"Low: {min_val:,.0f}")
+                                max_date = str(results[int(values.argmax())].get(date_col, ''))
+                                min_date = str(results[int(values.argmin())].get(date_col, ''))
+                                insights.append(f"Peak: {float(values.max()):,.0f} in {max_date}" if max_date else f"Peak: {float(values.max()):,.0f}")
+                                insights.append(f"Low: {float(values.min()):,.0f} in {min_date}" if min_date else f"Low: {float(values.min()):,.0f}")
                             else:
                                 # Categorical - show total
-                                total = sum(float(row.get(numeric_cols[0], 0) or 0) for row in results)
-                                insights.append(f"Total across all categories: {total:,.0f}")
+                                insights.append(f"Total across all categories: {float(values.sum()):,.0f}")
                     except Exception as e:
                         print(f"Error generating insights from data: {e}")
                         import traceback
@@ -650,35 +731,24 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
                             explanation += "This represents the current state of this metric in the HR system."
                         else:
                             # Multiple values - analyze distribution
-                            numeric_cols = []
-                            category_cols = []
-                            for col in results[0].keys():
-                                try:
-                                    sample_val = results[0].get(col)
-                                    if sample_val and (isinstance(sample_val, (int, float)) or 
-                                                      (isinstance(sample_val, str) and sample_val.replace('.', '').replace('-', '').isdigit())):
-                                        numeric_cols.append(col)
-                                    else:
-                                        category_cols.append(col)
-                                except:
-                                    category_cols.append(col)
+                            category_cols = profile.label_columns + date_cols
                             
                             if numeric_cols and category_cols:
                                 # Find top category
-                                top_row = max(results, key=lambda r: float(r.get(numeric_cols[0], 0) or 0))
-                                top_val = float(top_row.get(numeric_cols[0], 0) or 0)
-                                top_cat = top_row.get(category_cols[0], "Unknown")
+                                values = profile.values(numeric_cols[0], nulls_as_zero=True)
+                                top_val = float(values.max())
+                                top_cat = results[int(values.argmax())].get(category_cols[0], "Unknown")
                                 
-                                total = sum(float(r.get(numeric_cols[0], 0) or 0) for r in results)
+                                total = float(values.sum())
                                 
                                 explanation = f"This query analyzed {result_count} records showing {category_cols[0].replace('_', ' ').title()} distribution. "
                                 explanation += f"{top_cat} has the highest value of {top_val:,.0f}, representing {top_val/total*100:.1f}% of the total ({total:,.0f}). "
                                 explanation += "The visualization shows the distribution across all categories."
                             elif numeric_cols:
                                 # Time series or numeric data
-                                values = [float(r.get(numeric_cols[0], 0) or 0) for r in results]
-                                max_val = max(values)
-                                min_val = min(values)
+                                values = profile.values(numeric_cols[0], nulls_as_zero=True)
+                                max_val = float(values.max())
+                                min_val = float(values.min())
                                 explanation = f"This query analyzed {result_count} data points over time. "
                                 explanation += f"Values range from {min_val:,.0f} to {max_val:,.0f}. "
                                 explanation += "The trend shows how this metric has changed over the period."
@@ -694,8 +764,7 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
             # Generate fallback patterns if missing
             if not patterns and results and result_count > 1:
                 # Try to identify patterns from data
-                if any('month' in str(col).lower() or 'date' in str(col).lower() 
-                       for row in results[:3] for col in row.keys()):
+                if date_cols:
                     patterns = f"The data shows trends over time with {result_count} data points. Analyze the chart to identify specific patterns."
                 elif result_count <= 10:
                     # Small dataset - mention distribution
@@ -706,85 +775,39 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
             # Generate fallback recommendations if missing
             if not recommendations and results and result_count > 0:
                 # Generic but helpful recommendations
-                if any('headcount' in str(col).lower() or 'count' in str(col).lower() 
-                       for row in results[:3] for col in row.keys()):
-                    recommendations = "- Monitor headcount trends regularly\n- Review department staffing levels\n- Consider workforce planning based on trends"
-                elif any('salary' in str(col).lower() or 'compensation' in str(col).lower() 
-                         for row in results[:3] for col in row.keys()):
-                    recommendations = "- Review compensation equity across departments\n- Consider market benchmarking\n- Analyze salary trends for retention"
-                elif any('performance' in str(col).lower() or 'rating' in str(col).lower() 
-                         for row in results[:3] for col in row.keys()):
-                    recommendations = "- Identify high performers for recognition\n- Develop improvement plans for low performers\n- Review performance distribution"
-                else:
-                    recommendations = "- Review the data regularly\n- Use insights for strategic HR decisions\n- Monitor trends over time"
+                recommendations = "\n".join(f"- {r}" for r in topic_recommendations(profile.column_names))
             
             # Final safety check - ensure we always have insights
             if not insights or len(insights) == 0:
                 print("⚠️  No insights generated, creating fallback insights from data...")
                 if results and result_count > 0:
                     try:
-                        # Find numeric and date columns
-                        numeric_cols = []
-                        date_cols = []
-                        for col in results[0].keys():
-                            val = results[0].get(col)
-                            # Check if numeric (handle Decimal, int, float, or numeric string)
-                            try:
-                                float(str(val).replace(',', ''))
-                                if 'month' not in col.lower() and 'date' not in col.lower():
-                                    numeric_cols.append(col)
-                            except:
-                                pass
-                            # Check if date column
-                            if 'month' in col.lower() or 'date' in col.lower() or hasattr(val, 'isoformat'):
-                                date_cols.append(col)
-                        
-                        if numeric_cols and date_cols and len(results) > 1:
+                        values = profile.values(numeric_cols[0], nulls_as_zero=True) if numeric_cols else None
+                        if values is not None and date_cols and len(results) > 1:
                             # Time series data
-                            values = []
-                            for r in results:
-                                try:
-                                    val = float(str(r.get(numeric_cols[0], 0) or 0).replace(',', ''))
-                                    values.append(val)
-                                except:
-                                    pass
+                            first_val = float(values[0])
+                            last_val = float(values[-1])
+                            change = last_val - first_val
+                            change_pct = (change / first_val * 100) if first_val > 0 else 0
                             
-                            if values:
-                                first_val = values[0]
-                                last_val = values[-1]
-                                change = last_val - first_val
-                                change_pct = (change / first_val * 100) if first_val > 0 else 0
-                                
-                                # Get dates safely
-                                first_date_val = results[0].get(date_cols[0], '') if date_cols else ''
-                                last_date_val = results[-1].get(date_cols[0], '') if date_cols else ''
-                                first_date = str(first_date_val)[:10] if first_date_val else 'start'
-                                last_date = str(last_date_val)[:10] if last_date_val else 'end'
-                                
-                                insights = [
-                                    f"Trend: {'Increased' if change > 0 else 'Decreased' if change < 0 else 'Stable'} by {abs(change):,.0f} ({abs(change_pct):.1f}%) from {first_date} to {last_date}",
-                                    f"Range: {min(values):,.0f} to {max(values):,.0f}",
-                                    f"Average: {sum(values)/len(values):,.0f}"
-                                ]
-                            else:
-                                insights = [f"Query analyzed {result_count} records"]
-                        elif numeric_cols:
+                            # Get dates safely
+                            first_date_val = results[0].get(date_cols[0], '')
+                            last_date_val = results[-1].get(date_cols[0], '')
+                            first_date = str(first_date_val)[:10] if first_date_val else 'start'
+                            last_date = str(last_date_val)[:10] if last_date_val else 'end'
+                            
+                            insights = [
+                                f"Trend: {'Increased' if change > 0 else 'Decreased' if change < 0 else 'Stable'} by {abs(change):,.0f} ({abs(change_pct):.1f}%) from {first_date} to {last_date}",
+                                f"Range: {float(values.min()):,.0f} to {float(values.max()):,.0f}",
+                                f"Average: {float(values.mean()):,.0f}"
+                            ]
+                        elif values is not None:
                             # Just numeric data
-                            values = []
-                            for r in results:
-                                try:
-                                    val = float(str(r.get(numeric_cols[0], 0) or 0).replace(',', ''))
-                                    values.append(val)
-                                except:
-                                    pass
-                            if values:
-                                insights = [
-                                    f"Analyzed {result_count} data points",
-                                    f"Range: {min(values):,.0f} to {max(values):,.0f}",
-                                    f"Average: {sum(values)/len(values):,.0f}"
-                                ]
-                            else:
-                                insights = [f"Query analyzed {result_count} records"]
+                            insights = [
+                                f"Analyzed {result_count} data points",
+                                f"Range: {float(values.min()):,.0f} to {float(values.max()):,.0f}",
+                                f"Average: {float(values.mean()):,.0f}"
+                            ]
                         else:
                             insights = [f"Query analyzed {result_count} records"]
                     except Exception as e:
@@ -815,94 +838,24 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
                 "tokens": tokens_used
             }
     
-    def process_query(
+    def select_visualization(
         self,
         question: str,
-        conversation_history: List[Dict] = None
+        sql_query: str,
+        results: List[Dict],
+        result_columns: List[str],
+        planned: Optional[Dict[str, Any]] = None,
+        allow_llm: bool = True,
+        profile: Optional[ResultProfile] = None
     ) -> Dict[str, Any]:
-        """Process a natural language query and return complete analysis"""
-        
-        total_tokens = 0  # Track total LLM tokens used
-        
-        try:
-            # Step 1: Generate SQL
-            sql_result = self.generate_sql(question, conversation_history)
-            sql_query = sql_result["sql"]
-            total_tokens += sql_result.get("tokens", 0)
-        except Exception as e:
-            return {
-                "success": False,
-                "error": f"SQL generation error: {str(e)}",
-                "sql_query": None,
-                "tokens": total_tokens
-            }
-        
-        # Step 2: Validate SQL
-        is_valid = validate_sql_query(sql_query)
-        if not is_valid:
-            # Try to fix SQL (simple retry with better prompt)
-            try:
-                sql_result = self.generate_sql(
-                    f"{question}. Make sure the SQL is valid PostgreSQL syntax.",
-                    conversation_history
-                )
-                sql_query = sql_result["sql"]
-                total_tokens += sql_result.get("tokens", 0)
-                is_valid = validate_sql_query(sql_query)
-            except:
-                pass
-        
-        if not is_valid:
-            return {
-                "success": False,
-                "error": "Could not generate valid SQL query",
-                "sql_query": sql_query,
-                "tokens": total_tokens
-            }
-        
-        # Step 3: Execute SQL
-        try:
-            results = execute_sql_query(sql_query)
-        except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "sql_query": sql_query,
-                "tokens": total_tokens
-            }
-        
-        # Step 4: Identify tables and columns
-        try:
-            table_column_info = self.identify_tables_columns(question, sql_query)
-            total_tokens += table_column_info.get("tokens", 0)
-            # Remove tokens from return value
-            table_column_info.pop("tokens", None)
-        except Exception as e:
-            print(f"Warning: Table/column identification failed: {e}")
-            table_column_info = {"tables": [], "columns": {}}
-        
-        # Step 5: Get column names from results
-        if not results:
-            return {
-                "success": True,
-                "sql_query": sql_query,
-                "results": [],
-                "tables": table_column_info.get("tables", []),
-                "columns": table_column_info.get("columns", {}),
-                "visualization": {
-                    "visualization_type": "none",
-                    "x_axis": None,
-                    "y_axis": None,
-                    "explanation": "No data returned from query"
-                },
-                "insights": ["Query executed successfully but returned no results"],
-                "explanation": "The query executed successfully but did not return any data. Please refine your question.",
-                "tokens": total_tokens
-            }
-        
-        result_columns = list(results[0].keys()) if results else []
-        
-        # Step 6: Recommend visualization
+        """Choose the visualization for a result set, using heuristics where possible
+        planned is a visualization already proposed by fused generation; it is used instead of
+        the LLM when its axes exist in the results. With allow_llm=False, heuristics are the fallback.
+        profile is built from results if not given.
+        Returns: {"visualization_type": str, ..., "tokens": int} (tokens only when the LLM was used)
+        """
+        profile = profile or ResultProfile(results)
+        time_columns = profile.time_columns
         # Skip LLM call for distribution/trend queries - use heuristics directly (saves tokens and time)
         try:
             query_lower = question.lower()
@@ -910,10 +863,7 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
                 ['distribution', 'percentage', 'proportion', 'share', 'breakdown'])
             is_trend_query = any(keyword in query_lower for keyword in 
                 ['trend', 'over time', 'by month', 'monthly'])
-            has_time_column = any(
-                'month' in col.lower() or 'date' in col.lower() or 'time' in col.lower()
-                for col in result_columns
-            ) if result_columns else False
+            has_time_column = bool(time_columns)
             
             # Direct assignment for common cases (saves tokens and time)
             # IMPORTANT: "department wise headcount" is a comparison, not distribution - use bar chart
@@ -935,12 +885,9 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
                 }
                 print("✓ Using bar chart (headcount comparison detected - skipped LLM)")
             elif (is_trend_query or has_time_column or 'MonthEnd' in sql_query) and result_columns and len(result_columns) >= 2:
-                date_col = next(
-                    (col for col in result_columns if 'month' in col.lower() or 'date' in col.lower() or 'time' in col.lower()),
-                    result_columns[0]
-                )
+                date_col = time_columns[0] if time_columns else result_columns[0]
                 value_col = next(
-                    (col for col in result_columns if col != date_col),
+                    (col for col in profile.measure_columns + result_columns if col != date_col),
                     result_columns[1] if len(result_columns) > 1 else result_columns[0]
                 )
                 viz_recommendation = {
@@ -951,11 +898,20 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
                 }
                 print("✓ Using line chart (trend query detected - skipped LLM)")
             else:
-                # Use LLM for other cases
+                # Use the fused plan or the LLM for other cases
                 try:
-                    viz_recommendation = self.recommend_visualization(sql_query, results, result_columns)
-                    total_tokens += viz_recommendation.get("tokens", 0)
-                    viz_recommendation.pop("tokens", None)
+                    if self._is_valid_plan(planned, result_columns):
+                        viz_recommendation = {
+                            "visualization_type": planned["visualization_type"],
+                            "x_axis": planned.get("x_axis"),
+                            "y_axis": planned.get("y_axis"),
+                            "explanation": planned.get("explanation") or "Visualization planned alongside the SQL query"
+                        }
+                        print("✓ Using planned visualization from fused generation - skipped LLM")
+                    elif allow_llm:
+                        viz_recommendation = self.recommend_visualization(sql_query, results, result_columns, profile)
+                    else:
+                        viz_recommendation = self.heuristic_visualization(question, results, result_columns, profile)
                     
                     # Override if needed
                     if is_distribution_query and result_columns and len(result_columns) >= 2:
@@ -982,7 +938,7 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
         except Exception as e:
             print(f"Warning: Visualization recommendation failed: {e}")
             # Fallback with time detection
-            has_time = 'MonthEnd' in sql_query or any('month' in col.lower() for col in result_columns) if result_columns else False
+            has_time = bool(result_columns) and ('MonthEnd' in sql_query or bool(time_columns))
             viz_recommendation = {
                 "visualization_type": "line" if (has_time and len(result_columns) >= 2) else ("table" if results else "none"),
                 "x_axis": result_columns[0] if result_columns and has_time else None,
@@ -990,9 +946,311 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
                 "explanation": "Line chart for time series" if has_time else "Visualization recommendation unavailable"
             }
         
+        return viz_recommendation
+    
+    @staticmethod
+    def _is_valid_plan(planned: Optional[Dict[str, Any]], result_columns: List[str]) -> bool:
+        """Check a planned visualization against the columns the SQL actually returned"""
+        if not planned or planned.get("visualization_type") not in ("bar", "line", "pie", "table", "scatter", "none"):
+            return False
+        if planned["visualization_type"] in ("table", "none"):
+            return True
+        return planned.get("x_axis") in result_columns and planned.get("y_axis") in result_columns
+    
+    @staticmethod
+    def _timed(func: Callable[..., Any], *args, **kwargs):
+        """Call func and return (result, elapsed milliseconds)"""
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        return result, round((time.perf_counter() - start) * 1000, 1)
+    
+    def process_query(
+        self,
+        question: str,
+        conversation_history: List[Dict] = None,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        pipeline_mode: Optional[str] = None,
+        execute_sql: Optional[Callable[[str], List[Dict[str, Any]]]] = None
+    ) -> Dict[str, Any]:
+        """Process a natural language query and return complete analysis
+        If on_event is given, it is called as on_event(stage, payload) as each stage completes
+        (sql, results, tables, visualization, insight_token, insights). sql is sent before each
+        execution attempt, so it repeats when the SQL is repaired.
+        pipeline_mode is "multi" (separate LLM calls per stage) or "fused" (one structured call
+        returns SQL, chart type and insight plan); defaults to settings.PIPELINE_MODE.
+        execute_sql replaces execute_sql_query, e.g. to share results of identical SQL in a batch.
+        The request runs against REQUEST_DEADLINE_SECONDS. Visualization and insights have their
+        own budgets; one that runs over is replaced by its heuristic / stats-only fallback and
+        listed in "degraded_stages".
+        """
+        
+        total_tokens = 0  # Track total LLM tokens used
+        llm_calls = 0  # Track LLM round trips
+        prompt_tokens_saved = 0  # Prompt tokens removed by schema linking
+        timings: Dict[str, float] = {}  # Per-stage latency in milliseconds
+        deadline = Deadline(settings.REQUEST_DEADLINE_SECONDS)
+        degraded_stages: List[str] = []  # Stages replaced by their fallback after overrunning
+        mode = (pipeline_mode or settings.PIPELINE_MODE).lower()
+        if mode not in ("multi", "fused"):
+            print(f"Warning: Unknown pipeline mode '{mode}', using 'multi'")
+            mode = "multi"
+        generate = self.generate_fused if mode == "fused" else self.generate_sql
+        plan: Dict[str, Any] = {}  # Visualization / insight plan from fused generation
+        
+        def emit(stage: str, payload: Dict[str, Any]):
+            if on_event:
+                on_event(stage, payload)
+        
+        # Step 1: Look up previously validated SQL for this question and context
+        history_text = self.format_history(conversation_history)
+        sql_source = "llm"
+        question_embedding = None
+        match = None  # Semantic cache hit
+        routed = intent_router.route(question) if settings.INTENT_ROUTER_ENABLED else None
+        sql_query = routed["sql"] if routed else sql_cache.get(question, history_text)
+        if routed:
+            sql_source = "intent_router"
+            print(f"✓ Using canonical SQL for intent '{routed['intent']}' - skipped LLM and validation")
+        elif sql_query is not None:
+            sql_source = "exact_cache"
+            print("✓ Using cached SQL (exact question match - skipped LLM and validation)")
+        elif settings.SEMANTIC_CACHE_ENABLED:
+            question_embedding = semantic_cache.embed(question)
+            match = semantic_cache.lookup(question, history_text, embedding=question_embedding) if question_embedding is not None else None
+            if match:
+                sql_query = match["sql"]
+                sql_source = "semantic_cache"
+                print(f"✓ Using cached SQL (similar to '{match['question']}', similarity {match['similarity']:.3f} - skipped LLM and validation)")
+        
+        # Steps 2 & 3: Generate SQL with the LLM if step 1 found none, then execute it. LLM-written
+        # SQL that fails - locally or in PostgreSQL - is repaired by sending the failing query and
+        # the exact error back to the LLM, then run again
+        validation_error = None
+        repair_attempts: List[Dict[str, Any]] = []
+        repair_failed = False
+        while True:
+            if sql_query is None:
+                try:
+                    # Generate SQL
+                    llm_calls += 1
+                    sql_result, timings["sql_generation"] = self._timed(generate, question, conversation_history)
+                    sql_query = sql_result["sql"]
+                    total_tokens += sql_result.get("tokens", 0)
+                    prompt_tokens_saved += (sql_result.get("schema_linking") or {}).get("prompt_tokens_saved", 0)
+                    plan = sql_result
+                except AdmissionRejected:
+                    # Overloaded: let the API answer 503 with Retry-After instead of an error result
+                    raise
+                except Exception as e:
+                    return {
+                        "success": False,
+                        "error": f"SQL generation error: {str(e)}",
+                        "sql_query": None,
+                        "tokens": total_tokens,
+                        "pipeline_mode": mode,
+                        "llm_calls": llm_calls
+                    }
+                
+                # Validate SQL locally (syntax, one read-only statement, known tables). PostgreSQL
+                # checks the rest when it runs the query, in the same round trip as execution
+                validation_error, timings["validation"] = self._timed(check_sql, sql_query)
+            
+            if validation_error is None:
+                # Sent before execution so streaming clients see the SQL early; repaired or
+                # regenerated SQL is sent again
+                emit("sql", {"sql_query": sql_query, "sql_source": sql_source})
+                try:
+                    results, timings["execution"] = self._timed(execute_sql or execute_sql_query, sql_query)
+                    break
+                except AdmissionRejected:
+                    raise
+                except SQLExecutionError as e:
+                    if sql_source != "llm":
+                        # Cached or routed SQL no longer runs (e.g. after a schema change): drop it
+                        # and ask the LLM
+                        print(f"Warning: {sql_source} SQL failed ({e.db_error}) - generating new SQL")
+                        if sql_source == "exact_cache":
+                            sql_cache.discard(question, history_text)
+                        elif sql_source == "semantic_cache":
+                            semantic_cache.discard(match["question"], history_text)
+                        else:
+                            intent_router.record_failure(routed["intent"])
+                        sql_source = "llm"
+                        sql_query = None
+                        continue
+                    validation_error = e.db_error
+                    if repair_attempts:
+                        repair_attempts[-1]["valid"] = False
+                except Exception as e:
+                    return {
+                        "success": False,
+                        "error": str(e),
+                        "sql_query": sql_query,
+                        "tokens": total_tokens,
+                        "pipeline_mode": mode,
+                        "llm_calls": llm_calls
+                    }
+            
+            if repair_failed or len(repair_attempts) >= settings.SQL_REPAIR_MAX_ATTEMPTS or deadline.expired():
+                if repair_attempts:
+                    timings["repair"] = round(sum(a["latency_ms"] for a in repair_attempts), 1)
+                return {
+                    "success": False,
+                    "error": f"Could not generate valid SQL query: {validation_error}",
+                    "sql_query": sql_query,
+                    "tokens": total_tokens,
+                    "pipeline_mode": mode,
+                    "llm_calls": llm_calls,
+                    "repair_attempts": repair_attempts
+                }
+            
+            attempt = {"attempt": len(repair_attempts) + 1, "error": validation_error}
+            repair_attempts.append(attempt)
+            start = time.perf_counter()
+            try:
+                llm_calls += 1
+                repair_result = self.repair_sql(question, sql_query, validation_error)
+                sql_query = repair_result["sql"]
+                total_tokens += repair_result.get("tokens", 0)
+                attempt["tokens"] = repair_result.get("tokens", 0)
+                validation_error = check_sql(sql_query)
+                attempt["valid"] = validation_error is None
+            except AdmissionRejected:
+                raise
+            except Exception as e:
+                print(f"Warning: {e}")
+                attempt["valid"] = False
+                repair_failed = True
+            finally:
+                attempt["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if repair_attempts:
+            timings["repair"] = round(sum(a["latency_ms"] for a in repair_attempts), 1)
+        
+        # The database returns one row past SQL_MAX_ROWS only when the result was cut off
+        row_limit_reached = 0 < settings.SQL_MAX_ROWS < len(results)
+        if row_limit_reached:
+            results = results[:settings.SQL_MAX_ROWS]
+        
+        if sql_source in ("llm", "semantic_cache"):
+            sql_cache.put(question, sql_query, history_text)
+        if sql_source == "llm" and question_embedding is not None:
+            semantic_cache.add(question, sql_query, history_text, embedding=question_embedding)
+        
+        emit("results", {"results": results, "row_count": len(results)})
+        
+        # Step 4: Identify tables and columns
+        try:
+            table_column_info, timings["table_identification"] = self._timed(
+                self.identify_tables_columns, question, sql_query
+            )
+            total_tokens += table_column_info.get("tokens", 0)
+            # Remove tokens from return value
+            table_column_info.pop("tokens", None)
+        except Exception as e:
+            print(f"Warning: Table/column identification failed: {e}")
+            table_column_info = {"tables": [], "columns": {}}
+        
+        emit("tables", table_column_info)
+        
+        # Step 5: Get column names from results
+        if not results:
+            return {
+                "success": True,
+                "sql_query": sql_query,
+                "results": [],
+                "tables": table_column_info.get("tables", []),
+                "columns": table_column_info.get("columns", {}),
+                "visualization": {
+                    "visualization_type": "none",
+                    "x_axis": None,
+                    "y_axis": None,
+                    "explanation": "No data returned from query"
+                },
+                "insights": ["Query executed successfully but returned no results"],
+                "explanation": "The query executed successfully but did not return any data. Please refine your question.",
+                "tokens": total_tokens,
+                "sql_source": sql_source,
+                "timings_ms": timings,
+                "pipeline_mode": mode,
+                "llm_calls": llm_calls,
+                "prompt_tokens_saved": prompt_tokens_saved,
+                "repair_attempts": repair_attempts,
+                "degraded_stages": degraded_stages
+            }
+        
+        result_columns = list(results[0].keys()) if results else []
+        # One pass over the results gives both stages the column types, roles and values they need
+        profile, timings["profiling"] = self._timed(ResultProfile, results)
+        
+        # Steps 6 & 7: Visualization and insights only depend on the SQL and results - run them concurrently
+        # Once the request deadline has passed, or while Ollama is failing, go straight to the fallbacks
+        use_llm = not deadline.expired() and not ollama_breaker.is_open()
+        if not use_llm:
+            degraded_stages.extend(["visualization", "insights"])
+        # Without LLM calls both stages are quick, so they are not given budgets
+        viz_deadline = deadline.stage(settings.VISUALIZATION_BUDGET_SECONDS) if use_llm else None
+        insights_deadline = deadline.stage(settings.INSIGHTS_BUDGET_SECONDS) if use_llm else None
+        insights_abandoned = threading.Event()
+        
+        def on_token(token: str):
+            # Insights are always streamed so an overrunning call can be stopped between chunks
+            if insights_abandoned.is_set():
+                raise TimeoutError("Insights budget exceeded")
+            emit("insight_token", {"token": token})
+        
+        # In fused mode the chart and insight focus were planned alongside the SQL, so the
+        # visualization stage never makes its own LLM call
+        # Each stage runs in a copy of this context so it keeps the request's priority class
+        viz_future = stage_executor.submit(
+            contextvars.copy_context().run, self._timed, self.select_visualization, question, sql_query, results, result_columns,
+            planned=plan.get("visualization"), allow_llm=(mode == "multi" and use_llm), profile=profile
+        )
+        insights_future = stage_executor.submit(
+            contextvars.copy_context().run, self._timed, self.generate_insights, sql_query, results,
+            on_token=on_token, insight_plan=plan.get("insight_plan"), use_llm=use_llm, profile=profile
+        )
+        
+        # Step 6: Recommend visualization
+        try:
+            try:
+                viz_recommendation, timings["visualization"] = viz_future.result(timeout=viz_deadline and viz_deadline.remaining())
+            except FutureTimeoutError:
+                # The LLM call keeps running until its HTTP timeout, but the response no longer waits for it
+                print(f"Warning: Visualization exceeded its {settings.VISUALIZATION_BUDGET_SECONDS:g}s budget, using heuristics")
+                degraded_stages.append("visualization")
+                viz_recommendation, timings["visualization"] = self._timed(
+                    self.select_visualization, question, sql_query, results, result_columns,
+                    planned=plan.get("visualization"), allow_llm=False, profile=profile
+                )
+            if viz_recommendation.get("tokens"):
+                llm_calls += 1
+            total_tokens += viz_recommendation.get("tokens", 0)
+            viz_recommendation.pop("tokens", None)
+        except Exception as e:
+            print(f"Warning: Visualization recommendation failed: {e}")
+            viz_recommendation = {
+                "visualization_type": "table",
+                "x_axis": None,
+                "y_axis": None,
+                "explanation": "Visualization recommendation unavailable"
+            }
+        
+        emit("visualization", viz_recommendation)
+        
         # Step 7: Generate insights
         try:
-            insights_data = self.generate_insights(sql_query, results)
+            try:
+                insights_data, timings["insights"] = insights_future.result(timeout=insights_deadline and insights_deadline.remaining())
+            except FutureTimeoutError:
+                # Stops the LLM stream at its next chunk, which frees the Ollama slot
+                insights_abandoned.set()
+                print(f"Warning: Insights exceeded their {settings.INSIGHTS_BUDGET_SECONDS:g}s budget, using stats-only insights")
+                degraded_stages.append("insights")
+                insights_data, timings["insights"] = self._timed(
+                    self.generate_insights, sql_query, results, use_llm=False, profile=profile
+                )
+            if insights_data.get("tokens"):
+                llm_calls += 1
             total_tokens += insights_data.get("tokens", 0)
             insights_data.pop("tokens", None)
         except Exception as e:
@@ -1002,6 +1260,11 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
                 "explanation": f"Query executed successfully. Retrieved {len(results)} records."
             }
         
+        emit("insights", {
+            "insights": insights_data.get("insights", []),
+            "explanation": insights_data.get("explanation", "")
+        })
+        
         return {
             "success": True,
             "sql_query": sql_query,
@@ -1011,7 +1274,15 @@ Use ACTUAL numbers from the data. Avoid generic statements."""
             "visualization": viz_recommendation,
             "insights": insights_data.get("insights", []),
             "explanation": insights_data.get("explanation", ""),
-            "tokens": total_tokens
+            "tokens": total_tokens,
+            "sql_source": sql_source,
+            "timings_ms": timings,
+            "pipeline_mode": mode,
+            "llm_calls": llm_calls,
+            "prompt_tokens_saved": prompt_tokens_saved,
+            "repair_attempts": repair_attempts,
+            "degraded_stages": degraded_stages,
+            "row_limit_reached": row_limit_reached
         }
 
 
@@ -0,0 +1,233 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.agent.result_profiler import ResultProfile, column_label as _label, has_word as _has_word
+
+
+# Words marking measures that cannot be summed across categories, so no share-of-total is reported
+NON_ADDITIVE_WORDS = r'(?:avg|average|mean|median|rate|ratio|pct|percent|percentage|score|rating|min|max|minimum|maximum|tenure|age)'
+OUTLIER_Z = 2.0
+
+
+def _fmt(value: float) -> str:
+    if abs(value) >= 100 or float(value).is_integer():
+        return f"{value:,.0f}"
+    return f"{value:,.2f}"
+
+
+def _pct(value: float) -> str:
+    return f"{value:+.1f}%"
+
+
+def topic_recommendations(column_names: List[str]) -> List[str]:
+    """General HR recommendations for the topic the result columns are about"""
+    column_text = " ".join(column_names).lower()
+    if 'headcount' in column_text or 'count' in column_text:
+        return ["Monitor headcount trends regularly", "Review department staffing levels", "Consider workforce planning based on trends"]
+    if 'salary' in column_text or 'compensation' in column_text:
+        return ["Review compensation equity across departments", "Consider market benchmarking", "Analyze salary trends for retention"]
+    if 'performance' in column_text or 'rating' in column_text:
+        return ["Identify high performers for recognition", "Develop improvement plans for low performers", "Review performance distribution"]
+    return ["Review the data regularly", "Use insights for strategic HR decisions", "Monitor trends over time"]
+
+
+def _with_recommendations(explanation: str, recommendations: List[str]) -> str:
+    return explanation + "\n\nACTIONABLE RECOMMENDATIONS:\n" + "\n".join(f"- {r}" for r in recommendations)
+
+
+class InsightEngine:
+    """Computes insights and explanation text for common result shapes without the LLM
+
+    Shapes: scalar (one row), categorical (one label column and numeric measures) and time
+    series (one time column and numeric measures). Anything else - several label columns,
+    multi-series trends, free text - returns None and is left to the LLM.
+    """
+
+    def __init__(self, max_categories: int):
+        self.max_categories = max_categories
+        self._lock = threading.Lock()
+        self.shape_counts: Dict[str, int] = {"scalar": 0, "categorical": 0, "time_series": 0, "unrecognized": 0}
+
+    def analyze(self, results: List[Dict[str, Any]], profile: Optional[ResultProfile] = None) -> Optional[Dict[str, Any]]:
+        """Describe a result set if its shape is recognized (profile is built if not given)
+        Returns: {"shape": str, "insights": [], "explanation": str} or None
+        """
+        profile = profile or ResultProfile(results)
+        shape, analysis = self._classify(profile)
+        with self._lock:
+            self.shape_counts[shape or "unrecognized"] += 1
+        if shape is None:
+            return None
+        try:
+            if shape == "scalar":
+                described = self._scalar(results[0], *analysis)
+            elif shape == "categorical":
+                described = self._categorical(results, profile, *analysis)
+            else:
+                described = self._time_series(results, profile, *analysis)
+        except Exception as e:
+            print(f"Warning: Insight engine failed on {shape} result: {e}")
+            return None
+        if described is None:
+            return None
+        insights, explanation = described
+        return {"shape": shape, "insights": insights, "explanation": explanation}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.shape_counts.values())
+            return {
+                "analyzed": total,
+                "shapes": dict(self.shape_counts),
+                "llm_skipped_rate": (total - self.shape_counts["unrecognized"]) / total if total else 0.0
+            }
+
+    def _classify(self, profile: ResultProfile) -> Tuple[Optional[str], tuple]:
+        """Pick the shape from the profile's time, measure and label columns"""
+        measures, time_cols, labels = profile.measure_columns, profile.time_columns, profile.label_columns
+        if not profile.row_count or not measures:
+            return None, ()
+        if profile.row_count == 1:
+            return "scalar", (measures, labels + time_cols)
+        if len(time_cols) == 1 and not labels:
+            return "time_series", (time_cols[0], measures)
+        if len(labels) == 1 and not time_cols and profile.row_count <= self.max_categories:
+            return "categorical", (labels[0], measures)
+        return None, ()
+
+    def _scalar(self, row: Dict[str, Any], measures: List[str], labels: List[str]) -> Optional[Tuple[List[str], str]]:
+        subject = ", ".join(str(row.get(col)) for col in labels if row.get(col) is not None)
+        parts = [f"{_label(col)} is {_fmt(float(row[col]))}" for col in measures if row.get(col) is not None]
+        if not parts:
+            # Every measure is NULL: nothing to describe
+            return None
+        insights = [part[0].upper() + part[1:] for part in parts]
+        if subject:
+            insights[0] = f"For {subject}, {parts[0]}"
+        explanation = (
+            f"This query returns a single summary row{f' for {subject}' if subject else ''}: "
+            + "; ".join(parts) + ". "
+            + "It describes the current state of this metric in the HR data."
+        )
+        return insights, _with_recommendations(explanation, topic_recommendations(list(row)))
+
+    def _categorical(
+        self, results: List[Dict[str, Any]], profile: ResultProfile, label_col: str, measures: List[str]
+    ) -> Tuple[List[str], str]:
+        measure = measures[0]
+        values = profile.values(measure, nulls_as_zero=True)
+        categories = [str(row.get(label_col)) for row in results]
+        n = len(values)
+        order = np.argsort(-values, kind="stable")
+        top, bottom = int(order[0]), int(order[-1])
+        measure_name, label_name = _label(measure), _label(label_col)
+        additive = not _has_word(measure, NON_ADDITIVE_WORDS) and bool((values >= 0).all())
+        total = float(values.sum())
+        mean = float(values.mean())
+
+        insights = []
+        if additive and total > 0:
+            shares = values / total * 100
+            insights.append(f"{categories[top]} has the highest {measure_name}: {_fmt(values[top])} ({shares[top]:.1f}% of {_fmt(total)})")
+            insights.append(f"{categories[bottom]} has the lowest {measure_name}: {_fmt(values[bottom])} ({shares[bottom]:.1f}%)")
+            if n >= 4:
+                k = min(3, n - 1)
+                insights.append(f"The top {k} of {n} {label_name} values account for {shares[order[:k]].sum():.1f}% of the total")
+        else:
+            insights.append(f"{categories[top]} ranks highest on {measure_name} at {_fmt(values[top])}")
+            insights.append(f"{categories[bottom]} ranks lowest at {_fmt(values[bottom])}")
+            insights.append(f"Average {measure_name} across {n} {label_name} values is {_fmt(mean)}")
+        if n == 2 and values[bottom] > 0:
+            insights.append(f"{categories[top]} is {values[top] / values[bottom]:.2f}x {categories[bottom]} (a gap of {_fmt(values[top] - values[bottom])})")
+        insights.extend(self._outliers(values, categories, measure_name))
+
+        spread = float(values.std() / mean * 100) if mean else 0.0
+        explanation = f"This query compares {measure_name} across {n} {label_name} values. "
+        if additive and total > 0:
+            explanation += (f"{categories[top]} leads with {_fmt(values[top])}, {values[top] / total * 100:.1f}% of the "
+                            f"total {_fmt(total)}, while {categories[bottom]} has the least with {_fmt(values[bottom])}. ")
+        else:
+            explanation += (f"Values range from {_fmt(values[bottom])} ({categories[bottom]}) to "
+                            f"{_fmt(values[top])} ({categories[top]}), with an average of {_fmt(mean)}. ")
+        explanation += "The chart shows how the categories compare."
+        patterns = (
+            f"Values are {'fairly even' if spread < 15 else 'moderately spread' if spread < 50 else 'highly uneven'} "
+            f"across {label_name} (coefficient of variation {spread:.0f}%)."
+        )
+        if len(measures) > 1:
+            others = ", ".join(_label(m) for m in measures[1:])
+            patterns += f" The result also includes {others}."
+        recommendations = [f"Look into what drives {measure_name} for {categories[top]} and {categories[bottom]}"]
+        recommendations += topic_recommendations(profile.column_names)[:2]
+        return insights, _with_recommendations(f"{explanation}\n\nNOTABLE PATTERNS & TRENDS:\n{patterns}", recommendations)
+
+    def _time_series(
+        self, results: List[Dict[str, Any]], profile: ResultProfile, time_col: str, measures: List[str]
+    ) -> Tuple[List[str], str]:
+        # Put periods in ascending order; dates and years sort naturally, other labels (e.g.
+        # month names) keep the query's order
+        time_column = profile.columns[time_col]
+        order = np.arange(profile.row_count)
+        if time_column.monotonic == "decreasing":
+            order = order[::-1]
+        elif time_column.monotonic is None and time_column.dtype in ("datetime", "numeric") and not time_column.null_count:
+            order = np.array(sorted(order, key=lambda i: results[i][time_col]))
+        measure = measures[0]
+        values = profile.values(measure, nulls_as_zero=True)[order]
+        periods = [str(results[i].get(time_col))[:10] for i in order]
+        n = len(values)
+        measure_name = _label(measure)
+
+        slope = float(np.polyfit(np.arange(n), values, 1)[0]) if n >= 2 else 0.0
+        first, last = values[0], values[-1]
+        change = last - first
+        change_pct = change / first * 100 if first else 0.0
+        peak, low = int(values.argmax()), int(values.argmin())
+        direction = "increased" if change > 0 else "decreased" if change < 0 else "stayed flat"
+
+        insights = [
+            f"{measure_name[0].upper() + measure_name[1:]} {direction} from {_fmt(first)} to {_fmt(last)} "
+            f"({_pct(change_pct)}) between {periods[0]} and {periods[-1]}",
+            f"Trend: {'+' if slope >= 0 else '-'}{_fmt(abs(slope))} per period on average",
+        ]
+        if n >= 2:
+            previous = values[-2]
+            pop = last - previous
+            pop_text = f" ({_pct(pop / previous * 100)})" if previous else ""
+            insights.append(f"Latest period ({periods[-1]}) changed by {'+' if pop >= 0 else '-'}{_fmt(abs(pop))}{pop_text} from {periods[-2]}")
+        insights.append(f"Peak: {_fmt(values[peak])} in {periods[peak]}; low: {_fmt(values[low])} in {periods[low]}")
+        if n >= 6:
+            # Outliers against the fitted trend, so a steady rise is not flagged
+            fitted = np.polyval(np.polyfit(np.arange(n), values, 1), np.arange(n))
+            insights.extend(self._outliers(values - fitted, periods, f"{measure_name} vs trend", values))
+
+        explanation = (
+            f"This query tracks {measure_name} over {n} periods from {periods[0]} to {periods[-1]}. "
+            f"Overall it {direction} from {_fmt(first)} to {_fmt(last)} ({_pct(change_pct)}), "
+            f"a fitted trend of {_fmt(slope)} per period. The line chart shows the movement over time."
+        )
+        mean = float(values.mean())
+        volatility = float(np.abs(np.diff(values)).mean() / mean * 100) if n >= 2 and mean else 0.0
+        patterns = (
+            f"The highest value was {_fmt(values[peak])} in {periods[peak]} and the lowest {_fmt(values[low])} in {periods[low]}. "
+            f"Period-over-period changes average {volatility:.1f}% of the mean level."
+        )
+        recommendations = [f"Review what changed around {periods[peak]} and {periods[low]}, the peak and low of {measure_name}"]
+        recommendations += topic_recommendations(profile.column_names)[:2]
+        return insights, _with_recommendations(f"{explanation}\n\nNOTABLE PATTERNS & TRENDS:\n{patterns}", recommendations)
+
+    @staticmethod
+    def _outliers(scores: np.ndarray, names: List[str], measure_name: str, shown: Optional[np.ndarray] = None) -> List[str]:
+        """Items more than OUTLIER_Z standard deviations from the mean of scores"""
+        if len(scores) < 5 or not scores.std():
+            return []
+        z = (scores - scores.mean()) / scores.std()
+        shown = scores if shown is None else shown
+        return [
+            f"{names[i]} is an outlier on {measure_name} ({_fmt(shown[i])}, {z[i]:+.1f} std)"
+            for i in np.flatnonzero(np.abs(z) >= OUTLIER_Z)[:2]
+        ]
+
+
+insight_engine = InsightEngine(max_categories=settings.INSIGHT_ENGINE_MAX_CATEGORIES)
@@ -0,0 +1,289 @@
+import re
+import threading
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+from app.services.sql_cache import normalize_question
+
+
+# Canonical HR questions answered directly from SQL templates (see TABLE_SELECTION_GUIDELINES).
+# A question is routed only if every word is accounted for by a known measure, dimension,
+# slot or filler word - anything else (top N, lists, thresholds, percentages, joins) goes to the LLM.
+
+# name -> (pattern, SQL expression, column alias, source table)
+SNAPSHOT_MEASURES = {
+    "avg_salary": (r'\b(?:average|avg|mean) (?:salary|salaries|pay|compensation)\b', 'AVG("Salary")', "avg_salary", "employee_master"),
+    "total_salary": (r'\b(?:total (?:salary|salaries|compensation|payroll)(?: cost)?|payroll(?: cost)?)\b', 'SUM("Salary")', "total_compensation", "employee_master"),
+    "max_salary": (r'\b(?:highest|maximum|max|top) salary\b', 'MAX("Salary")', "max_salary", "employee_master"),
+    "min_salary": (r'\b(?:lowest|minimum|min) salary\b', 'MIN("Salary")', "min_salary", "employee_master"),
+    "avg_rating": (r'\b(?:average|avg|mean) (?:performance )?rating\b', 'AVG("PerformanceRating")', "avg_rating", "employee_master"),
+    "avg_attrition": (r'\b(?:average |avg |mean )?attrition(?: rate)?\b', 'AVG("AttritionRate")', "avg_attrition", "headcount_attrition_summary"),
+    "headcount": (r'\b(?:headcount|head count|how many employees|number of employees|employee count|count of employees|count)\b', 'COUNT(*)', "headcount", "employee_master"),
+}
+
+# name -> (pattern, SQL expression, column alias) on headcount_attrition_summary
+TREND_MEASURES = {
+    "attrition": (r'\b(?:average |avg )?attrition(?: rates?)?\b', 'AVG("AttritionRate")', "avg_attrition"),
+    "hires": (r'\b(?:hiring|hires|new hires)\b', 'SUM("Hires")', "total_hires"),
+    "terminations": (r'\b(?:terminations?|separations?)\b', 'SUM("Terminations")', "total_terminations"),
+    "headcount": (r'\b(?:headcount|head count|employee count|number of employees)\b', 'SUM("Headcount")', "total_headcount"),
+}
+
+DIMENSIONS = {
+    "Department": r'\b(?:departments?|depts?|department[- ]?wise|dept[- ]?wise)\b',
+    "Gender": r'\bgenders?\b',
+    "JobTitle": r'\b(?:job ?titles?|titles?|roles?)\b',
+    "Status": r'\b(?:employment )?status(?:es)?\b',
+}
+
+TREND_PATTERN = r'\b(?:trends?|over time|monthly|by month|per month|each month|month over month|month by month|historical|history)\b'
+COMPARISON_PATTERN = r'\b(?:comparison|compare|ranked|ranking)\b'
+# Words implying a count when no other measure is mentioned
+COUNT_HINT_PATTERN = r'\b(?:distribution|breakdown|split|employees|staff|workforce)\b'
+
+FILLER_WORDS = {
+    "show", "me", "what", "whats", "is", "are", "the", "of", "employees", "employee", "by", "wise",
+    "for", "each", "every", "per", "across", "in", "all", "give", "get", "current", "currently",
+    "total", "how", "many", "breakdown", "distribution", "split", "please", "can", "you", "tell",
+    "a", "an", "do", "we", "have", "our", "rate", "display", "see", "view", "and", "overall",
+    "company", "staff", "workforce", "s", "data", "chart", "plot", "graph", "number", "count",
+    "there", "currently", "active", "at", "on"
+}
+
+NON_NAME_WORDS = {"each", "every", "all", "the", "per", "by", "a", "an", "our", "this", "that", "which", "what"}
+
+DEPARTMENT_SLOT_PATTERN = r'\b(?:in|for|of|within|from) (?:the )?([a-z][a-z&\-]*(?: [a-z&\-]+)?) (?:department|dept|team)\b'
+
+DATE_RANGE_PATTERNS = [
+    # between 2022 and 2023 / from 2022 to 2023
+    (r'\b(?:between|from) (\d{4}) (?:and|to|through|-) (\d{4})\b',
+     lambda m: (f"{m.group(1)}-01-01", f"{int(m.group(2)) + 1}-01-01")),
+    # since 2022 / from 2022
+    (r'\b(?:since|from) (\d{4})\b',
+     lambda m: (f"{m.group(1)}-01-01", None)),
+    # after 2022
+    (r'\bafter (\d{4})\b',
+     lambda m: (f"{int(m.group(1)) + 1}-01-01", None)),
+    # in 2023 / during 2023 / for 2023
+    (r'\b(?:in|during|for) (\d{4})\b',
+     lambda m: (f"{m.group(1)}-01-01", f"{int(m.group(1)) + 1}-01-01")),
+]
+RELATIVE_RANGE_PATTERN = r'\b(?:(?:over|in|during|for) )?(?:the )?(?:last|past|previous) (\d+ )?(months?|years?)\b'
+# "across all departments" asks for one company-wide figure, not a per-department breakdown
+OVERALL_PATTERN = r'\b(?:across|for|in|over) (?:all|the whole|the entire) (?:departments|depts|company|organization)\b'
+
+
+class IntentRouter:
+    """Rule-based router mapping canonical HR questions to SQL without calling the LLM
+
+    department_names returns the known lower-case Department values (None if unknown). A
+    department slot ("for the Sales department") is only routed when it names one of them;
+    anything else ("the largest department", "my team") goes to the LLM.
+    """
+
+    def __init__(self, department_names: Optional[Callable[[], Optional[FrozenSet[str]]]] = None):
+        self.department_names = department_names
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.unmatched = 0
+        self.intent_counts: Dict[str, int] = {}
+        self.failure_counts: Dict[str, int] = {}  # Routed SQL the database rejected, by intent
+
+    def route(self, question: str) -> Optional[Dict[str, Any]]:
+        """Match a question against the canonical intents
+        Returns: {"intent": str, "sql": str, "slots": dict} or None if the LLM should handle it
+        """
+        match = self._match(normalize_question(question).replace("'", ""))
+        with self._lock:
+            if match:
+                self.routed += 1
+                self.intent_counts[match["intent"]] = self.intent_counts.get(match["intent"], 0) + 1
+            else:
+                self.unmatched += 1
+        return match
+
+    def record_failure(self, intent: str):
+        """Count routed SQL that failed to execute (the question then goes to the LLM)"""
+        with self._lock:
+            self.failure_counts[intent] = self.failure_counts.get(intent, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.routed + self.unmatched
+            return {
+                "routed": self.routed,
+                "unmatched": self.unmatched,
+                "route_rate": self.routed / total if total else 0.0,
+                "intents": dict(self.intent_counts),
+                "failures": dict(self.failure_counts)
+            }
+
+    def _match(self, text: str) -> Optional[Dict[str, Any]]:
+        text = re.sub(r'[^\w\s&\-]', ' ', text)
+        text = re.sub(r'\s+', ' ', text).strip()
+        slots: Dict[str, Any] = {}
+
+        # Slot: department filter ("for the Sales department")
+        dept_match = re.search(DEPARTMENT_SLOT_PATTERN, text)
+        if dept_match and dept_match.group(1).split()[0] not in NON_NAME_WORDS:
+            known = self.department_names() if self.department_names else None
+            if not known or dept_match.group(1) not in known:
+                return None
+            slots["department"] = dept_match.group(1)
+            text = self._consume(text, dept_match.span())
+
+        # Slot: date range on MonthEnd
+        date_range = None
+        for pattern, to_range in DATE_RANGE_PATTERNS:
+            m = re.search(pattern, text)
+            if m:
+                date_range = to_range(m)
+                text = self._consume(text, m.span())
+                break
+        if date_range is None:
+            m = re.search(RELATIVE_RANGE_PATTERN, text)
+            if m:
+                amount = int(m.group(1)) if m.group(1) else 1
+                unit = m.group(2).rstrip("s")
+                date_range = (f"CURRENT_DATE - INTERVAL '{amount} {unit}{'s' if amount > 1 else ''}'", None)
+                text = self._consume(text, m.span())
+        if date_range:
+            slots["date_range"] = date_range
+
+        mentions_headcount = "headcount" in text or "head count" in text
+        # Markers can appear more than once ("monthly hiring trends over time")
+        _, text = self._take_all(text, OVERALL_PATTERN)
+        is_trend, text = self._take_all(text, TREND_PATTERN)
+        is_comparison, text = self._take_all(text, COMPARISON_PATTERN)
+
+        if is_trend:
+            measure_name = None
+            for name, (pattern, _, _) in TREND_MEASURES.items():
+                found, text = self._take(text, pattern)
+                if found:
+                    measure_name = name
+                    break
+            if measure_name is None:
+                return None
+        else:
+            if date_range:
+                # Date ranges are only unambiguous on the monthly summary table
+                return None
+            measure_name = None
+            for name, (pattern, _, _, _) in SNAPSHOT_MEASURES.items():
+                found, text = self._take(text, pattern)
+                if found:
+                    measure_name = name
+                    break
+
+        dimensions = []
+        for column, pattern in DIMENSIONS.items():
+            found, text = self._take(text, pattern)
+            if found:
+                dimensions.append(column)
+
+        if not is_trend and measure_name is None:
+            has_count_hint = re.search(COUNT_HINT_PATTERN, text)
+            if not (dimensions and has_count_hint):
+                return None
+            measure_name = "headcount"
+
+        # Every remaining word must be filler, otherwise the question needs the LLM
+        leftover = [word for word in text.split() if word not in FILLER_WORDS]
+        if leftover:
+            return None
+
+        if is_trend:
+            return self._build_trend(measure_name, dimensions, slots)
+        return self._build_snapshot(measure_name, dimensions, slots, is_comparison, mentions_headcount)
+
+    def _build_snapshot(
+        self,
+        measure_name: str,
+        dimensions: List[str],
+        slots: Dict[str, Any],
+        order_desc: bool,
+        mentions_headcount: bool
+    ) -> Optional[Dict[str, Any]]:
+        _, expression, alias, table = SNAPSHOT_MEASURES[measure_name]
+        if len(dimensions) > 2:
+            return None
+        if table == "headcount_attrition_summary" and any(d != "Department" for d in dimensions):
+            return None
+
+        if measure_name == "headcount":
+            # Name the count column after the user's wording
+            if dimensions or slots.get("department"):
+                alias = "headcount" if mentions_headcount or dimensions == ["Department"] else "count"
+            else:
+                alias = "total_headcount" if mentions_headcount else "total_employees"
+
+        where = []
+        if table == "employee_master" and "Status" not in dimensions:
+            where.append('"Status" = \'Active\'')
+        if slots.get("department"):
+            where.append(self._department_filter(slots["department"]))
+
+        select = [f'"{d}"' for d in dimensions] + [f"{expression} AS {alias}"]
+        sql = f"SELECT {', '.join(select)} FROM employees.{table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if dimensions:
+            sql += " GROUP BY " + ", ".join(f'"{d}"' for d in dimensions)
+            if order_desc:
+                sql += f" ORDER BY {alias} DESC"
+
+        intent = f"{measure_name}_by_{'_'.join(d.lower() for d in dimensions)}" if dimensions else measure_name
+        return {"intent": intent, "sql": sql, "slots": slots}
+
+    def _build_trend(self, measure_name: str, dimensions: List[str], slots: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        _, expression, alias = TREND_MEASURES[measure_name]
+        if any(d != "Department" for d in dimensions):
+            return None
+
+        group = ['"MonthEnd"'] + [f'"{d}"' for d in dimensions]
+        where = []
+        if slots.get("department"):
+            where.append(self._department_filter(slots["department"]))
+        if slots.get("date_range"):
+            start, end = slots["date_range"]
+            where.append(f'"MonthEnd" >= {self._date_literal(start)}')
+            if end:
+                where.append(f'"MonthEnd" < {self._date_literal(end)}')
+
+        sql = f"SELECT {', '.join(group)}, {expression} AS {alias} FROM employees.headcount_attrition_summary"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" GROUP BY {', '.join(group)} ORDER BY {', '.join(group)}"
+
+        intent = f"{measure_name}_trend" + ("_by_department" if dimensions else "")
+        return {"intent": intent, "sql": sql, "slots": slots}
+
+    @staticmethod
+    def _department_filter(department: str) -> str:
+        # Slot text is restricted to [a-z &-] by the pattern and is a known Department value, so it
+        # is safe to inline
+        return f'LOWER("Department") = \'{department}\''
+
+    @staticmethod
+    def _date_literal(value: str) -> str:
+        return value if value.startswith("CURRENT_DATE") else f"DATE '{value}'"
+
+    @staticmethod
+    def _take(text: str, pattern: str) -> Tuple[bool, str]:
+        """Remove the first match of pattern from text. Returns (matched, remaining text)"""
+        m = re.search(pattern, text)
+        if not m:
+            return False, text
+        return True, IntentRouter._consume(text, m.span())
+
+    @staticmethod
+    def _take_all(text: str, pattern: str) -> Tuple[bool, str]:
+        """Remove every match of pattern from text. Returns (matched, remaining text)"""
+        remaining, count = re.subn(pattern, " ", text)
+        return count > 0, re.sub(r'\s+', ' ', remaining).strip()
+
+    @staticmethod
+    def _consume(text: str, span: Tuple[int, int]) -> str:
+        return re.sub(r'\s+', ' ', f"{text[:span[0]]} {text[span[1]:]}").strip()
+
+
+intent_router = IntentRouter()
@@ -1,3 +1,6 @@
+# Hand-written schema description. The column lists the prompts use come from the live
+# database (see schema_catalog); this text supplies the notes around them, and is used as
+# is until the live schema has been loaded.
 HR_DATABASE_SCHEMA = """
 Database Schema for HR Analytics:
 
@@ -157,15 +160,7 @@ TABLE_SELECTION_GUIDELINES = """
    - employee_master e1 JOIN employee_master e2 ON e1."ManagerID" = e2."EmployeeID" (for manager relationships)
 """
 
-SQL_GENERATION_PROMPT = f"""
-You are an expert SQL query generator for HR analytics. Your task is to convert natural language questions into accurate PostgreSQL SQL queries.
-
-{HR_DATABASE_SCHEMA}
-
-{TABLE_SELECTION_GUIDELINES}
-
-Important Rules:
-1. Always use the schema prefix "employees." before table names
+SQL_GENERATION_RULES = """1. Always use the schema prefix "employees." before table names
 2. Use double quotes for ALL column names (e.g., "EmployeeID", "FullName", "Department")
 3. For date comparisons, use proper date functions (DATE(), EXTRACT(), etc.)
 4. For aggregations, use appropriate functions (COUNT, SUM, AVG, MAX, MIN)
@@ -175,15 +170,9 @@ Important Rules:
    - When joining employee-related tables, use: table."EmployeeID" = employee_master."EmployeeID"
    - Use INNER JOIN for required relationships, LEFT JOIN for optional
    - For headcount_attrition_summary, join on Department: headcount_attrition_summary."Department" = employee_master."Department"
-   - For self-referential (ManagerID), use: employee_master e1 JOIN employee_master e2 ON e1."ManagerID" = e2."EmployeeID"
-8. Return only the SQL query, no explanations, no markdown code blocks
-
-Conversation History:
-{{conversation_history}}
+   - For self-referential (ManagerID), use: employee_master e1 JOIN employee_master e2 ON e1."ManagerID" = e2."EmployeeID\""""
 
-User Question: {{question}}
-
-CRITICAL: Analyze the question type first:
+QUESTION_ANALYSIS_CHECKLIST = """CRITICAL: Analyze the question type first:
 - Does question mention "trends", "over time", "monthly", "by month"? → Use headcount_attrition_summary with "MonthEnd" column, GROUP BY "MonthEnd", ORDER BY "MonthEnd"
 - Is this asking for CURRENT headcount? → Use employee_master
 - Is this asking for HISTORICAL/TREND headcount? → Use headcount_attrition_summary with "MonthEnd"
@@ -194,36 +183,116 @@ CRITICAL: Analyze the question type first:
 - Does this need skills? → JOIN skills_inventory
 - Does this need training? → JOIN training_records
 
-REMEMBER: For time-based queries, ALWAYS use "MonthEnd" column and GROUP BY "MonthEnd", not Department!
+REMEMBER: For time-based queries, ALWAYS use "MonthEnd" column and GROUP BY "MonthEnd", not Department!"""
+
+# Prompts are split into a static system message and a per-request user message. The
+# system message comes first and does not depend on the question or conversation history,
+# so consecutive requests share a byte-identical prefix and Ollama can reuse its KV cache.
+
+# SQL generation system prompt with the schema, guidelines and checklist left as slots, so
+# the schema linker can fill them with only the tables relevant to a question. The
+# question-independent rules come before the schema to keep the shared prefix long.
+SQL_GENERATION_SYSTEM_TEMPLATE = """
+You are an expert SQL query generator for HR analytics. Your task is to convert natural language questions into accurate PostgreSQL SQL queries.
+
+Important Rules:
+{rules}
+8. Return only the SQL query, no explanations, no markdown code blocks
+
+{schema}
 
-Generate a PostgreSQL SQL query to answer this question. Return ONLY the SQL query without any markdown formatting or explanations.
+{guidelines}
+
+{checklist}
 """
 
-TABLE_COLUMN_IDENTIFICATION_PROMPT = f"""
-Based on the following question and SQL query, identify which tables and columns are being used.
+SQL_GENERATION_SYSTEM_PROMPT = SQL_GENERATION_SYSTEM_TEMPLATE.format(
+    rules=SQL_GENERATION_RULES,
+    schema=HR_DATABASE_SCHEMA,
+    guidelines=TABLE_SELECTION_GUIDELINES,
+    checklist=QUESTION_ANALYSIS_CHECKLIST
+)
 
-{HR_DATABASE_SCHEMA}
+SQL_GENERATION_USER_PROMPT = """Conversation History:
+{conversation_history}
 
-Question: {{question}}
-SQL Query: {{sql_query}}
+User Question: {question}
 
-Return a JSON object with:
-{{
-  "tables": ["table1", "table2"],
-  "columns": {{
-    "table1": ["column1", "column2"],
-    "table2": ["column3"]
-  }}
-}}
+Generate a PostgreSQL SQL query to answer this question. Return ONLY the SQL query without any markdown formatting or explanations."""
+
+# Error-guided repair: the failing SQL and the exact database error, with a compact column list
+SQL_REPAIR_SYSTEM_TEMPLATE = """
+You fix PostgreSQL queries for an HR analytics database. You are given a question, the SQL that was generated for it and the error PostgreSQL reported. Correct only what the error points at and keep the query's intent.
+
+Rules:
+{rules}
+
+Tables and columns (schema "employees"):
+{schema}
+
+Return only the corrected SQL query, no explanations, no markdown code blocks.
 """
 
-VISUALIZATION_RECOMMENDATION_PROMPT = """
-Based on the SQL query results, recommend the best visualization type.
+SQL_REPAIR_USER_PROMPT = """Question: {question}
 
-Query: {query}
-Result Count: {result_count}
-Result Columns: {columns}
-Sample Data: {sample_data}
+Failing SQL:
+{sql_query}
+
+PostgreSQL error:
+{error}
+
+Return ONLY the corrected SQL query."""
+
+# Single-call "fused" mode: SQL and the intended chart are planned together in one JSON response
+FUSED_GENERATION_SYSTEM_TEMPLATE = """
+You are an expert HR analytics assistant. Convert the natural language question into an accurate PostgreSQL SQL query and plan how to present the result.
+
+Important Rules:
+{rules}
+
+Visualization Rules:
+- "distribution", "percentage", "proportion", "share" → "pie"
+- "trends", "over time", "monthly" (date column such as "MonthEnd") → "line"
+- comparison "by department/gender/etc" → "bar"
+- lists or many columns → "table"
+- single value → "none"
+- x_axis and y_axis must be column names (or aliases) returned by your SQL
+
+{schema}
+
+{guidelines}
+
+{checklist}
+
+Return ONLY a JSON object, no markdown:
+{{{{
+  "sql": "SELECT ...",
+  "visualization": {{{{
+    "visualization_type": "bar|line|pie|table|scatter|none",
+    "x_axis": "column_name",
+    "y_axis": "column_name",
+    "explanation": "why this visualization"
+  }}}},
+  "insight_plan": "one sentence on what the insights should focus on"
+}}}}
+"""
+
+FUSED_GENERATION_SYSTEM_PROMPT = FUSED_GENERATION_SYSTEM_TEMPLATE.format(
+    rules=SQL_GENERATION_RULES,
+    schema=HR_DATABASE_SCHEMA,
+    guidelines=TABLE_SELECTION_GUIDELINES,
+    checklist=QUESTION_ANALYSIS_CHECKLIST
+)
+
+FUSED_GENERATION_USER_PROMPT = """Conversation History:
+{conversation_history}
+
+User Question: {question}
+
+Return ONLY the JSON object."""
+
+VISUALIZATION_RECOMMENDATION_SYSTEM_PROMPT = """
+Based on the SQL query results, recommend the best visualization type.
 
 CRITICAL RULES (in priority order):
 1. If query contains "distribution", "percentage", "proportion", "share" → Use PIE chart
@@ -256,6 +325,33 @@ IMPORTANT:
 - "by department/gender/etc" comparison → Use "bar" chart
 """
 
+VISUALIZATION_RECOMMENDATION_USER_PROMPT = """Query: {query}
+Result Count: {result_count}
+Result Columns: {columns}
+Sample Data: {sample_data}"""
+
+INSIGHTS_SYSTEM_PROMPT = """Analyze this HR query and provide insights.
+
+Provide ALL sections:
+
+INSIGHTS:
+- [Specific insight with numbers from data]
+- [Another insight with numbers]
+- [Third insight]
+
+EXPLANATION:
+[3-4 sentences explaining what data shows, what it means for HR, reference specific numbers]
+
+NOTABLE PATTERNS & TRENDS:
+[2-3 sentences on patterns, trends, anomalies with numbers]
+
+ACTIONABLE RECOMMENDATIONS:
+- [Recommendation 1]
+- [Recommendation 2]
+- [Recommendation 3]
+
+Use ACTUAL numbers from the data. Avoid generic statements."""
+
 INSIGHTS_GENERATION_PROMPT = """
 You are an HR analytics expert. Your task is to analyze query results and provide comprehensive, data-driven insights.
 
@@ -0,0 +1,196 @@
+import re
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+
+# Words in a column name (see column_label) that mark time; date/datetime values also count
+TIME_WORDS = r'(?:month|months|date|year|years|quarter|period|week|day|time|timestamp)'
+# Leading words that mark an aggregate, so avg_tenure_years is a measure, not a time column
+MEASURE_PREFIXES = r'(?:avg|average|mean|median|total|sum|count|num|number|min|max|pct|percent)'
+# Distinct values tracked per column before cardinality is reported as a lower bound
+MAX_TRACKED_DISTINCT = 1000
+
+
+def column_label(column: str) -> str:
+    """Readable column name: employee_count -> employee count, AvgSalary -> avg salary"""
+    spaced = re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', column).replace('_', ' ')
+    return spaced.strip().lower()
+
+
+def has_word(column: str, pattern: str) -> bool:
+    """True if any word of the column's label fully matches the pattern"""
+    return any(re.fullmatch(pattern, word) for word in column_label(column).split())
+
+
+def _is_time_column(name: str, dtype: str, values: Optional[np.ndarray]) -> bool:
+    """Date values, or a time word in the name without an aggregate prefix (avg_tenure_years).
+    Numbers also need a name made only of time words (year, month) or values that look like years.
+    """
+    if dtype == "datetime":
+        return True
+    words = column_label(name).split()
+    if dtype == "empty" or not words or re.fullmatch(MEASURE_PREFIXES, words[0]):
+        return False
+    if dtype != "numeric":
+        return has_word(name, TIME_WORDS)
+    if all(re.fullmatch(TIME_WORDS, word) for word in words):
+        return True
+    return has_word(name, TIME_WORDS) and _looks_like_years(values)
+
+
+def _looks_like_years(values: np.ndarray) -> bool:
+    """All non-null values are whole numbers in a plausible year range"""
+    values = values[~np.isnan(values)]
+    return bool(len(values)) and bool(((values % 1 == 0) & (values >= 1900) & (values <= 2100)).all())
+
+
+def _kind(value: Any) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if hasattr(value, "isoformat"):
+        return "datetime"
+    if isinstance(value, (int, float)) or hasattr(value, "__float__"):
+        return "numeric"
+    return "text"
+
+
+class ColumnProfile:
+    """Type and summary statistics of one result column
+
+    dtype: numeric, datetime, boolean, text, mixed or empty (all nulls)
+    role: time (datetime values or a time-like name), measure (numeric, not an ID) or label
+    monotonic: "increasing" / "decreasing" if non-null values never go down / up in row order
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.dtype = "empty"
+        self.role = "label"
+        self.null_count = 0
+        self.cardinality = 0
+        self.cardinality_capped = False
+        self.min: Any = None
+        self.max: Any = None
+        self.monotonic: Optional[str] = None
+        self.values: Optional[np.ndarray] = None  # floats with NaN for nulls (numeric columns only)
+
+    @property
+    def is_time(self) -> bool:
+        return self.role == "time"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "dtype": self.dtype,
+            "role": self.role,
+            "null_count": self.null_count,
+            "cardinality": self.cardinality,
+            "cardinality_capped": self.cardinality_capped,
+            "min": self.min,
+            "max": self.max,
+            "monotonic": self.monotonic
+        }
+
+
+class ResultProfile:
+    """Column profiles for a result set, built in a single pass over the rows
+
+    Built once per request and shared by the visualization and insight stages, so they do not
+    rescan the results or re-convert values themselves.
+    """
+
+    def __init__(self, results: List[Dict[str, Any]]):
+        self.row_count = len(results)
+        self.column_names: List[str] = list(results[0].keys()) if results else []
+        self.columns: Dict[str, ColumnProfile] = {}
+
+        names = self.column_names
+        kinds = {name: set() for name in names}
+        distinct = {name: set() for name in names}
+        nulls = dict.fromkeys(names, 0)
+        numbers = {name: [] for name in names}
+        minimum: Dict[str, Any] = dict.fromkeys(names)
+        maximum: Dict[str, Any] = dict.fromkeys(names)
+        previous: Dict[str, Any] = dict.fromkeys(names)
+        increasing = dict.fromkeys(names, True)
+        decreasing = dict.fromkeys(names, True)
+        comparable = dict.fromkeys(names, True)
+
+        for row in results:
+            for name in names:
+                value = row.get(name)
+                if value is None:
+                    nulls[name] += 1
+                    numbers[name].append(np.nan)
+                    continue
+                kind = _kind(value)
+                kinds[name].add(kind)
+                numbers[name].append(float(value) if kind == "numeric" else np.nan)
+                if len(distinct[name]) <= MAX_TRACKED_DISTINCT:
+                    try:
+                        distinct[name].add(value)
+                    except TypeError:
+                        distinct[name].add(str(value))
+                if not comparable[name]:
+                    continue
+                try:
+                    if minimum[name] is None or value < minimum[name]:
+                        minimum[name] = value
+                    if maximum[name] is None or value > maximum[name]:
+                        maximum[name] = value
+                    prev = previous[name]
+                    if prev is not None:
+                        if value < prev:
+                            increasing[name] = False
+                        if value > prev:
+                            decreasing[name] = False
+                    previous[name] = value
+                except TypeError:
+                    # Mixed types cannot be ordered
+                    comparable[name] = False
+
+        for name in names:
+            profile = ColumnProfile(name)
+            column_kinds = kinds[name]
+            profile.dtype = (column_kinds.pop() if len(column_kinds) == 1 else "mixed") if column_kinds else "empty"
+            profile.null_count = nulls[name]
+            profile.cardinality = min(len(distinct[name]), MAX_TRACKED_DISTINCT)
+            profile.cardinality_capped = len(distinct[name]) > MAX_TRACKED_DISTINCT
+            if comparable[name] and profile.dtype != "empty":
+                profile.min, profile.max = minimum[name], maximum[name]
+                if self.row_count - profile.null_count > 1:
+                    profile.monotonic = "increasing" if increasing[name] else "decreasing" if decreasing[name] else None
+            if profile.dtype == "numeric":
+                profile.values = np.array(numbers[name], dtype=float)
+
+            if _is_time_column(name, profile.dtype, profile.values):
+                profile.role = "time"
+            elif profile.dtype == "numeric" and column_label(name).split()[-1] != "id":
+                # Numeric IDs identify rows rather than measure anything
+                profile.role = "measure"
+            self.columns[name] = profile
+
+    @property
+    def time_columns(self) -> List[str]:
+        return [name for name, column in self.columns.items() if column.role == "time"]
+
+    @property
+    def measure_columns(self) -> List[str]:
+        return [name for name, column in self.columns.items() if column.role == "measure"]
+
+    @property
+    def label_columns(self) -> List[str]:
+        return [name for name, column in self.columns.items() if column.role == "label"]
+
+    def values(self, column: str, nulls_as_zero: bool = False) -> np.ndarray:
+        """Numeric values of a column as floats (NaN for nulls unless nulls_as_zero)"""
+        values = self.columns[column].values
+        if values is None:
+            values = np.full(self.row_count, np.nan)
+        return np.nan_to_num(values) if nulls_as_zero else values
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "row_count": self.row_count,
+            "columns": [column.to_dict() for column in self.columns.values()]
+        }
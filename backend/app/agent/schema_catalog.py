@@ -0,0 +1,299 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+from sqlalchemy import text
+from app.config import settings
+from app.database import postgres_engine, get_db_schema
+from app.agent.prompts import (
+    HR_DATABASE_SCHEMA,
+    TABLE_SELECTION_GUIDELINES,
+    SQL_GENERATION_RULES,
+    QUESTION_ANALYSIS_CHECKLIST,
+    SQL_GENERATION_SYSTEM_TEMPLATE,
+    FUSED_GENERATION_SYSTEM_TEMPLATE,
+    SQL_REPAIR_SYSTEM_TEMPLATE
+)
+
+
+# One PostgreSQL catalog query whose result changes whenever a table or column in the schema
+# is added, dropped, renamed or retyped, so an unchanged schema is never re-introspected
+SCHEMA_FINGERPRINT_SQL = """
+SELECT md5(string_agg(
+    c.relname || '.' || a.attname || ' ' || format_type(a.atttypid, a.atttypmod) || ' ' || a.attnotnull::text,
+    ',' ORDER BY c.relname, a.attnum
+))
+FROM pg_catalog.pg_attribute a
+JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = :schema
+  AND c.relkind IN ('r', 'p', 'v', 'm')
+  AND a.attnum > 0
+  AND NOT a.attisdropped
+"""
+
+# Department names (lower case) the intent router may put into a templated filter. These are
+# data, not schema, so they are re-read on every check
+DEPARTMENT_VALUES_SQL = """
+SELECT LOWER("Department") FROM {schema}.employee_master WHERE "Department" IS NOT NULL
+UNION
+SELECT LOWER("Department") FROM {schema}.headcount_attrition_summary WHERE "Department" IS NOT NULL
+"""
+
+# Reflected type names that are spelled differently in the schema description
+TYPE_NAMES = {
+    "character varying": "varchar",
+    "timestamp without time zone": "timestamp",
+    "timestamp with time zone": "timestamptz"
+}
+
+
+def _type_name(sql_type: str) -> str:
+    """Short lower-case type name: VARCHAR(50) -> varchar, NUMERIC(10, 2) -> numeric"""
+    name = re.sub(r'\(.*\)', '', sql_type).strip().lower()
+    return TYPE_NAMES.get(name, name)
+
+
+def parse_schema_notes(schema_text: str) -> Dict[str, Any]:
+    """Split a schema description into its preamble and, per table, the notes around its columns
+    Returns: {"preamble": str, "tables": {"employees.<table>": {"note": str, "columns": {name: (type, note)}, "footer": []}}}
+    """
+    header, marker, tables_text = schema_text.partition("=== TABLES ===")
+    notes: Dict[str, Any] = {"preamble": (header + marker).strip(), "tables": {}}
+    for block in re.split(r'\n\s*\n(?=Table: )', tables_text.strip()):
+        lines = block.strip().splitlines()
+        match = re.match(r'Table:\s*(\S+)\s*(.*)', lines[0]) if lines else None
+        if not match:
+            continue
+        table = {"note": match.group(2), "columns": {}, "footer": []}
+        for line in lines[1:]:
+            column = re.match(r'\s*-\s*"(\w+)"\s*\(([^)]*)\)(.*)', line)
+            if column:
+                table["columns"][column.group(1)] = (column.group(2), column.group(3))
+            elif line.strip() != "Columns:":
+                table["footer"].append(line)
+        notes["tables"][match.group(1)] = table
+    return notes
+
+
+def render_schema(tables: Dict[str, List[Dict[str, Any]]], notes: Dict[str, Any]) -> str:
+    """Schema description in the hand-written format, with the given tables and columns
+    Documented tables keep their notes and order; new tables and columns are listed without notes.
+    """
+    documented = notes["tables"]
+    order = [table for table in documented if table in tables] + sorted(t for t in tables if t not in documented)
+    blocks = [notes["preamble"]]
+    for table in order:
+        doc = documented.get(table, {"note": "", "columns": {}, "footer": []})
+        lines = [f"Table: {table} {doc['note']}".rstrip(), "Columns:"]
+        for column in tables[table]:
+            _, note = doc["columns"].get(column["name"], ("", ""))
+            lines.append(f'- "{column["name"]}" ({column["type"]}){note}')
+        lines.extend(doc["footer"])
+        blocks.append("\n".join(lines))
+    return "\n" + "\n\n".join(blocks) + "\n"
+
+
+def format_compact_schema(schema_columns: Dict[str, List[str]]) -> str:
+    """One line per table listing its quoted column names"""
+    return "\n".join(
+        f"- {table}: " + ", ".join(f'"{column}"' for column in columns)
+        for table, columns in schema_columns.items()
+    )
+
+
+class SchemaSnapshot:
+    """One version of the schema and the prompt text generated from it (immutable once built)
+
+    source is "live" (read from the database) or "fallback" (the hand-written description).
+    """
+
+    def __init__(self, tables: Dict[str, List[Dict[str, Any]]], source: str, notes: Dict[str, Any]):
+        self.tables = tables
+        self.source = source
+        self.loaded_at = time.time()
+        self.version = hashlib.sha1(json.dumps(tables, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        self.column_names: Dict[str, List[str]] = {
+            table: [column["name"] for column in columns] for table, columns in tables.items()
+        }
+        self.schema_text = render_schema(tables, notes)
+        self.sql_generation_prompt = SQL_GENERATION_SYSTEM_TEMPLATE.format(
+            rules=SQL_GENERATION_RULES,
+            schema=self.schema_text,
+            guidelines=TABLE_SELECTION_GUIDELINES,
+            checklist=QUESTION_ANALYSIS_CHECKLIST
+        )
+        self.fused_generation_prompt = FUSED_GENERATION_SYSTEM_TEMPLATE.format(
+            rules=SQL_GENERATION_RULES,
+            schema=self.schema_text,
+            guidelines=TABLE_SELECTION_GUIDELINES,
+            checklist=QUESTION_ANALYSIS_CHECKLIST
+        )
+        self.sql_repair_prompt = SQL_REPAIR_SYSTEM_TEMPLATE.format(
+            rules=SQL_GENERATION_RULES,
+            schema=format_compact_schema(self.column_names)
+        )
+
+
+class SchemaCatalog:
+    """Cached copy of the live database schema, with the SQL prompts generated from it
+
+    snapshot() never touches the database: it returns the current snapshot and, once that was
+    last checked more than ttl_seconds ago, starts a background refresh. A refresh runs one
+    catalog query (SCHEMA_FINGERPRINT_SQL) and only introspects the tables when its result
+    changed. Until the first load succeeds, or while the database is unreachable, the
+    hand-written schema description is used. Listeners are called when a loaded schema is
+    replaced by a different one. Each check also re-reads the Department values.
+    """
+
+    def __init__(self, schema: str, ttl_seconds: float, notes_text: str):
+        self.schema = schema
+        self.ttl_seconds = ttl_seconds
+        self.notes = parse_schema_notes(notes_text)
+        fallback = {
+            table: [{"name": name, "type": column_type, "nullable": True} for name, (column_type, _) in doc["columns"].items()]
+            for table, doc in self.notes["tables"].items()
+        }
+        self._snapshot = SchemaSnapshot(fallback, "fallback", self.notes)
+        self._fingerprint: Optional[str] = None
+        self._departments: Optional[FrozenSet[str]] = None
+        self._checked_at: Optional[float] = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[SchemaSnapshot], None]] = []
+        self.checks = 0
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def snapshot(self) -> SchemaSnapshot:
+        """Current schema snapshot; starts a background refresh if it is due"""
+        with self._lock:
+            snapshot = self._snapshot
+            due = self._checked_at is None or time.monotonic() - self._checked_at >= self.ttl_seconds
+        if due:
+            self.refresh_async()
+        return snapshot
+
+    def department_names(self) -> Optional[FrozenSet[str]]:
+        """Lower-case Department values, or None until they have been read from the database
+        Like snapshot(), starts a background refresh if one is due.
+        """
+        self.snapshot()
+        with self._lock:
+            return self._departments
+
+    def on_change(self, listener: Callable[[SchemaSnapshot], None]):
+        """Call listener(new_snapshot) whenever a loaded schema changes"""
+        self._listeners.append(listener)
+
+    def refresh_async(self) -> bool:
+        """Start a refresh in a background thread unless one is already running"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, name="schema-catalog", daemon=True).start()
+        return True
+
+    def refresh(self) -> bool:
+        """Check the schema version and reload the schema if it changed (blocking)
+        Returns: True if a different schema was loaded
+        """
+        try:
+            fingerprint = self._read_fingerprint()
+            self._refresh_departments()
+            if fingerprint is not None and fingerprint == self._fingerprint:
+                with self._lock:
+                    self.checks += 1
+                    self._checked_at = time.monotonic()
+                return False
+            tables = {
+                table: [
+                    {"name": column["name"], "type": _type_name(column["type"]), "nullable": column["nullable"]}
+                    for column in columns
+                ]
+                for table, columns in get_db_schema(self.schema).items()
+            }
+            if not tables:
+                raise ValueError(f"no tables found in schema '{self.schema}'")
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                self.last_error = str(e)[:200]
+                self._checked_at = time.monotonic()
+            raise
+
+        snapshot = SchemaSnapshot(tables, "live", self.notes)
+        with self._lock:
+            self.checks += 1
+            self._fingerprint = fingerprint
+            self._checked_at = time.monotonic()
+            previous = self._snapshot
+            if previous.source == "live" and previous.version == snapshot.version:
+                return False
+            self._snapshot = snapshot
+            self.reloads += 1
+        print(f"✓ Schema catalog loaded {len(tables)} tables from the database (version {snapshot.version})")
+        if previous.source == "live":
+            for listener in self._listeners:
+                try:
+                    listener(snapshot)
+                except Exception as e:
+                    print(f"Warning: Schema change listener failed: {e}")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                "source": snapshot.source,
+                "version": snapshot.version,
+                "tables": len(snapshot.tables),
+                "columns": sum(len(columns) for columns in snapshot.tables.values()),
+                "ttl_seconds": self.ttl_seconds,
+                "seconds_since_check": round(time.monotonic() - self._checked_at, 1) if self._checked_at is not None else None,
+                "checks": self.checks,
+                "reloads": self.reloads,
+                "departments": len(self._departments) if self._departments is not None else None,
+                "failures": self.failures,
+                "last_error": self.last_error
+            }
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Warning: Schema catalog refresh failed, keeping the {self._snapshot.source} schema: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh_departments(self):
+        """Re-read the Department values; on failure the previous values are kept"""
+        if postgres_engine.dialect.name != "postgresql":
+            return
+        try:
+            with postgres_engine.connect() as conn:
+                rows = conn.execute(text(DEPARTMENT_VALUES_SQL.format(schema=self.schema))).fetchall()
+        except Exception as e:
+            print(f"Warning: Could not read Department values: {e}")
+            return
+        with self._lock:
+            self._departments = frozenset(row[0].strip() for row in rows if row[0])
+
+    def _read_fingerprint(self) -> Optional[str]:
+        """Catalog fingerprint of the schema's tables and columns (None on databases other than PostgreSQL)"""
+        if postgres_engine.dialect.name != "postgresql":
+            return None
+        with postgres_engine.connect() as conn:
+            return conn.execute(text(SCHEMA_FINGERPRINT_SQL), {"schema": self.schema}).scalar()
+
+
+schema_catalog = SchemaCatalog(
+    schema="employees",
+    ttl_seconds=settings.SCHEMA_CATALOG_TTL_SECONDS,
+    notes_text=HR_DATABASE_SCHEMA
+)
@@ -0,0 +1,195 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from app.agent.prompts import (
+    TABLE_SELECTION_GUIDELINES,
+    SQL_GENERATION_RULES,
+    QUESTION_ANALYSIS_CHECKLIST,
+    SQL_GENERATION_SYSTEM_TEMPLATE
+)
+from app.agent.schema_catalog import schema_catalog, SchemaSnapshot
+from app.services.token_counter import token_counter
+
+
+CENTRAL_TABLE = "employees.employee_master"
+SUMMARY_TABLE = "employees.headcount_attrition_summary"
+
+# table -> question keywords that make it relevant. employee_master is always linked as
+# the base of every join (and the default for ambiguous headcount questions).
+TABLE_KEYWORDS = {
+    "employees.compensation_history": r'\b(?:compensation history|salary (?:change|history|increase|raise|adjustment)s?|raises?|increases?|pay (?:change|rise|raise)s?|promotions?|old salary|new salary|salary growth|merit)\b',
+    "employees.engagement_surveys": r'\b(?:engagement|engaged|satisfaction|satisfied|surveys?|work[- ]?life|balance|manager feedback|feedback scores?|morale)\b',
+    SUMMARY_TABLE: r'\b(?:attrition|turnover|trends?|over time|monthly|months?|month[- ]end|historical|history|hires|hiring|terminations?|separations?|headcount changes?)\b',
+    "employees.performance_reviews": r'\b(?:reviews?|reviewers?|performance scores?|overall score|communication|teamwork|problem[- ]solving|appraisals?)\b',
+    "employees.skills_inventory": r'\b(?:skills?|skilled|proficiency|proficient|competenc(?:y|ies)|expertise)\b',
+    "employees.training_records": r'\b(?:training|trained|courses?|learning|certifications?|completion)\b',
+}
+
+def table_name_pattern(table: str) -> str:
+    """Keyword pattern for a table without TABLE_KEYWORDS: the words of its name (benefit_plans -> benefit, plans)"""
+    words = [word for word in table.split(".")[-1].split("_") if len(word) > 3]
+    return r'\b(?:' + "|".join(re.escape(word.rstrip("s")) + "s?" for word in words) + r')\b' if words else r'(?!)'
+
+
+HEADCOUNT_PATTERN = r'\b(?:headcount|head count|how many|number of employees|employee count)\b'
+MANAGER_PATTERN = r'\b(?:managers?|reports?|reporting|direct reports)\b'
+
+
+def split_schema(schema_text: str) -> Dict[str, str]:
+    """Split the schema description into its title, relationships section and one block per table
+    Returns: {"title": str, "relationships": str, "employees.<table>": str, ...}
+    """
+    header, _, tables_text = schema_text.partition("=== TABLES ===")
+    title, _, relationships = header.strip().partition("\n")
+    blocks = {"title": title.strip(), "relationships": relationships.strip()}
+    for block in re.split(r'\n\s*\n(?=Table: )', tables_text.strip()):
+        match = re.match(r'Table:\s*(employees\.\w+)', block)
+        if match:
+            blocks[match.group(1)] = block.strip()
+    return blocks
+
+
+def split_guidelines(guidelines_text: str) -> Dict[str, str]:
+    """Split the table selection guidelines into their numbered sections
+    Returns: {"headcount": str, "time": str, "question_types": str, "joins": str}
+    """
+    sections = re.split(r'\n(?=\d\. [A-Z])', guidelines_text.strip())
+    named = {}
+    for section in sections[1:]:
+        if section.startswith("1. HEADCOUNT"):
+            named["headcount"] = section.rstrip()
+        elif section.startswith("2. TIME-BASED"):
+            named["time"] = section.rstrip()
+        elif "QUESTION TYPES" in section.splitlines()[0]:
+            named["question_types"] = section.rstrip()
+        elif "JOIN PATTERNS" in section.splitlines()[0]:
+            named["joins"] = section.rstrip()
+    named["title"] = sections[0].strip()
+    return named
+
+
+class SchemaLinker:
+    """Selects the tables, guidelines and examples relevant to a question and builds a trimmed
+    SQL generation system prompt from them
+
+    Tables are the unit of pruning: each table block is short, and filters often reference
+    columns the question does not name, so a linked table keeps all of its columns.
+    employee_master is always linked; questions matching no other keywords get it alone.
+    Table blocks come from the schema catalog and are re-split when its version changes.
+    """
+
+    def __init__(self):
+        self.guideline_sections = split_guidelines(TABLE_SELECTION_GUIDELINES)
+        self.schema_blocks: Dict[str, str] = {}
+        self.schema_version: Optional[str] = None
+        self.full_prompt_tokens = 0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.pruned = 0
+        self.tokens_saved = 0
+        self.table_counts: Dict[str, int] = {}
+
+    def link(self, question: str, history_text: str = "") -> Dict[str, Any]:
+        """Pick relevant tables for a question (and its conversation history)
+        Returns: {"tables": [], "prompt": str, "prompt_tokens": int, "prompt_tokens_saved": int}
+        The prompt is the system message; the question itself goes in SQL_GENERATION_USER_PROMPT.
+        """
+        schema_blocks, full_prompt_tokens = self._load_schema(schema_catalog.snapshot())
+        text = f"{history_text}\n{question}".lower()
+        tables = [CENTRAL_TABLE] + [
+            table for table, pattern in TABLE_KEYWORDS.items() if re.search(pattern, text)
+        ]
+        # Tables added to the database after TABLE_KEYWORDS was written are linked by name
+        tables += [
+            table for table in schema_blocks
+            if table.startswith("employees.") and table not in tables and table not in TABLE_KEYWORDS
+            and re.search(table_name_pattern(table), text)
+        ]
+        wants_headcount = bool(re.search(HEADCOUNT_PATTERN, text))
+        wants_manager = bool(re.search(MANAGER_PATTERN, text))
+
+        prompt = self._build_prompt(schema_blocks, tables, wants_headcount, wants_manager)
+        prompt_tokens = token_counter.count_tokens(prompt)
+        saved = max(full_prompt_tokens - prompt_tokens, 0)
+
+        with self._lock:
+            self.requests += 1
+            if saved:
+                self.pruned += 1
+                self.tokens_saved += saved
+            for table in tables:
+                self.table_counts[table] = self.table_counts.get(table, 0) + 1
+
+        return {
+            "tables": tables,
+            "prompt": prompt,
+            "prompt_tokens": prompt_tokens,
+            "prompt_tokens_saved": saved
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "pruned": self.pruned,
+                "full_prompt_tokens": self.full_prompt_tokens,
+                "prompt_tokens_saved": self.tokens_saved,
+                "avg_prompt_tokens_saved": self.tokens_saved / self.requests if self.requests else 0.0,
+                "tables": dict(self.table_counts)
+            }
+
+    def _load_schema(self, snapshot: SchemaSnapshot) -> Tuple[Dict[str, str], int]:
+        """Table blocks and full prompt size for a catalog snapshot (recomputed once per version)"""
+        with self._lock:
+            if snapshot.version != self.schema_version:
+                self.schema_blocks = split_schema(snapshot.schema_text)
+                self.full_prompt_tokens = token_counter.count_tokens(snapshot.sql_generation_prompt)
+                self.schema_version = snapshot.version
+            return self.schema_blocks, self.full_prompt_tokens
+
+    def _build_prompt(self, schema_blocks: Dict[str, str], tables: List[str], wants_headcount: bool, wants_manager: bool) -> str:
+        # The summary table is queried on its own, so it alone does not call for join patterns
+        joins_needed = (len(tables) > 1 and tables != [CENTRAL_TABLE, SUMMARY_TABLE]) or wants_manager
+        has_summary = SUMMARY_TABLE in tables
+
+        # employee_master is always the first block, so every linked prompt shares it as prefix
+        schema_parts = [schema_blocks["title"], "=== TABLES ==="]
+        schema_parts.extend(schema_blocks[t] for t in tables if t in schema_blocks)
+        if len(tables) > 1 or wants_manager:
+            schema_parts.append(schema_blocks["relationships"])
+
+        # Few-shot examples live in the guideline sections, so they are pruned with them
+        sections = self.guideline_sections
+        guideline_parts = []
+        if wants_headcount or has_summary:
+            guideline_parts.append(sections.get("headcount"))
+        if has_summary:
+            guideline_parts.append(sections.get("time"))
+        if len(tables) > 1:
+            guideline_parts.append(sections.get("question_types"))
+        if joins_needed:
+            guideline_parts.append(sections.get("joins"))
+        guideline_parts = [part for part in guideline_parts if part]
+        guidelines = "\n\n".join([sections["title"]] + guideline_parts) if guideline_parts else ""
+
+        return SQL_GENERATION_SYSTEM_TEMPLATE.format(
+            rules=SQL_GENERATION_RULES,
+            schema="\n\n".join(schema_parts),
+            guidelines=guidelines,
+            checklist=self._prune_checklist(tables)
+        )
+
+    @staticmethod
+    def _prune_checklist(tables: List[str]) -> str:
+        """Drop checklist lines that point at tables which were not linked"""
+        unlinked = [t.split(".", 1)[1] for t in TABLE_KEYWORDS if t not in tables]
+        if SUMMARY_TABLE not in tables:
+            unlinked.append("MonthEnd")
+        lines = [
+            line for line in QUESTION_ANALYSIS_CHECKLIST.splitlines()
+            if not any(name in line for name in unlinked)
+        ]
+        return "\n".join(lines)
+
+
+schema_linker = SchemaLinker()
@@ -0,0 +1,146 @@
+from typing import Any, Dict, List, Optional
+import sqlglot
+from sqlglot import exp
+from app.agent.schema_catalog import schema_catalog
+
+
+def check_sql(sql_query: str) -> Optional[str]:
+    """Check a query locally before it is sent to the database: it must parse, be a single
+    read-only statement and (once the live schema is loaded) only read tables that exist
+    Returns: None if the query passes, otherwise an error message for SQL repair
+    """
+    try:
+        statements = [s for s in sqlglot.parse(sql_query, read="postgres") if s is not None]
+    except sqlglot.errors.ParseError as e:
+        error = e.errors[0] if e.errors else {}
+        if error.get("highlight"):
+            return (f'syntax error at or near "{error["highlight"]}" '
+                    f'(line {error.get("line")}, column {error.get("col")}): {error.get("description")}')
+        return f"syntax error: {e}"
+    except sqlglot.errors.SqlglotError as e:
+        return f"syntax error: {e}"
+    if len(statements) != 1:
+        return f"expected a single SQL statement, got {len(statements)}"
+    tree = statements[0]
+    if not isinstance(tree, exp.Query):
+        return f"only read-only SELECT queries can be run, got {tree.key.upper()}"
+
+    snapshot = schema_catalog.snapshot()
+    if snapshot.source == "live":
+        schemas = {table.split(".")[0] for table in snapshot.column_names}
+        for table in tree.find_all(exp.Table):
+            if table.db in schemas:
+                name = f"{table.db}.{table.name}"
+                if name not in snapshot.column_names:
+                    return f'relation "{name}" does not exist'
+    return None
+
+
+class SQLColumnExtractor:
+    """Deterministic table/column extraction from a SQL statement's syntax tree
+
+    Tables are read from the parsed statement (CTE names excluded) and every column
+    reference is resolved to its table through aliases or, for unqualified columns,
+    against the employees schema. Columns are grouped by the clause they appear in.
+    Without fixed schema_columns, the current schema catalog snapshot is used.
+    """
+
+    def __init__(self, schema_columns: Optional[Dict[str, List[str]]] = None):
+        self._schema_columns = schema_columns
+
+    @property
+    def schema_columns(self) -> Dict[str, List[str]]:
+        if self._schema_columns is not None:
+            return self._schema_columns
+        return schema_catalog.snapshot().column_names
+
+    def extract(self, sql_query: str) -> Dict[str, Any]:
+        """Extract tables and columns from a SQL query
+        Returns: {"tables": [], "columns": {}, "select_columns": {}, "filter_columns": {},
+                  "group_by_columns": {}, "join_keys": []}
+        Raises sqlglot.errors.ParseError if the query cannot be parsed.
+        """
+        tree = sqlglot.parse_one(sql_query, read="postgres")
+        cte_names = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+
+        tables: List[str] = []
+        aliases: Dict[str, str] = {}
+        for table in tree.find_all(exp.Table):
+            full_name = self._resolve_table(table, cte_names)
+            if not full_name:
+                continue
+            if full_name not in tables:
+                tables.append(full_name)
+            aliases[table.alias_or_name] = full_name
+            aliases[table.name] = full_name
+
+        sections = {
+            "columns": {},
+            "select_columns": {},
+            "filter_columns": {},
+            "group_by_columns": {},
+        }
+        for column in tree.find_all(exp.Column):
+            for table in self._resolve_column(column, tables, aliases):
+                name = self._schema_name(table, column.name)
+                self._add(sections["columns"], table, name)
+                clause = column.find_ancestor(exp.Where, exp.Having, exp.Join, exp.Group, exp.Order, exp.Select)
+                if isinstance(clause, (exp.Where, exp.Having)):
+                    self._add(sections["filter_columns"], table, name)
+                elif isinstance(clause, exp.Group):
+                    self._add(sections["group_by_columns"], table, name)
+                elif isinstance(clause, exp.Select):
+                    self._add(sections["select_columns"], table, name)
+
+        join_keys = []
+        for join in tree.find_all(exp.Join):
+            condition = join.args.get("on")
+            if not condition:
+                continue
+            for eq in condition.find_all(exp.EQ):
+                left, right = eq.this, eq.expression
+                if isinstance(left, exp.Column) and isinstance(right, exp.Column):
+                    left_tables = self._resolve_column(left, tables, aliases)
+                    right_tables = self._resolve_column(right, tables, aliases)
+                    if left_tables and right_tables:
+                        join_keys.append({
+                            "left": f"{left_tables[0]}.{self._schema_name(left_tables[0], left.name)}",
+                            "right": f"{right_tables[0]}.{self._schema_name(right_tables[0], right.name)}"
+                        })
+
+        return {"tables": tables, **sections, "join_keys": join_keys}
+
+    def _resolve_table(self, table: exp.Table, cte_names: set) -> Optional[str]:
+        if not table.name or (not table.db and table.name in cte_names):
+            return None
+        if table.db:
+            return f"{table.db}.{table.name}"
+        candidate = f"employees.{table.name}"
+        return candidate if candidate in self.schema_columns else None
+
+    def _resolve_column(self, column: exp.Column, tables: List[str], aliases: Dict[str, str]) -> List[str]:
+        """Tables a column reference belongs to (empty for output aliases and CTE columns)"""
+        if column.table:
+            table = aliases.get(column.table)
+            return [table] if table else []
+        return [t for t in tables if self._schema_name(t, column.name) is not None]
+
+    def _schema_name(self, table: str, column_name: str) -> Optional[str]:
+        """Column name as spelled in the schema (unquoted identifiers may be lower-cased)"""
+        columns = self.schema_columns.get(table)
+        if columns is None:
+            return column_name
+        if column_name in columns:
+            return column_name
+        return next((c for c in columns if c.lower() == column_name.lower()), None)
+
+    @staticmethod
+    def _add(section: Dict[str, List[str]], table: str, column: Optional[str]):
+        if column is None:
+            return
+        columns = section.setdefault(table, [])
+        if column not in columns:
+            columns.append(column)
+
+
+sql_column_extractor = SQLColumnExtractor()
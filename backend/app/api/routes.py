@@ -1,6 +1,12 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import time
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 from app.agent.hr_agent import hr_agent
 from app.services.conversation import (
     create_session,
@@ -9,6 +15,20 @@ from app.services.conversation import (
     get_session_token_count
 )
 from app.services.token_counter import token_counter
+from app.agent.intent_router import intent_router
+from app.agent.schema_linker import schema_linker
+from app.agent.schema_catalog import schema_catalog
+from app.agent.insight_engine import insight_engine
+from app.services.sql_cache import sql_cache, normalize_question, context_fingerprint
+from app.services.semantic_cache import semantic_cache
+from app.services.executor import run_in_agent_executor, stream_from_agent_executor
+from app.services.llm_pool import ollama_pool
+from app.services.admission import AdmissionRejected, llm_admission, db_admission
+from app.services.single_flight import query_flights, SharedCalls
+from app.services.circuit_breaker import ollama_breaker, embedding_breaker, postgres_breaker, CLOSED
+from app.services.result_store import result_store
+from app.database import execute_sql_query, result_cache
+from app.config import settings
 
 router = APIRouter()
 
@@ -16,6 +36,7 @@ router = APIRouter()
 class QueryRequest(BaseModel):
     question: str
     session_id: Optional[str] = None
+    pipeline_mode: Optional[str] = None  # "multi" or "fused"; defaults to settings.PIPELINE_MODE
 
 
 class QueryResponse(BaseModel):
@@ -23,7 +44,9 @@ class QueryResponse(BaseModel):
     session_id: str
     answer: str
     sql_query: Optional[str] = None
-    results: Optional[List[Dict]] = None
+    results: Optional[List[Dict]] = None  # First RESULTS_PAGE_SIZE rows
+    total_rows: Optional[int] = None  # Rows in the full result
+    results_handle: Optional[str] = None  # Set when there are more rows: page through /api/results/{handle}
     tables: Optional[List[str]] = None
     columns: Optional[Dict[str, List[str]]] = None
     visualization: Optional[Dict] = None
@@ -31,102 +54,331 @@ class QueryResponse(BaseModel):
     explanation: Optional[str] = None
     token_count: Optional[int] = None  # Total session tokens
     query_tokens: Optional[int] = None  # Tokens for this query only
+    sql_source: Optional[str] = None  # llm, intent_router, exact_cache or semantic_cache
+    timings_ms: Optional[Dict[str, float]] = None  # Per-stage latency
+    pipeline_mode: Optional[str] = None  # multi or fused
+    llm_calls: Optional[int] = None  # LLM round trips for this query
+    prompt_tokens_saved: Optional[int] = None  # Prompt tokens removed by schema linking
+    repair_attempts: Optional[List[Dict[str, Any]]] = None  # Error-guided SQL repair attempts
+    coalesced: Optional[bool] = None  # Shared an identical in-flight request's pipeline
+    degraded_stages: Optional[List[str]] = None  # Stages that overran their budget and used a fallback
+    row_limit_reached: Optional[bool] = None  # Results were cut off at SQL_MAX_ROWS rows
     error: Optional[str] = None
 
 
-@router.post("/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
-    """Process a natural language HR analytics query"""
-    import time
-    
-    start_time = time.time()
-    
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    session_id: Optional[str] = None
+    pipeline_mode: Optional[str] = None
+
+
+class BatchQueryItem(BaseModel):
+    index: int
+    question: str
+    latency_ms: float  # From when the item started running (not time spent waiting for a slot)
+    response: QueryResponse
+
+
+class BatchQueryResponse(BaseModel):
+    session_id: str
+    items: List[BatchQueryItem]  # In request order
+    total_latency_ms: float
+    sql_executions: int  # Distinct SQL statements executed
+    sql_deduplicated: int  # Items that reused another item's SQL results
+
+
+async def _start_session(request: QueryRequest):
+    """Create or reuse the session, load its history and record the user message
+    Returns: (session_id, conversation_history)
+    """
     # Create or use existing session
     if not request.session_id:
-        session_id = create_session()
+        session_id = await run_in_threadpool(create_session)
     else:
         session_id = request.session_id
     
     # Get conversation history
-    conversation_history = get_conversation_history(session_id)
+    conversation_history = await run_in_threadpool(get_conversation_history, session_id)
     
     # Add user message
-    add_message(session_id, "user", request.question)
+    await run_in_threadpool(add_message, session_id, "user", request.question)
     
-    try:
-        # Process query with agent
-        result = hr_agent.process_query(request.question, conversation_history)
-        
-        if not result.get("success"):
-            error_msg = result.get("error", "Unknown error")
-            add_message(session_id, "assistant", f"Error: {error_msg}", {"error": True})
-            return QueryResponse(
-                success=False,
-                session_id=session_id,
-                answer=f"Error: {error_msg}",
-                error=error_msg,
-                sql_query=result.get("sql_query")
-            )
-        
-        # Format response
-        answer = result.get("explanation", "Analysis complete")
-        if result.get("insights"):
-            insights_text = "\n".join([f"• {insight}" for insight in result["insights"]])
-            answer = f"{insights_text}\n\n{answer}"
-        
-        # Add assistant message
-        metadata = {
-            "sql_query": result.get("sql_query"),
-            "tables": result.get("tables", []),
-            "columns": result.get("columns", {}),
-            "visualization": result.get("visualization"),
-            "results_count": len(result.get("results", []))
-        }
-        add_message(session_id, "assistant", answer, metadata)
-        
-        # Get token count - use LLM tokens from result, add stored message tokens
-        llm_tokens = result.get("tokens", 0)  # Tokens used for this query
-        stored_message_tokens = get_session_token_count(session_id)
-        # Total = LLM tokens (from this query) + stored message tokens (from previous messages)
-        total_token_count = llm_tokens + stored_message_tokens
-        
-        response_time = int((time.time() - start_time) * 1000)  # in milliseconds
-        
+    return session_id, conversation_history
+
+
+async def _first_page(results: List[Dict], handle: Optional[str] = None) -> Dict[str, Any]:
+    """First page of a result set, storing the rest behind a handle (or reusing the one already
+    stored, e.g. for a flight) when it has more rows
+    Returns: {"results": [], "total_rows": int, "results_handle": str or None}
+    """
+    if len(results) > settings.RESULTS_PAGE_SIZE:
+        handle = handle or await run_in_threadpool(result_store.put, results)
+        if handle is not None:
+            return {"results": results[:settings.RESULTS_PAGE_SIZE], "total_rows": len(results), "results_handle": handle}
+    # Small enough for one page, or too large to keep for paging: send every row
+    return {"results": results, "total_rows": len(results), "results_handle": None}
+
+
+async def _build_response(session_id: str, result: Dict) -> QueryResponse:
+    """Store the assistant message for an agent result and build the API response"""
+    if not result.get("success"):
+        error_msg = result.get("error", "Unknown error")
+        await run_in_threadpool(add_message, session_id, "assistant", f"Error: {error_msg}", {"error": True})
         return QueryResponse(
-            success=True,
+            success=False,
             session_id=session_id,
-            answer=answer,
+            answer=f"Error: {error_msg}",
+            error=error_msg,
             sql_query=result.get("sql_query"),
-            results=result.get("results", []),
-            tables=result.get("tables", []),
-            columns=result.get("columns", {}),
-            visualization=result.get("visualization"),
-            insights=result.get("insights", []),
-            explanation=result.get("explanation"),
-            token_count=total_token_count,  # Total tokens for session
-            query_tokens=llm_tokens  # Tokens for this query only
+            repair_attempts=result.get("repair_attempts")
         )
     
+    # Format response
+    answer = result.get("explanation", "Analysis complete")
+    if result.get("insights"):
+        insights_text = "\n".join([f"• {insight}" for insight in result["insights"]])
+        answer = f"{insights_text}\n\n{answer}"
+    
+    # Add assistant message
+    metadata = {
+        "sql_query": result.get("sql_query"),
+        "tables": result.get("tables", []),
+        "columns": result.get("columns", {}),
+        "visualization": result.get("visualization"),
+        "results_count": len(result.get("results", []))
+    }
+    await run_in_threadpool(add_message, session_id, "assistant", answer, metadata)
+    
+    # Get token count - use LLM tokens from result, add stored message tokens
+    llm_tokens = result.get("tokens", 0)  # Tokens used for this query
+    stored_message_tokens = await run_in_threadpool(get_session_token_count, session_id)
+    # Total = LLM tokens (from this query) + stored message tokens (from previous messages)
+    total_token_count = llm_tokens + stored_message_tokens
+    page = await _first_page(result.get("results", []), result.get("results_handle"))
+    
+    return QueryResponse(
+        success=True,
+        session_id=session_id,
+        answer=answer,
+        sql_query=result.get("sql_query"),
+        results=page["results"],
+        total_rows=page["total_rows"],
+        results_handle=page["results_handle"],
+        tables=result.get("tables", []),
+        columns=result.get("columns", {}),
+        visualization=result.get("visualization"),
+        insights=result.get("insights", []),
+        explanation=result.get("explanation"),
+        token_count=total_token_count,  # Total tokens for session
+        query_tokens=llm_tokens,  # Tokens for this query only
+        sql_source=result.get("sql_source"),
+        timings_ms=result.get("timings_ms"),
+        pipeline_mode=result.get("pipeline_mode"),
+        llm_calls=result.get("llm_calls"),
+        prompt_tokens_saved=result.get("prompt_tokens_saved"),
+        repair_attempts=result.get("repair_attempts"),
+        coalesced=result.get("coalesced"),
+        degraded_stages=result.get("degraded_stages"),
+        row_limit_reached=result.get("row_limit_reached")
+    )
+
+
+async def _build_error_response(session_id: str, e: Exception) -> QueryResponse:
+    """Store and return a processing error"""
+    import traceback
+    error_msg = f"Processing error: {str(e)}"
+    error_trace = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+    print(f"Error in process_query: {error_trace}")  # Log for debugging
+    await run_in_threadpool(add_message, session_id, "assistant", error_msg, {"error": True})
+    return QueryResponse(
+        success=False,
+        session_id=session_id,
+        answer=f"Error: {error_msg}",
+        error=error_msg,
+        token_count=await run_in_threadpool(get_session_token_count, session_id)
+    )
+
+
+async def _busy_error(session_id: str, e: AdmissionRejected) -> HTTPException:
+    """Record an overload rejection and build the 503 returned to the client"""
+    error_msg = f"Server is busy ({e}). Please retry in {e.retry_after}s."
+    await run_in_threadpool(add_message, session_id, "assistant", f"Error: {error_msg}", {"error": True})
+    return HTTPException(status_code=503, detail=error_msg, headers={"Retry-After": str(e.retry_after)})
+
+
+async def _run_pipeline(question: str, conversation_history: List[Dict], pipeline_mode: Optional[str], **kwargs) -> Dict:
+    """Run the agent pipeline for one flight and keep its rows for paging once
+    Requests coalesced onto the flight then share the same results_handle.
+    """
+    result = await run_in_agent_executor(
+        hr_agent.process_query, question, conversation_history, pipeline_mode=pipeline_mode, **kwargs
+    )
+    if result.get("success") and len(result.get("results") or []) > settings.RESULTS_PAGE_SIZE:
+        result["results_handle"] = await run_in_threadpool(result_store.put, result["results"])
+    return result
+
+
+def _flight_key(question: str, pipeline_mode: Optional[str], conversation_history: List[Dict]) -> tuple:
+    """Requests with the same key would run the same pipeline: question, context and mode"""
+    return (
+        normalize_question(question),
+        context_fingerprint(hr_agent.format_history(conversation_history)),
+        (pipeline_mode or settings.PIPELINE_MODE).lower()
+    )
+
+
+@router.post("/query", response_model=QueryResponse)
+async def process_query(request: QueryRequest):
+    """Process a natural language HR analytics query
+    Identical questions already in flight (same context and mode) share that pipeline run.
+    """
+    session_id, conversation_history = await _start_session(request)
+    
+    try:
+        # Process query with agent (blocking LLM/DB work runs on the bounded agent executor)
+        result, coalesced = await query_flights.run(
+            _flight_key(request.question, request.pipeline_mode, conversation_history),
+            lambda: _run_pipeline(request.question, conversation_history, request.pipeline_mode)
+        )
+        # Copied so requests sharing one run never see each other's changes
+        result = {**result, "coalesced": coalesced}
+        return await _build_response(session_id, result)
+    except AdmissionRejected as e:
+        raise await _busy_error(session_id, e)
     except Exception as e:
-        import traceback
-        error_msg = f"Processing error: {str(e)}"
-        error_trace = traceback.format_exc()
-        print(f"Error in process_query: {error_trace}")  # Log for debugging
-        add_message(session_id, "assistant", error_msg, {"error": True})
-        return QueryResponse(
-            success=False,
-            session_id=session_id,
-            answer=f"Error: {error_msg}",
-            error=error_msg,
-            token_count=get_session_token_count(session_id)
+        return await _build_error_response(session_id, e)
+
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def process_query_batch(request: BatchQueryRequest):
+    """Answer several questions (e.g. dashboard KPIs) in one request and one session
+    Questions run concurrently (up to BATCH_QUERY_MAX_CONCURRENCY at once) against the same
+    conversation context. Identical questions share one pipeline run and identical SQL is
+    executed once. Items are returned, and stored in the session, in request order.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="questions must not be empty")
+    if len(request.questions) > settings.BATCH_QUERY_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BATCH_QUERY_MAX_QUESTIONS} questions per batch"
         )
+    
+    session_id = request.session_id or await run_in_threadpool(create_session)
+    conversation_history = await run_in_threadpool(get_conversation_history, session_id)
+    
+    # Results of identical SQL (ignoring whitespace) are shared across the batch
+    shared_sql = SharedCalls()
+    
+    def execute_shared(sql_query: str) -> List[Dict[str, Any]]:
+        return shared_sql.run(" ".join(sql_query.split()).rstrip(";"), execute_sql_query, sql_query)
+    
+    semaphore = asyncio.Semaphore(max(1, settings.BATCH_QUERY_MAX_CONCURRENCY))
+    batch_start = time.perf_counter()
+    
+    async def run_item(question: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result, coalesced = await query_flights.run(
+                    _flight_key(question, request.pipeline_mode, conversation_history),
+                    lambda: _run_pipeline(
+                        question, conversation_history, request.pipeline_mode, execute_sql=execute_shared
+                    )
+                )
+                result = {**result, "coalesced": coalesced}
+            except Exception as e:
+                result = e
+            return result, round((time.perf_counter() - start) * 1000, 1)
+    
+    outcomes = await asyncio.gather(*[run_item(question) for question in request.questions])
+    
+    items = []
+    for index, (question, (result, latency_ms)) in enumerate(zip(request.questions, outcomes)):
+        await run_in_threadpool(add_message, session_id, "user", question)
+        if isinstance(result, AdmissionRejected):
+            # One overloaded item should not fail the whole batch
+            busy = await _busy_error(session_id, result)
+            response = QueryResponse(success=False, session_id=session_id, answer=f"Error: {busy.detail}", error=busy.detail)
+        elif isinstance(result, Exception):
+            response = await _build_error_response(session_id, result)
+        else:
+            response = await _build_response(session_id, result)
+        items.append(BatchQueryItem(index=index, question=question, latency_ms=latency_ms, response=response))
+    
+    return BatchQueryResponse(
+        session_id=session_id,
+        items=items,
+        total_latency_ms=round((time.perf_counter() - batch_start) * 1000, 1),
+        sql_executions=shared_sql.calls,
+        sql_deduplicated=shared_sql.shared
+    )
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+@router.post("/query/stream")
+async def process_query_stream(request: QueryRequest):
+    """Process a query and stream each pipeline stage as a Server-Sent Event
+    Events: session, sql, results, tables, visualization, insight_token, insights,
+    then done (the full QueryResponse) or error. sql is sent before the query runs, and again
+    if the SQL is repaired or regenerated after a failure. Like responses, the results event carries
+    the first page of rows and a results_handle when there are more.
+    The status code cannot change once streaming starts, so a full LLM queue is rejected up front.
+    """
+    if llm_admission.is_saturated():
+        retry_after = llm_admission.retry_after()
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server is busy. Please retry in {retry_after}s.",
+            headers={"Retry-After": str(retry_after)}
+        )
+    session_id, conversation_history = await _start_session(request)
+    
+    async def event_stream():
+        yield _sse_event("session", {"session_id": session_id})
+        results_handle = None
+        try:
+            async for stage, payload in stream_from_agent_executor(
+                hr_agent.process_query, request.question, conversation_history,
+                pipeline_mode=request.pipeline_mode
+            ):
+                if stage == "result":
+                    response = await _build_response(session_id, {**payload, "results_handle": results_handle})
+                    yield _sse_event("done", response.model_dump())
+                elif stage == "results":
+                    page = await _first_page(payload["results"])
+                    results_handle = page["results_handle"]
+                    yield _sse_event(stage, {**payload, **page})
+                else:
+                    yield _sse_event(stage, payload)
+        except AdmissionRejected as e:
+            busy = await _busy_error(session_id, e)
+            yield _sse_event("error", {
+                "success": False,
+                "session_id": session_id,
+                "error": busy.detail,
+                "retry_after": e.retry_after
+            })
+        except Exception as e:
+            response = await _build_error_response(session_id, e)
+            yield _sse_event("error", response.model_dump())
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.get("/conversation/{session_id}")
 async def get_conversation(session_id: str):
     """Get conversation history for a session"""
-    messages = get_conversation_history(session_id)
-    token_count = get_session_token_count(session_id)
+    messages = await run_in_threadpool(get_conversation_history, session_id)
+    token_count = await run_in_threadpool(get_session_token_count, session_id)
     
     return {
         "session_id": session_id,
@@ -135,9 +387,65 @@ async def get_conversation(session_id: str):
     }
 
 
+@router.get("/results/{handle}")
+async def get_results_page(
+    handle: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(settings.RESULTS_PAGE_SIZE, ge=1, le=settings.RESULTS_PAGE_SIZE)
+):
+    """Page through the rows of a query result by the results_handle of its response
+    next_offset is None on the last page.
+    """
+    page = await run_in_threadpool(result_store.page, handle, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Results handle not found or expired; run the query again")
+    return {"handle": handle, "limit": limit, **page}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the intent router and the agent caches, schema linking savings,
+    schema catalog freshness, SQL results served without PostgreSQL, results held for paging, LLM calls skipped by the insight engine and coalesced in-flight requests"""
+    return {
+        "intent_router": intent_router.stats(),
+        "schema_linker": schema_linker.stats(),
+        "schema_catalog": schema_catalog.stats(),
+        "insight_engine": insight_engine.stats(),
+        "sql_cache": sql_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "result_store": result_store.stats(),
+        "single_flight": query_flights.stats()
+    }
+
+
+@router.get("/llm/backends")
+async def llm_backends():
+    """Health, load and latency of each Ollama backend in the pool, and LLM admission queue metrics"""
+    return {"backends": ollama_pool.stats(), "admission": llm_admission.stats()}
+
+
+@router.get("/admission/stats")
+async def admission_stats():
+    """Concurrency, queue depth per priority class and queue wait for LLM and database calls"""
+    return {"llm": llm_admission.stats(), "database": db_admission.stats()}
+
+
 @router.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "service": "HR Analytics Agent"}
+    """Health check endpoint, with the circuit breaker state of each dependency
+    status is "degraded" while any circuit is not closed.
+    """
+    dependencies = {
+        "ollama": ollama_breaker.stats(),
+        "ollama_embeddings": embedding_breaker.stats(),
+        "postgres": postgres_breaker.stats()
+    }
+    healthy = all(d["state"] == CLOSED for d in dependencies.values())
+    return {
+        "status": "healthy" if healthy else "degraded",
+        "service": "HR Analytics Agent",
+        "dependencies": dependencies
+    }
 
 
@@ -8,8 +8,110 @@ class Settings(BaseSettings):
     
     # Ollama Configuration
     OLLAMA_BASE_URL: str = "http://localhost:11434"
+    # Optional pool of Ollama endpoints for chat calls (JSON list); empty means OLLAMA_BASE_URL only
+    OLLAMA_BASE_URLS: list = []
+    OLLAMA_EJECT_AFTER_FAILURES: int = 3
+    OLLAMA_EJECT_SECONDS: float = 30
+
+    # LLM admission control: concurrent calls (0 = OLLAMA_NUM_PARALLEL per backend),
+    # bounded waiting queue, and max queue wait before answering 503
+    OLLAMA_NUM_PARALLEL: int = 4
+    LLM_MAX_CONCURRENT: int = 0
+    LLM_MAX_QUEUE: int = 32
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 30
+    
+    # PostgreSQL admission control (kept below the connection pool size of 5 + 10 overflow)
+    DB_MAX_CONCURRENT: int = 10
+    DB_MAX_QUEUE: int = 64
+    DB_QUEUE_TIMEOUT_SECONDS: float = 10
+    
+    # Batch (evaluation) calls queue behind interactive ones and may wait longer
+    BATCH_QUEUE_TIMEOUT_SECONDS: float = 600
+    
+    # Circuit breakers for Ollama and PostgreSQL: consecutive failures before failing fast,
+    # how long to fail fast, and trial calls allowed while probing for recovery
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_SECONDS: float = 30
+    CIRCUIT_HALF_OPEN_MAX_CALLS: int = 1
     OLLAMA_MODEL: str = "llama3.1:8b"
+    OLLAMA_EMBEDDING_MODEL: str = "nomic-embed-text"
+    # How long Ollama keeps the model (and its prompt KV cache) loaded between requests
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    # HTTP timeout for a single Ollama call, so a hung backend cannot hold a request
+    OLLAMA_TIMEOUT_SECONDS: int = 60
+    
+    # Request deadline and budgets for the optional stages (seconds). A stage that runs
+    # over its budget is replaced by its heuristic / stats-only fallback.
+    REQUEST_DEADLINE_SECONDS: float = 120
+    VISUALIZATION_BUDGET_SECONDS: float = 20
+    INSIGHTS_BUDGET_SECONDS: float = 45
     
+    # Agent execution (max concurrent pipelines run off the event loop)
+    AGENT_MAX_WORKERS: int = 32
+    STAGE_MAX_WORKERS: int = 64
+    # Identical questions (same context and mode) arriving while one is running share its pipeline
+    SINGLE_FLIGHT_ENABLED: bool = True
+    # /api/query/batch: questions per request and how many of them run at once
+    BATCH_QUERY_MAX_QUESTIONS: int = 25
+    BATCH_QUERY_MAX_CONCURRENCY: int = 4
+
+    # LLM pipeline: "multi" (separate SQL / visualization / insight calls) or
+    # "fused" (one structured call returns SQL, chart type and insight plan)
+    PIPELINE_MODE: str = "multi"
+
+    # Rule-based router answering canonical questions without the LLM
+    INTENT_ROUTER_ENABLED: bool = True
+
+    # Schema linking: only relevant tables/guidelines go into the SQL generation prompt
+    SCHEMA_LINKING_ENABLED: bool = True
+
+    # Live schema catalog the prompts and column extractor are generated from; re-checked in
+    # the background once older than this (one catalog query unless the schema changed)
+    SCHEMA_CATALOG_TTL_SECONDS: float = 300
+
+    # Computed (NumPy) insights for scalar, categorical and time-series results; the LLM is
+    # only asked for other shapes
+    INSIGHT_ENGINE_ENABLED: bool = True
+    INSIGHT_ENGINE_MAX_CATEGORIES: int = 50
+
+    # Guardrails for executed SQL: per-statement timeout, max rows returned (a LIMIT applied
+    # around the query) and max planner cost checked with EXPLAIN first (0 = no cost check)
+    SQL_STATEMENT_TIMEOUT_SECONDS: float = 30
+    SQL_MAX_ROWS: int = 5000
+    SQL_MAX_PLAN_COST: float = 0
+
+    # API responses carry the first RESULTS_PAGE_SIZE rows; larger results are written to disk
+    # (bounded by size, for the TTL) behind a handle the client pages through at
+    # /api/results/{handle}. RESULTS_STORE_DIR defaults to a new temporary directory
+    RESULTS_PAGE_SIZE: int = 500
+    RESULTS_STORE_MAX_MB: int = 128
+    RESULTS_STORE_TTL_SECONDS: float = 900
+    RESULTS_STORE_DIR: str = ""
+
+    # Repair attempts for SQL that fails local checks or execution (the error is sent back to the LLM)
+    SQL_REPAIR_MAX_ATTEMPTS: int = 2
+
+    # Exact-match question -> SQL cache
+    SQL_CACHE_MAX_ENTRIES: int = 512
+    SQL_CACHE_TTL_SECONDS: float = 3600
+
+    # Normalized SQL -> result rows cache, bounded by memory; entries are dropped when a table
+    # they read changes (pg_stat_user_tables counters, polled in the background) or after the TTL
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_MB: int = 64
+    RESULT_CACHE_MAX_ENTRY_MB: int = 4
+    RESULT_CACHE_TTL_SECONDS: float = 300
+    RESULT_CACHE_VERSION_CHECK_SECONDS: float = 5
+
+    # Semantic (embedding similarity) question -> SQL cache
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1000
+    SEMANTIC_CACHE_TOP_K: int = 3
+    SEMANTIC_CACHE_PATH: str = "semantic_cache.npz"
+    # Inserts are saved to SEMANTIC_CACHE_PATH in the background, batched over this delay
+    SEMANTIC_CACHE_SAVE_DELAY_SECONDS: float = 5
+
     # SQLite for conversation storage
     SQLITE_DB_PATH: str = "conversations.db"
     
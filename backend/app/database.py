@@ -1,31 +1,73 @@
 from sqlalchemy import create_engine, text, inspect
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import settings
+from app.services.admission import db_admission
+from app.services.circuit_breaker import postgres_breaker, is_postgres_failure, QUERY_CANCELED
+from app.services.result_cache import ResultCache
+import json
 import sqlite3
-from typing import Dict, List, Any
+import threading
+from typing import Dict, List, Any, Optional
 
-# PostgreSQL engine for HR data
-postgres_engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+# PostgreSQL engine for HR data. The agent only reads, so sessions are read-only and every
+# statement is limited to SQL_STATEMENT_TIMEOUT_SECONDS (both set in the connection startup
+# packet, at no per-query cost). Statements run in autocommit mode: each query is its own
+# read-only transaction, without separate BEGIN / ROLLBACK round trips.
+postgres_engine = create_engine(
+    settings.DATABASE_URL,
+    pool_pre_ping=True,
+    isolation_level="AUTOCOMMIT",
+    connect_args=(
+        {"options": (
+            "-c default_transaction_read_only=on "
+            f"-c statement_timeout={int(settings.SQL_STATEMENT_TIMEOUT_SECONDS * 1000)}"
+        )}
+        if make_url(settings.DATABASE_URL).get_backend_name() == "postgresql" else {}
+    )
+)
 PostgresSession = sessionmaker(bind=postgres_engine)
 
 # SQLite for conversation storage
 sqlite_conn = sqlite3.connect(settings.SQLITE_DB_PATH, check_same_thread=False)
 sqlite_conn.row_factory = sqlite3.Row
+# The connection is shared across worker threads; serialize access to it
+sqlite_lock = threading.Lock()
 
 Base = declarative_base()
 
 
-def get_db_schema() -> Dict[str, List[Dict[str, Any]]]:
-    """Get database schema information for all tables in employees schema"""
+class SQLExecutionError(Exception):
+    """The database rejected a query; db_error is its own message (e.g. for SQL repair)"""
+
+    def __init__(self, db_error: str):
+        super().__init__(f"SQL execution error: {db_error}")
+        self.db_error = db_error
+
+# Per-table data version from PostgreSQL's statistics views: changes when rows are inserted,
+# updated or deleted (or the table is truncated). Counters are reported with a short delay.
+TABLE_VERSIONS_SQL = """
+SELECT schemaname || '.' || relname,
+       n_tup_ins || ':' || n_tup_upd || ':' || n_tup_del || ':' || n_live_tup
+FROM pg_stat_user_tables
+WHERE schemaname = :schema
+"""
+
+
+def get_db_schema(schema: str = "employees") -> Dict[str, List[Dict[str, Any]]]:
+    """Get database schema information for all tables in a schema (employees by default)
+    This introspects the database on every call; use schema_catalog for the cached copy.
+    """
     schema_info = {}
     
     with postgres_engine.connect() as conn:
-        inspector = inspect(postgres_engine)
-        tables = inspector.get_table_names(schema='employees')
+        # One inspector on one connection for all tables
+        inspector = inspect(conn)
+        tables = inspector.get_table_names(schema=schema)
         
         for table in tables:
-            columns = inspector.get_columns(table, schema='employees')
-            schema_info[f"employees.{table}"] = [
+            columns = inspector.get_columns(table, schema=schema)
+            schema_info[f"{schema}.{table}"] = [
                 {
                     "name": col["name"],
                     "type": str(col["type"]),
@@ -37,28 +79,80 @@ def get_db_schema() -> Dict[str, List[Dict[str, Any]]]:
     return schema_info
 
 
+def get_table_versions(schema: str = "employees") -> Optional[Dict[str, str]]:
+    """Data version of each table in a schema (None on databases other than PostgreSQL)"""
+    if postgres_engine.dialect.name != "postgresql":
+        return None
+    with postgres_engine.connect() as conn:
+        rows = conn.execute(text(TABLE_VERSIONS_SQL), {"schema": schema}).fetchall()
+    return {table: version for table, version in rows}
+
+
 def execute_sql_query(query: str) -> List[Dict[str, Any]]:
-    """Execute SQL query and return results as list of dictionaries"""
-    try:
-        with postgres_engine.connect() as conn:
-            result = conn.execute(text(query))
-            columns = result.keys()
-            rows = result.fetchall()
-            
-            return [dict(zip(columns, row)) for row in rows]
-    except Exception as e:
-        raise Exception(f"SQL execution error: {str(e)}")
-
-
-def validate_sql_query(query: str) -> bool:
-    """Validate SQL query syntax"""
-    try:
-        with postgres_engine.connect() as conn:
-            # Use EXPLAIN to validate without executing
-            conn.execute(text(f"EXPLAIN {query}"))
-            return True
-    except Exception as e:
-        return False
+    """Execute SQL query and return results as list of dictionaries
+    Read-only queries are answered from the result cache while the tables they read are unchanged.
+    Raises SQLExecutionError if the database rejects the query; connection-level failures are
+    raised as they are.
+    """
+    if settings.RESULT_CACHE_ENABLED:
+        return result_cache.get_or_execute(query, _run_sql_query)
+    return _run_sql_query(query)
+
+
+def limit_rows(query: str, max_rows: int) -> str:
+    """Wrap a query so the database returns at most max_rows rows (its own ORDER BY still applies)"""
+    body = query.strip().rstrip(";").rstrip()
+    # The newline keeps a trailing -- comment from swallowing the closing parenthesis
+    return f"SELECT * FROM (\n{body}\n) AS limited_result LIMIT {max_rows}"
+
+
+def _plan_cost(conn, query: str) -> float:
+    """Planner's estimated total cost for a query (EXPLAIN, not executed)"""
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return float(plan[0]["Plan"]["Total Cost"])
+
+
+def _run_sql_query(query: str) -> List[Dict[str, Any]]:
+    """Run a query with at most SQL_MAX_ROWS + 1 rows returned
+    The extra row tells callers the result was cut off; they drop it (see HRAgent.process_query).
+    """
+    limited = limit_rows(query, settings.SQL_MAX_ROWS + 1) if settings.SQL_MAX_ROWS > 0 else query
+    with postgres_breaker.guard(), db_admission.slot():
+        try:
+            with postgres_engine.connect() as conn:
+                if settings.SQL_MAX_PLAN_COST > 0 and postgres_engine.dialect.name == "postgresql":
+                    # Costed with the row limit, which makes plans that can stop early cheaper
+                    cost = _plan_cost(conn, limited)
+                    if cost > settings.SQL_MAX_PLAN_COST:
+                        raise SQLExecutionError(
+                            f"query plan cost {cost:,.0f} exceeds the limit of {settings.SQL_MAX_PLAN_COST:,.0f}; "
+                            "filter or aggregate the data, or avoid cross joins"
+                        )
+                result = conn.execute(text(limited))
+                columns = list(result.keys())
+                return [dict(zip(columns, row)) for row in result.fetchall()]
+        except SQLExecutionError:
+            raise
+        except Exception as e:
+            if is_postgres_failure(e):
+                raise  # Connection-level failure: counted by the circuit breaker
+            # Prefer the driver's message (e.g. psycopg2's) over SQLAlchemy's wrapper text
+            message = str(getattr(e, "orig", None) or e).strip()
+            if getattr(getattr(e, "orig", None), "pgcode", None) == QUERY_CANCELED:
+                message += (f" (limit {settings.SQL_STATEMENT_TIMEOUT_SECONDS:g}s); "
+                            "the query is too expensive - filter or aggregate the data, or avoid cross joins")
+            raise SQLExecutionError(message)
+
+
+result_cache = ResultCache(
+    max_bytes=settings.RESULT_CACHE_MAX_MB * 1024 * 1024,
+    max_entry_bytes=settings.RESULT_CACHE_MAX_ENTRY_MB * 1024 * 1024,
+    ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+    version_check_seconds=settings.RESULT_CACHE_VERSION_CHECK_SECONDS,
+    read_versions=get_table_versions
+)
 
 
 def init_conversation_db():
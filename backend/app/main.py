@@ -2,6 +2,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.api.routes import router
+from app.agent.schema_catalog import schema_catalog
+from app.services.semantic_cache import semantic_cache
+from app.services.result_store import result_store
 
 app = FastAPI(
     title="HR Analytics Agent API",
@@ -22,6 +25,24 @@ app.add_middleware(
 app.include_router(router, prefix="/api", tags=["api"])
 
 
+@app.on_event("startup")
+def load_schema_catalog():
+    # Load the live schema in the background so the first requests do not wait on introspection
+    schema_catalog.refresh_async()
+
+
+@app.on_event("shutdown")
+def save_semantic_cache():
+    # Write inserts still waiting for the background save
+    semantic_cache.flush()
+
+
+@app.on_event("shutdown")
+def remove_paged_results():
+    # Handles do not survive a restart, so their files are not needed
+    result_store.close()
+
+
 @app.get("/")
 async def root():
     return {
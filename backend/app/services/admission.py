@@ -0,0 +1,201 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+
+
+# Priority classes: lower values are admitted first
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Priority of the calls made by the current request; copied into worker threads with the context
+_request_priority: ContextVar[int] = ContextVar("request_priority", default=INTERACTIVE)
+
+
+def current_priority() -> int:
+    return _request_priority.get()
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Run the block's LLM and database calls at the given priority class"""
+    token = _request_priority.set(level)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call cannot be admitted; retry_after is a suggested wait in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded waiting queue
+
+    At most max_concurrent calls run at once. Further callers wait by priority class, then in
+    arrival order, so a freed slot always goes to a waiting interactive call before any batch
+    call. When max_queue callers are already waiting, or a caller waits longer than its
+    timeout, AdmissionRejected is raised so the request can be answered with a fast 503
+    instead of making every request slow. Waiting batch calls do not count against the queue
+    limit for interactive callers, and batch calls get the (longer) batch_queue_timeout.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout: float,
+        batch_queue_timeout: Optional[float] = None
+    ):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.batch_queue_timeout = batch_queue_timeout if batch_queue_timeout is not None else queue_timeout
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[int, int, int]] = []  # heap of (priority, arrival sequence, ticket)
+        self._sequence = itertools.count()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.admitted_by_priority = {level: 0 for level in PRIORITY_NAMES}
+        self._queue_ms = deque(maxlen=1000)
+        self._service_ms = deque(maxlen=1000)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one of the concurrent slots for the duration of the block"""
+        self._acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release((time.perf_counter() - start) * 1000)
+
+    def is_saturated(self) -> bool:
+        """True when the waiting queue is full, so a new call at the current priority would be rejected"""
+        with self._cond:
+            return self._queued_ahead(current_priority()) >= self.max_queue
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, from recent call durations and queue depth"""
+        with self._cond:
+            return self._retry_after_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queue_ms = np.array(self._queue_ms) if self._queue_ms else None
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "waiting": len(self._waiters),
+                "waiting_by_priority": {
+                    name: sum(1 for waiter in self._waiters if waiter[0] == level)
+                    for level, name in PRIORITY_NAMES.items()
+                },
+                "admitted": self.admitted,
+                "admitted_by_priority": {
+                    name: self.admitted_by_priority[level] for level, name in PRIORITY_NAMES.items()
+                },
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "queue_ms": {
+                    "mean": float(queue_ms.mean()),
+                    "p50": float(np.percentile(queue_ms, 50)),
+                    "p95": float(np.percentile(queue_ms, 95)),
+                    "p99": float(np.percentile(queue_ms, 99)),
+                    "max": float(queue_ms.max())
+                } if queue_ms is not None else None
+            }
+
+    def _acquire(self) -> float:
+        start = time.perf_counter()
+        level = current_priority()
+        with self._cond:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                self.admitted += 1
+                self.admitted_by_priority[level] = self.admitted_by_priority.get(level, 0) + 1
+                self._queue_ms.append(0.0)
+                return 0.0
+
+            if self._queued_ahead(level) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(f"{self.name} queue is full", self._retry_after_locked())
+
+            entry = (level, next(self._sequence), id(threading.current_thread()))
+            heapq.heappush(self._waiters, entry)
+            timeout = self.batch_queue_timeout if level >= BATCH else self.queue_timeout
+            deadline = start + timeout
+            while True:
+                if self._waiters[0] == entry and self.active < self.max_concurrent:
+                    heapq.heappop(self._waiters)
+                    self.active += 1
+                    self.admitted += 1
+                    self.admitted_by_priority[level] = self.admitted_by_priority.get(level, 0) + 1
+                    # Let the next waiter check whether a slot is still free
+                    self._cond.notify_all()
+                    queued_ms = (time.perf_counter() - start) * 1000
+                    self._queue_ms.append(queued_ms)
+                    return queued_ms
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self.timed_out += 1
+                    self._cond.notify_all()
+                    raise AdmissionRejected(
+                        f"{self.name} queue wait exceeded {timeout:g}s",
+                        self._retry_after_locked()
+                    )
+                self._cond.wait(remaining)
+
+    def _release(self, service_ms: float):
+        with self._cond:
+            self.active -= 1
+            self._service_ms.append(service_ms)
+            self._cond.notify_all()
+
+    def _queued_ahead(self, level: int) -> int:
+        """Waiters that would be admitted before a new caller at this priority"""
+        return sum(1 for waiter in self._waiters if waiter[0] <= level)
+
+    def _retry_after_locked(self) -> int:
+        mean_service_s = (sum(self._service_ms) / len(self._service_ms) / 1000) if self._service_ms else 1.0
+        waves = (len(self._waiters) + 1) / self.max_concurrent
+        return max(1, math.ceil(mean_service_s * waves))
+
+
+# Sized to what the Ollama backends can run in parallel; extra calls queue, then get a 503
+llm_admission = AdmissionController(
+    name="LLM",
+    max_concurrent=settings.LLM_MAX_CONCURRENT or settings.OLLAMA_NUM_PARALLEL * len(settings.OLLAMA_BASE_URLS or [settings.OLLAMA_BASE_URL]),
+    max_queue=settings.LLM_MAX_QUEUE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+    batch_queue_timeout=settings.BATCH_QUEUE_TIMEOUT_SECONDS
+)
+
+# Sized below the SQLAlchemy connection pool so queued queries wait here, in priority order
+db_admission = AdmissionController(
+    name="Database",
+    max_concurrent=settings.DB_MAX_CONCURRENT,
+    max_queue=settings.DB_MAX_QUEUE,
+    queue_timeout=settings.DB_QUEUE_TIMEOUT_SECONDS,
+    batch_queue_timeout=settings.BATCH_QUEUE_TIMEOUT_SECONDS
+)
@@ -0,0 +1,181 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+from sqlalchemy import exc as sa_exc
+from app.config import settings
+from app.services.admission import AdmissionRejected
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(AdmissionRejected):
+    """Raised without calling the dependency while its circuit is open
+    A kind of admission rejection, so callers answer it the same way (503 with Retry-After).
+    """
+
+
+class CircuitBreaker:
+    """Fails calls to an unhealthy dependency fast instead of letting each one time out
+
+    closed: calls go through; failure_threshold consecutive failures open the circuit.
+    open: calls raise CircuitOpenError immediately for reset_seconds.
+    half_open: up to half_open_max_calls trial calls go through; a trial's success closes the
+    circuit again, a failure reopens it. Successes of calls admitted before the circuit opened
+    are ignored.
+    Only exceptions accepted by is_failure count (e.g. not a query's own SQL error).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_seconds: float,
+        half_open_max_calls: int = 1,
+        is_failure: Optional[Callable[[Exception], bool]] = None
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.is_failure = is_failure or (lambda e: not isinstance(e, AdmissionRejected))
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.trials_in_flight = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+        self.last_error: Optional[str] = None
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Run the block as one call to the dependency"""
+        trial = self._before_call()
+        try:
+            yield
+        except Exception as e:
+            if self.is_failure(e):
+                self._on_failure(e)
+            else:
+                self._on_neutral(trial)
+            raise
+        except BaseException:
+            # e.g. a stream closed early by its consumer: says nothing about the dependency
+            self._on_neutral(trial)
+            raise
+        self._on_success(trial)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        with self.guard():
+            return func(*args, **kwargs)
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected (open and not yet due for a trial)"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self.state
+            if state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                state = HALF_OPEN  # the next call will be a trial
+            return {
+                "state": state,
+                "consecutive_failures": self.consecutive_failures,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "times_opened": self.times_opened,
+                "retry_after": self._retry_after_locked() if state == OPEN else 0,
+                "last_error": self.last_error
+            }
+
+    def _before_call(self) -> bool:
+        """Admit or reject a call; returns True if it is a half-open trial"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} is unavailable (circuit open)", self._retry_after_locked())
+                self.state = HALF_OPEN
+                print(f"Warning: {self.name} circuit half-open, sending a trial call")
+            if self.state == HALF_OPEN:
+                if self.trials_in_flight >= self.half_open_max_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} is recovering (circuit half-open)", 1)
+                self.trials_in_flight += 1
+                return True
+            return False
+
+    def _on_success(self, trial: bool):
+        with self._lock:
+            if self.state == CLOSED:
+                self.consecutive_failures = 0
+            elif self.state == HALF_OPEN and trial:
+                print(f"✓ {self.name} circuit closed")
+                self.state = CLOSED
+                self.consecutive_failures = 0
+                self.trials_in_flight = 0
+            # Otherwise the call was admitted before the circuit opened: it says nothing about
+            # recovery, so only a half-open trial may close the circuit
+
+    def _on_neutral(self, trial: bool):
+        if trial:
+            with self._lock:
+                self.trials_in_flight = max(0, self.trials_in_flight - 1)
+
+    def _on_failure(self, error: Exception):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:200]
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                    print(f"Warning: {self.name} circuit open for {self.reset_seconds:g}s after repeated failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.trials_in_flight = 0
+
+    def _retry_after_locked(self) -> int:
+        return max(1, math.ceil(self.reset_seconds - (time.monotonic() - self.opened_at)))
+
+
+# SQLSTATE of a statement cancelled by statement_timeout: the query was too expensive, not a failure
+QUERY_CANCELED = "57014"
+
+
+def is_postgres_failure(error: Exception) -> bool:
+    """Connection-level errors only; a query's own SQL errors say nothing about Postgres health"""
+    if getattr(getattr(error, "orig", None), "pgcode", None) == QUERY_CANCELED:
+        return False
+    return isinstance(error, (sa_exc.OperationalError, sa_exc.InterfaceError, sa_exc.TimeoutError))
+
+
+ollama_breaker = CircuitBreaker(
+    name="Ollama",
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=settings.CIRCUIT_RESET_SECONDS,
+    half_open_max_calls=settings.CIRCUIT_HALF_OPEN_MAX_CALLS
+)
+
+# Embeddings (semantic cache) use a different model and endpoint than chat, so their failures
+# must not fail chat calls fast
+embedding_breaker = CircuitBreaker(
+    name="Ollama embeddings",
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=settings.CIRCUIT_RESET_SECONDS,
+    half_open_max_calls=settings.CIRCUIT_HALF_OPEN_MAX_CALLS
+)
+
+postgres_breaker = CircuitBreaker(
+    name="PostgreSQL",
+    failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=settings.CIRCUIT_RESET_SECONDS,
+    half_open_max_calls=settings.CIRCUIT_HALF_OPEN_MAX_CALLS,
+    is_failure=is_postgres_failure
+)
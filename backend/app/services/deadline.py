@@ -0,0 +1,26 @@
+import time
+from typing import Optional
+
+
+class Deadline:
+    """Point in time by which a request (or one of its stages) has to finish
+
+    A stage deadline is the earlier of its own budget and its parent's deadline, so a stage
+    never outlives the request it belongs to.
+    """
+
+    def __init__(self, seconds: float, parent: Optional["Deadline"] = None):
+        expires_at = time.monotonic() + seconds
+        if parent is not None:
+            expires_at = min(expires_at, parent.expires_at)
+        self.expires_at = expires_at
+
+    def stage(self, seconds: float) -> "Deadline":
+        """Budget for one stage, starting now"""
+        return Deadline(seconds, parent=self)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
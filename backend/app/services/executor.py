@@ -0,0 +1,59 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Tuple
+from app.config import settings
+
+
+# Bounded pool for the blocking agent pipeline (Ollama + PostgreSQL calls).
+# Routes await work submitted here so the event loop stays free for other requests.
+agent_executor = ThreadPoolExecutor(
+    max_workers=settings.AGENT_MAX_WORKERS,
+    thread_name_prefix="hr-agent"
+)
+
+# Pool for independent post-execution stages (visualization, insights) of a single pipeline.
+# Kept separate from agent_executor so a pipeline never waits on a slot held by another pipeline.
+stage_executor = ThreadPoolExecutor(
+    max_workers=settings.STAGE_MAX_WORKERS,
+    thread_name_prefix="hr-agent-stage"
+)
+
+_DONE = object()
+
+
+async def run_in_agent_executor(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking callable on the agent executor and await its result"""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. the request's priority class) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(agent_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+async def stream_from_agent_executor(func: Callable[..., Any], *args, **kwargs) -> AsyncIterator[Tuple[str, Any]]:
+    """Run a blocking callable that reports progress through an on_event(stage, payload) callback
+    Yields (stage, payload) pairs as they are emitted, then ("result", return value).
+    Exceptions raised by the callable are re-raised after the emitted events.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    def on_event(stage: str, payload: Any):
+        loop.call_soon_threadsafe(queue.put_nowait, (stage, payload))
+    
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(
+        agent_executor,
+        functools.partial(context.run, func, *args, on_event=on_event, **kwargs)
+    )
+    # Completion is signalled through the loop as well, so it is queued after every event
+    future.add_done_callback(lambda _: queue.put_nowait(_DONE))
+    
+    while True:
+        item = await queue.get()
+        if item is _DONE:
+            break
+        yield item
+    
+    yield "result", future.result()
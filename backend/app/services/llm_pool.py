@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import numpy as np
+from langchain_community.chat_models import ChatOllama
+from langchain_core.runnables import Runnable, RunnableConfig
+from app.config import settings
+from app.services.admission import AdmissionController, llm_admission
+from app.services.circuit_breaker import CircuitBreaker, ollama_breaker
+
+
+class OllamaBackend:
+    """One Ollama endpoint with its own client and passive health state"""
+
+    def __init__(self, url: str, llm: Runnable):
+        self.url = url
+        self.llm = llm
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.last_error: Optional[str] = None
+        self.latencies_ms = deque(maxlen=1000)
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class OllamaPool(Runnable):
+    """Load-balanced pool of Ollama backends, usable anywhere a chat model Runnable is
+
+    Each call goes to the healthy backend with the fewest outstanding requests. Health is
+    checked passively: a backend that fails eject_after times in a row is taken out of
+    rotation for eject_seconds, then receives traffic again. A failed call is retried once
+    on another backend (for streams, only if nothing was streamed yet). If every backend is
+    ejected, the one due back soonest is used rather than failing outright. With a circuit
+    breaker, calls fail fast while the pool as a whole is failing; with an admission
+    controller, every call first waits for one of its slots.
+    """
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        make_llm: Callable[[str], Runnable],
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+        admission: Optional[AdmissionController] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        if not base_urls:
+            raise ValueError("OllamaPool needs at least one base URL")
+        self.backends = [OllamaBackend(url, make_llm(url)) for url in base_urls]
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.admission = admission
+        self.breaker = breaker
+        self._lock = threading.Lock()
+        self._next = 0  # rotates tie-breaks between equally loaded backends
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        with self._call_slot():
+            return self._invoke(input, config, **kwargs)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        with self._call_slot():
+            yield from self._stream(input, config, **kwargs)
+
+    @contextmanager
+    def _call_slot(self) -> Iterator[None]:
+        # The breaker is checked first, so calls fail fast instead of queueing for a dead backend
+        with self.breaker.guard() if self.breaker else nullcontext():
+            with self.admission.slot() if self.admission else nullcontext():
+                yield
+
+    def _invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        tried: List[OllamaBackend] = []
+        while True:
+            backend = self._acquire(exclude=tried)
+            tried.append(backend)
+            start = time.perf_counter()
+            try:
+                result = backend.llm.invoke(input, config, **kwargs)
+            except Exception as e:
+                self._release(backend, start, error=e)
+                if not self._can_retry(tried):
+                    raise
+                print(f"Warning: Ollama backend {backend.url} failed ({e}), retrying on another backend")
+                continue
+            self._release(backend, start)
+            return result
+
+    def _stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        tried: List[OllamaBackend] = []
+        while True:
+            backend = self._acquire(exclude=tried)
+            tried.append(backend)
+            start = time.perf_counter()
+            streamed = False
+            completed = False
+            error: Optional[Exception] = None
+            try:
+                for chunk in backend.llm.stream(input, config, **kwargs):
+                    streamed = True
+                    yield chunk
+                completed = True
+            except Exception as e:
+                error = e
+            finally:
+                # Also runs if the consumer stops iterating early (e.g. a stage over its budget);
+                # such an abandoned stream says nothing about the backend's latency or health
+                self._release(backend, start, error=error, completed=completed or error is not None)
+            if error is None:
+                return
+            if streamed or not self._can_retry(tried):
+                raise error
+            print(f"Warning: Ollama backend {backend.url} failed ({error}), retrying on another backend")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            stats = []
+            for backend in self.backends:
+                latencies = np.array(backend.latencies_ms) if backend.latencies_ms else None
+                stats.append({
+                    "url": backend.url,
+                    "healthy": backend.is_healthy(now),
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "ejections": backend.ejections,
+                    "last_error": backend.last_error,
+                    "latency_ms": {
+                        "mean": float(latencies.mean()),
+                        "p50": float(np.percentile(latencies, 50)),
+                        "p95": float(np.percentile(latencies, 95))
+                    } if latencies is not None else None
+                })
+            return stats
+
+    def _acquire(self, exclude: List[OllamaBackend]) -> OllamaBackend:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude] or self.backends
+            healthy = [b for b in candidates if b.is_healthy(now)]
+            if healthy:
+                # Least outstanding requests; rotate the starting point so ties spread evenly
+                count = len(self.backends)
+                self._next = (self._next + 1) % count
+                backend = min(
+                    healthy,
+                    key=lambda b: (b.outstanding, (self.backends.index(b) - self._next) % count)
+                )
+            else:
+                backend = min(candidates, key=lambda b: b.ejected_until)
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def _release(self, backend: OllamaBackend, start: float, error: Optional[Exception] = None, completed: bool = True):
+        """Finish a call; one that was abandoned before completing only frees its slot"""
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            backend.outstanding -= 1
+            if not completed:
+                return
+            if error is None:
+                backend.consecutive_failures = 0
+                backend.latencies_ms.append(elapsed_ms)
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            backend.last_error = str(error)[:200]
+            now = time.monotonic()
+            if backend.consecutive_failures >= self.eject_after and backend.is_healthy(now):
+                # A backend coming back from ejection is ejected again on its first failure
+                backend.consecutive_failures = self.eject_after - 1
+                backend.ejections += 1
+                backend.ejected_until = now + self.eject_seconds
+                print(f"Warning: Ejecting Ollama backend {backend.url} for {self.eject_seconds:.0f}s after repeated failures")
+
+    def _can_retry(self, tried: List[OllamaBackend]) -> bool:
+        """Only one retry per call, and only onto a backend not tried yet"""
+        return len(tried) < 2 and len(tried) < len(self.backends)
+
+
+def make_chat_ollama(base_url: str) -> ChatOllama:
+    return ChatOllama(
+        base_url=base_url,
+        model=settings.OLLAMA_MODEL,
+        temperature=0.1,
+        keep_alive=settings.OLLAMA_KEEP_ALIVE,
+        timeout=settings.OLLAMA_TIMEOUT_SECONDS
+    )
+
+
+ollama_pool = OllamaPool(
+    base_urls=settings.OLLAMA_BASE_URLS or [settings.OLLAMA_BASE_URL],
+    make_llm=make_chat_ollama,
+    eject_after=settings.OLLAMA_EJECT_AFTER_FAILURES,
+    eject_seconds=settings.OLLAMA_EJECT_SECONDS,
+    admission=llm_admission,
+    breaker=ollama_breaker
+)
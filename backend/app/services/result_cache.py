@@ -0,0 +1,198 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import sqlglot
+from sqlglot import exp
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query: str) -> Tuple[str, Tuple[str, ...], bool]:
+    """Canonical form of a query, the tables it reads and whether its result may be cached
+    Only read-only queries over schema-qualified tables, without random(), are cacheable.
+    Returns: (normalized_sql, ("schema.table", ...), cacheable)
+    """
+    try:
+        tree = sqlglot.parse_one(query, read="postgres")
+    except Exception:
+        return " ".join(query.split()).rstrip(";"), (), False
+    cte_names = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+    tables: List[str] = []
+    qualified = True
+    for table in tree.find_all(exp.Table):
+        if not table.db:
+            qualified = qualified and table.name in cte_names
+            continue
+        name = f"{table.db}.{table.name}"
+        if name not in tables:
+            tables.append(name)
+    cacheable = isinstance(tree, exp.Query) and qualified and bool(tables) and tree.find(exp.Rand) is None
+    return tree.sql(dialect="postgres", comments=False), tuple(sorted(tables)), cacheable
+
+
+def estimate_result_bytes(rows: List[Dict[str, Any]]) -> int:
+    """Approximate memory held by a result set (column name strings are shared by all rows)"""
+    return sys.getsizeof(rows) + sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+        for row in rows
+    )
+
+
+class ResultCache:
+    """Memory-bounded LRU cache with TTL mapping normalized SQL to its result rows
+
+    Each entry records the data version of every table it read. read_versions returns the
+    current {"schema.table": version} (or None where no signal is available); it is polled
+    in the background at most every version_check_seconds, so lookups never wait on the
+    database. An entry whose tables changed since it was stored is dropped, as is any entry
+    older than ttl_seconds. Without a version signal, entries live for the TTL.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_entry_bytes: int,
+        ttl_seconds: float,
+        version_check_seconds: float,
+        read_versions: Callable[[], Optional[Dict[str, str]]]
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.version_check_seconds = version_check_seconds
+        self.read_versions = read_versions
+        self._entries: "OrderedDict[str, Tuple[List[Dict[str, Any]], Dict[str, Optional[str]], float, int]]" = OrderedDict()
+        self._versions: Dict[str, str] = {}
+        self._versions_checked_at: Optional[float] = None
+        self._checking = False
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.uncacheable = 0
+        self.version_failures = 0
+
+    def get_or_execute(self, query: str, execute: Callable[[str], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Serve query from the cache, or run execute(query) and cache its rows"""
+        key, tables, cacheable = normalize_sql(query)
+        if not cacheable:
+            with self._lock:
+                self.uncacheable += 1
+            return execute(query)
+        rows = self.get(key)
+        if rows is not None:
+            return rows
+        # Stamp the entry with the versions known before running it, so a change that lands
+        # during execution invalidates it at the next version check
+        versions = self.table_versions(tables)
+        rows = execute(query)
+        self.put(key, rows, versions)
+        return rows
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Rows cached under a normalized query, or None on a miss or stale entry"""
+        self._check_versions_if_due()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            rows, versions, stored_at, _ = entry
+            if time.monotonic() - stored_at > self.ttl_seconds or not self._is_current(versions):
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Callers get their own row dicts, so they cannot change the cached ones
+        return [dict(row) for row in rows]
+
+    def put(self, key: str, rows: List[Dict[str, Any]], versions: Dict[str, Optional[str]]):
+        size = estimate_result_bytes(rows)
+        if self.max_bytes <= 0 or size > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = ([dict(row) for row in rows], versions, time.monotonic(), size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def table_versions(self, tables: Tuple[str, ...]) -> Dict[str, Optional[str]]:
+        """Last known data version of each table (None if unknown)"""
+        with self._lock:
+            return {table: self._versions.get(table) for table in tables}
+
+    def check_versions(self):
+        """Read the table versions and drop the entries of tables that changed (blocking)"""
+        try:
+            versions = self.read_versions()
+        except Exception as e:
+            with self._lock:
+                self.version_failures += 1
+                self._versions_checked_at = time.monotonic()
+            print(f"Warning: Result cache version check failed: {e}")
+            return
+        with self._lock:
+            self._versions_checked_at = time.monotonic()
+            if versions is None:
+                return
+            self._versions = versions
+            stale = [key for key, entry in self._entries.items() if not self._is_current(entry[1])]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "uncacheable": self.uncacheable,
+                "tables_tracked": len(self._versions),
+                "seconds_since_version_check": round(time.monotonic() - self._versions_checked_at, 1)
+                if self._versions_checked_at is not None else None,
+                "version_failures": self.version_failures
+            }
+
+    def _is_current(self, versions: Dict[str, Optional[str]]) -> bool:
+        return all(version == self._versions.get(table) for table, version in versions.items())
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.bytes -= entry[3]
+
+    def _check_versions_if_due(self):
+        with self._lock:
+            checked_at = self._versions_checked_at
+            if self._checking or (checked_at is not None and time.monotonic() - checked_at < self.version_check_seconds):
+                return
+            self._checking = True
+        threading.Thread(target=self._check_in_background, name="result-cache-versions", daemon=True).start()
+
+    def _check_in_background(self):
+        try:
+            self.check_versions()
+        finally:
+            with self._lock:
+                self._checking = False
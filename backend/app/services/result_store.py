@@ -0,0 +1,162 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+
+
+def _json_default(value: Any) -> Any:
+    """Encode values the way API responses do, so later pages match the first one"""
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+class ResultStore:
+    """Disk-backed store of query results that clients page through by handle
+
+    A response carries the first page of its results and, when there are more rows, a handle
+    for the rest. The rows behind a handle are written to a file as JSON lines, with the byte
+    offset of every row kept in memory, so a page read seeks to its first row and parses only
+    that page; results are not held in process memory while clients page through them.
+    Handles expire after ttl_seconds, or earlier (least recently used first) when the files
+    take more than max_bytes. Files live in directory (a new temporary directory if empty).
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float, directory: str = ""):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._owns_directory = not directory
+        self.directory = directory or tempfile.mkdtemp(prefix="hr-results-")
+        os.makedirs(self.directory, exist_ok=True)
+        # handle -> (byte offset of each row, stored at, file size)
+        self._entries: "OrderedDict[str, Tuple[array, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.stored = 0
+        self.pages_served = 0
+        self.evictions = 0
+        self.expired = 0
+        self.rejected = 0
+
+    def put(self, rows: List[Dict[str, Any]]) -> Optional[str]:
+        """Write rows to disk for paging (blocking)
+        Returns: the results handle, or None if the rows do not fit in the store
+        """
+        handle = uuid.uuid4().hex
+        path = self._path(handle)
+        offsets = array("q")
+        size = 0
+        with open(path, "wb") as f:
+            for row in rows:
+                offsets.append(size)
+                line = json.dumps(row, default=_json_default).encode("utf-8") + b"\n"
+                size += len(line)
+                if size > self.max_bytes:
+                    break
+                f.write(line)
+        if size > self.max_bytes:
+            os.remove(path)
+            with self._lock:
+                self.rejected += 1
+            return None
+        with self._lock:
+            self._drop_expired()
+            self._entries[handle] = (offsets, time.monotonic(), size)
+            self.bytes += size
+            self.stored += 1
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return handle
+
+    def page(self, handle: str, offset: int, limit: int) -> Optional[Dict[str, Any]]:
+        """One page of stored results (blocking; reads only that page from disk)
+        Returns: {"rows": [], "offset": int, "total_rows": int, "next_offset": int or None}, or None for an unknown or expired handle
+        """
+        with self._lock:
+            self._drop_expired()
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            self._entries.move_to_end(handle)
+            self.pages_served += 1
+            offsets = entry[0]
+        total = len(offsets)
+        end = min(offset + limit, total)
+        rows = []
+        if offset < total:
+            try:
+                with open(self._path(handle), "rb") as f:
+                    f.seek(offsets[offset])
+                    rows = [json.loads(f.readline()) for _ in range(end - offset)]
+            except FileNotFoundError:
+                # Evicted after the lookup above
+                return None
+        return {
+            "rows": rows,
+            "offset": offset,
+            "total_rows": total,
+            "next_offset": end if end < total else None
+        }
+
+    def close(self):
+        """Delete every stored result (and the directory if the store created it)"""
+        with self._lock:
+            for handle in list(self._entries):
+                self._remove(handle)
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "handles": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "directory": self.directory,
+                "stored": self.stored,
+                "pages_served": self.pages_served,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "rejected": self.rejected
+            }
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.directory, f"{handle}.jsonl")
+
+    def _drop_expired(self):
+        # Entries are in least recently used order, which is not creation order, so check them all
+        now = time.monotonic()
+        for handle in [h for h, entry in self._entries.items() if now - entry[1] > self.ttl_seconds]:
+            self._remove(handle)
+            self.expired += 1
+
+    def _remove(self, handle: str):
+        entry = self._entries.pop(handle)
+        self.bytes -= entry[2]
+        try:
+            os.remove(self._path(handle))
+        except FileNotFoundError:
+            pass
+
+
+result_store = ResultStore(
+    max_bytes=settings.RESULTS_STORE_MAX_MB * 1024 * 1024,
+    ttl_seconds=settings.RESULTS_STORE_TTL_SECONDS,
+    directory=settings.RESULTS_STORE_DIR
+)
@@ -0,0 +1,335 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set
+import numpy as np
+from langchain_community.embeddings import OllamaEmbeddings
+from app.config import settings
+from app.services.sql_cache import normalize_question, context_fingerprint
+from app.services.circuit_breaker import embedding_breaker
+
+
+# Literal values that must match for a similar question to reuse cached SQL ("hired in 2021"
+# and "hired in 2022" embed almost identically)
+NUMBER_PATTERN = r'\b\d+(?:\.\d+)?\b'
+QUOTED_PATTERN = r'"([^"]+)"|\'([^\']+)\''
+SQL_STRING_PATTERN = r"'((?:[^']|'')*)'"
+
+
+def _words(text: str) -> str:
+    return re.sub(r'[\W_]+', ' ', text.lower()).strip()
+
+
+def sql_entity_values(sql: str) -> Set[str]:
+    """Text literals of a SQL query ('Sales', '%engineer%') as lower-case words"""
+    values = {_words(value) for value in re.findall(SQL_STRING_PATTERN, sql)}
+    return {value for value in values if re.search(r'[a-z]', value)}
+
+
+def question_literals(question: str, entity_values: Set[str]) -> FrozenSet[str]:
+    """Numbers, quoted text and known entity values mentioned in a question"""
+    normalized = normalize_question(question)
+    literals = set(re.findall(NUMBER_PATTERN, normalized))
+    literals.update(_words(a or b) for a, b in re.findall(QUOTED_PATTERN, normalized))
+    words = f" {_words(normalized)} "
+    literals.update(value for value in entity_values if f" {value} " in words)
+    return frozenset(literals)
+
+
+class SemanticCache:
+    """Embedding-based question -> SQL cache for paraphrased questions
+
+    Question embeddings are kept L2-normalized in an in-process NumPy matrix, so
+    cosine similarity is a single matrix-vector product. Entries are only matched
+    against entries stored with the same conversation context fingerprint, and only
+    returned when both questions mention the same literals (numbers, quoted text and entity
+    values seen in cached SQL, e.g. 'Sales'). Changes are
+    written to path in the background, at most once per save_delay seconds.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], List[float]],
+        threshold: float,
+        max_entries: int,
+        top_k: int = 3,
+        path: Optional[str] = None,
+        save_delay: float = 5.0
+    ):
+        self.embed_fn = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.top_k = top_k
+        self.path = path
+        self.save_delay = save_delay
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._saving = False
+        self._vectors: Optional[np.ndarray] = None  # shape (n, dim), float32, unit rows
+        self._entries: List[Dict[str, Any]] = []
+        self._entity_values: Set[str] = set()  # text literals of cached SQL
+        self._clock = 0  # monotonically increasing use counter for LRU eviction
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+        self.literal_mismatches = 0
+        self._lookup_ms = deque(maxlen=1000)
+        self._miss_similarities = deque(maxlen=1000)
+        if path:
+            self._load()
+
+    def embed(self, question: str) -> Optional[np.ndarray]:
+        """Embed a normalized question as a unit vector, or None if the embedding call fails"""
+        try:
+            vector = np.asarray(self.embed_fn(normalize_question(question)), dtype=np.float32)
+        except Exception as e:
+            self.errors += 1
+            print(f"Warning: Question embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+
+    def lookup(self, question: str, context_text: str = "", embedding: Optional[np.ndarray] = None) -> Optional[Dict[str, Any]]:
+        """Find cached SQL for a semantically similar question
+        Returns: {"sql": str, "question": str, "similarity": float, "candidates": [...]} or None
+        """
+        start = time.perf_counter()
+        if embedding is None:
+            embedding = self.embed(question)
+        if embedding is None:
+            return None
+
+        fingerprint = context_fingerprint(context_text)
+        with self._lock:
+            try:
+                if self._vectors is None or not self._entries or self._vectors.shape[1] != embedding.shape[0]:
+                    self.misses += 1
+                    return None
+
+                similarities = self._vectors @ embedding
+                mask = np.array([entry["context"] == fingerprint for entry in self._entries])
+                similarities = np.where(mask, similarities, -1.0)
+
+                k = min(self.top_k, len(similarities))
+                top = np.argpartition(-similarities, k - 1)[:k]
+                top = top[np.argsort(-similarities[top])]
+                candidates = [
+                    {"question": self._entries[i]["question"], "similarity": float(similarities[i])}
+                    for i in top if similarities[i] > -1.0
+                ]
+
+                best_similarity = float(similarities[top[0]])
+                if best_similarity < self.threshold:
+                    self.misses += 1
+                    if best_similarity > -1.0:
+                        self._miss_similarities.append(best_similarity)
+                    return None
+
+                literals = question_literals(question, self._entity_values)
+                best = next(
+                    (int(i) for i in top
+                     if similarities[i] >= self.threshold
+                     and question_literals(self._entries[i]["question"], self._entity_values) == literals),
+                    None
+                )
+                if best is None:
+                    # Similar wording, different values: the cached SQL would answer another question
+                    self.misses += 1
+                    self.literal_mismatches += 1
+                    return None
+                best_similarity = float(similarities[best])
+
+                self.hits += 1
+                self._clock += 1
+                entry = self._entries[best]
+                entry["last_used"] = self._clock
+                return {
+                    "sql": entry["sql"],
+                    "question": entry["question"],
+                    "similarity": best_similarity,
+                    "candidates": candidates
+                }
+            finally:
+                self._lookup_ms.append((time.perf_counter() - start) * 1000)
+
+    def add(self, question: str, sql: str, context_text: str = "", embedding: Optional[np.ndarray] = None):
+        """Store validated SQL for a question, evicting the least recently used entry when full"""
+        if self.max_entries <= 0:
+            return
+        if embedding is None:
+            embedding = self.embed(question)
+        if embedding is None:
+            return
+
+        normalized = normalize_question(question)
+        fingerprint = context_fingerprint(context_text)
+        with self._lock:
+            self._entity_values.update(sql_entity_values(sql))
+            self._clock += 1
+            entry = {
+                "question": normalized,
+                "sql": sql,
+                "context": fingerprint,
+                "last_used": self._clock
+            }
+
+            if self._vectors is None or self._vectors.shape[1] != embedding.shape[0]:
+                # First entry, or the embedding model changed: start a fresh index
+                self._vectors = embedding.reshape(1, -1)
+                self._entries = [entry]
+            else:
+                existing = next(
+                    (i for i, e in enumerate(self._entries)
+                     if e["question"] == normalized and e["context"] == fingerprint),
+                    None
+                )
+                if existing is None and len(self._entries) >= self.max_entries:
+                    existing = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                    self.evictions += 1
+
+                if existing is None:
+                    self._vectors = np.vstack([self._vectors, embedding])
+                    self._entries.append(entry)
+                else:
+                    self._vectors[existing] = embedding
+                    self._entries[existing] = entry
+            self._dirty = True
+        self._schedule_save()
+
+    def discard(self, question: str, context_text: str = ""):
+        """Remove the entry for a cached question (as returned by lookup), e.g. after its SQL failed"""
+        normalized = normalize_question(question)
+        fingerprint = context_fingerprint(context_text)
+        with self._lock:
+            index = next(
+                (i for i, e in enumerate(self._entries)
+                 if e["question"] == normalized and e["context"] == fingerprint),
+                None
+            )
+            if index is None:
+                return
+            del self._entries[index]
+            self._vectors = np.delete(self._vectors, index, axis=0) if self._entries else None
+            self._entity_values = set().union(*(sql_entity_values(e["sql"]) for e in self._entries))
+            self._dirty = True
+        self._schedule_save()
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+            self._entity_values = set()
+            self._dirty = True
+        self._schedule_save()
+
+    def flush(self):
+        """Write unsaved changes to disk now (blocking)"""
+        if not self.path:
+            return
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                # Copied so the file is written outside the lock; rows are updated in place
+                vectors = self._vectors.copy() if self._vectors is not None else np.zeros((0, 0), dtype=np.float32)
+                entries = json.dumps(self._entries)
+            self._save(vectors, entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            latencies = np.array(self._lookup_ms) if self._lookup_ms else None
+            miss_similarities = np.array(self._miss_similarities) if self._miss_similarities else None
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "evictions": self.evictions,
+                "literal_mismatches": self.literal_mismatches,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "lookup_ms": {
+                    "mean": float(latencies.mean()),
+                    "p50": float(np.percentile(latencies, 50)),
+                    "p95": float(np.percentile(latencies, 95))
+                } if latencies is not None else None,
+                # Best similarity seen on misses - useful for tuning the threshold
+                "miss_similarity": {
+                    "mean": float(miss_similarities.mean()),
+                    "max": float(miss_similarities.max())
+                } if miss_similarities is not None else None
+            }
+
+    def _schedule_save(self):
+        """Start a background save unless one is already pending"""
+        if not self.path:
+            return
+        with self._lock:
+            if self._saving:
+                return
+            self._saving = True
+        threading.Thread(target=self._save_in_background, name="semantic-cache-save", daemon=True).start()
+
+    def _save_in_background(self):
+        try:
+            # Changes made during the delay go into the same write
+            time.sleep(self.save_delay)
+            self.flush()
+        finally:
+            with self._lock:
+                self._saving = False
+                pending = self._dirty
+            if pending:
+                self._schedule_save()
+
+    def _save(self, vectors: np.ndarray, entries: str):
+        """Persist vectors and entries (as JSON) to disk (caller holds the write lock)"""
+        try:
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(tmp_path, vectors=vectors, entries=np.array(entries))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Warning: Failed to persist semantic cache: {e}")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                vectors = data["vectors"].astype(np.float32)
+                entries = json.loads(str(data["entries"]))
+            if len(entries) and vectors.shape[0] == len(entries):
+                self._vectors = vectors
+                self._entries = entries
+                self._entity_values = set().union(*(sql_entity_values(e["sql"]) for e in entries))
+                self._clock = max(e.get("last_used", 0) for e in entries)
+        except Exception as e:
+            print(f"Warning: Failed to load semantic cache from {self.path}: {e}")
+
+
+_embeddings = OllamaEmbeddings(
+    base_url=settings.OLLAMA_BASE_URL,
+    model=settings.OLLAMA_EMBEDDING_MODEL,
+    query_instruction="",
+    embed_instruction=""
+)
+
+semantic_cache = SemanticCache(
+    # Own breaker: a missing embedding model or a down OLLAMA_BASE_URL only disables this cache
+    embed=lambda text: embedding_breaker.call(_embeddings.embed_query, text),
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    top_k=settings.SEMANTIC_CACHE_TOP_K,
+    path=settings.SEMANTIC_CACHE_PATH or None,
+    save_delay=settings.SEMANTIC_CACHE_SAVE_DELAY_SECONDS
+)
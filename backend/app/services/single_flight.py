@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from app.config import settings
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one shared execution
+
+    The first caller for a key starts the work; callers arriving while it is still running
+    await the same result (or exception) instead of starting their own. Once the work
+    finishes the key is released, so later calls run again. Runs on the event loop only.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._in_flight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run func() once per key at a time
+        Returns: (result, coalesced) - coalesced is True if another caller's execution was shared
+        """
+        if not self.enabled:
+            self.executions += 1
+            return await func(), False
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # Shielded so a disconnecting caller never cancels the work the others are awaiting
+            return await asyncio.shield(future), True
+
+        self.executions += 1
+        future = asyncio.ensure_future(func())
+        self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(future), False
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.executions + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesce_rate": self.coalesced / requests if requests else 0.0
+        }
+
+    def _finish(self, key: Hashable, done: "asyncio.Future[Any]"):
+        if self._in_flight.get(key) is done:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every caller went away before it was raised
+        if not done.cancelled():
+            done.exception()
+
+
+class SharedCalls:
+    """Thread-safe memo that runs a blocking call once per key
+
+    Callers with a key that was already seen, whether still running or finished, get the
+    first call's result (or exception). Meant for one short-lived scope, such as one batch.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Dict[Hashable, Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def run(self, key: Hashable, func: Callable[..., Any], *args) -> Any:
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._futures[key] = future
+                self.calls += 1
+            else:
+                self.shared += 1
+        if owner:
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+
+query_flights = SingleFlight(enabled=settings.SINGLE_FLIGHT_ENABLED)
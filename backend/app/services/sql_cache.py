@@ -0,0 +1,94 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.config import settings
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for cache lookups (case, whitespace, trailing punctuation)"""
+    normalized = re.sub(r'\s+', ' ', question.strip().lower())
+    return normalized.rstrip(' ?.!')
+
+
+def context_fingerprint(context_text: str) -> str:
+    """Fingerprint of the conversation context that is fed into SQL generation"""
+    if not context_text:
+        return ""
+    return hashlib.sha1(context_text.encode("utf-8")).hexdigest()
+
+
+class SQLCache:
+    """Bounded LRU cache with TTL mapping (question, context) to validated SQL"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, question: str, context_text: str = "") -> Tuple[str, str]:
+        return normalize_question(question), context_fingerprint(context_text)
+
+    def get(self, question: str, context_text: str = "") -> Optional[str]:
+        """Return cached SQL for the question, or None on a miss or expired entry"""
+        key = self.make_key(question, context_text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            sql, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return sql
+
+    def put(self, question: str, sql: str, context_text: str = ""):
+        """Store validated SQL for the question"""
+        if self.max_entries <= 0:
+            return
+        key = self.make_key(question, context_text)
+        with self._lock:
+            self._entries[key] = (sql, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, question: str, context_text: str = ""):
+        """Drop the cached SQL for the question, e.g. after it failed to execute"""
+        key = self.make_key(question, context_text)
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+sql_cache = SQLCache(
+    max_entries=settings.SQL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.SQL_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark Ollama prompt-eval time with a cold vs warm prompt prefix
+Run this against a running Ollama server (CPU-only hosts show the biggest difference)
+
+Cold: every request starts with a unique line, so no KV cache can be reused.
+Warm: every request sends the same static system prompt, so only the user message is evaluated.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import uuid
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.config import settings
+from app.agent.prompts import SQL_GENERATION_SYSTEM_PROMPT, SQL_GENERATION_USER_PROMPT
+
+QUESTIONS = [
+    "Show me average salary by department",
+    "What is the gender distribution of employees?",
+    "Show me monthly attrition rate trends",
+    "Show me the top 5 highest paid employees",
+    "What is the average engagement score by department?",
+    "Show me employees who completed training courses",
+    "What is the salary change history for employees?",
+    "Show me employees with their skills and proficiency levels",
+]
+
+
+def chat(system_prompt: str, question: str) -> dict:
+    """Send one chat request and return Ollama's timing fields (durations in ms)"""
+    response = requests.post(
+        f"{settings.OLLAMA_BASE_URL}/api/chat",
+        json={
+            "model": settings.OLLAMA_MODEL,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": SQL_GENERATION_USER_PROMPT.format(conversation_history="", question=question)}
+            ],
+            "stream": False,
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+            # Only the prompt evaluation is being measured
+            "options": {"num_predict": 1, "temperature": 0}
+        },
+        timeout=600
+    )
+    response.raise_for_status()
+    data = response.json()
+    return {
+        "prompt_eval_count": data.get("prompt_eval_count", 0),
+        "prompt_eval_ms": data.get("prompt_eval_duration", 0) / 1e6,
+        "total_ms": data.get("total_duration", 0) / 1e6
+    }
+
+
+def summarize(name: str, runs: list) -> dict:
+    eval_ms = [r["prompt_eval_ms"] for r in runs]
+    total_ms = [r["total_ms"] for r in runs]
+    summary = {
+        "mode": name,
+        "requests": len(runs),
+        "prompt_eval_tokens_mean": statistics.mean(r["prompt_eval_count"] for r in runs),
+        "prompt_eval_ms_mean": statistics.mean(eval_ms),
+        "prompt_eval_ms_p50": statistics.median(eval_ms),
+        "total_ms_mean": statistics.mean(total_ms)
+    }
+    print(f"{name:>5}: {summary['prompt_eval_ms_mean']:9.1f}ms prompt eval (p50 {summary['prompt_eval_ms_p50']:.1f}ms), "
+          f"{summary['prompt_eval_tokens_mean']:.0f} tokens evaluated, {summary['total_ms_mean']:.1f}ms total")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Ollama prompt-eval time with a cold vs warm prefix")
+    parser.add_argument("--rounds", type=int, default=1, help="Times to repeat the question set")
+    parser.add_argument("--output", help="Optional path to write the JSON summary")
+    args = parser.parse_args()
+
+    questions = QUESTIONS * args.rounds
+    print(f"Model: {settings.OLLAMA_MODEL} at {settings.OLLAMA_BASE_URL} (keep_alive={settings.OLLAMA_KEEP_ALIVE})")
+    print(f"Requests per mode: {len(questions)}")
+
+    # Load the model first so neither mode pays the load time
+    chat("You are a helpful assistant.", "ping")
+
+    cold_runs = []
+    for question in questions:
+        # A unique first line changes the very first tokens, so nothing can be reused
+        cold_runs.append(chat(f"Request {uuid.uuid4()}\n{SQL_GENERATION_SYSTEM_PROMPT}", question))
+
+    # Prime the cache with the static prefix, then measure
+    chat(SQL_GENERATION_SYSTEM_PROMPT, QUESTIONS[0])
+    warm_runs = [chat(SQL_GENERATION_SYSTEM_PROMPT, question) for question in questions]
+
+    print()
+    results = [summarize("cold", cold_runs), summarize("warm", warm_runs)]
+    speedup = results[0]["prompt_eval_ms_mean"] / results[1]["prompt_eval_ms_mean"] if results[1]["prompt_eval_ms_mean"] else 0
+    print(f"\nWarm prefix prompt-eval speedup: {speedup:.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results, "speedup": speedup}, f, indent=2)
+        print(f"✓ Results saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,12 @@ Runs evaluation on agent using hybrid approach (sample + extrapolation)
 import json
 import time
 import random
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from pathlib import Path
 
 from app.agent.hr_agent import hr_agent
+from app.config import settings
+from app.services.admission import priority, BATCH
 from evaluation.metrics import (
     evaluate_sql_exact_match,
     evaluate_sql_semantic_match,
@@ -30,16 +32,18 @@ from evaluation.extrapolation import extrapolate_results
 class AgentEvaluator:
     """Main evaluation class for HR Analytics Agent"""
     
-    def __init__(self, test_dataset_path: str, sample_size: int = 25):
+    def __init__(self, test_dataset_path: str, sample_size: int = 25, pipeline_mode: Optional[str] = None):
         """
         Initialize evaluator
         
         Args:
             test_dataset_path: Path to test dataset JSON file
             sample_size: Number of questions to actually test (default 25)
+            pipeline_mode: Agent pipeline to evaluate ("multi" or "fused", default from settings)
         """
         self.test_dataset_path = test_dataset_path
         self.sample_size = sample_size
+        self.pipeline_mode = pipeline_mode
         self.test_dataset = self._load_dataset()
         self.geval_evaluator = GEvalEvaluator()
         self.results = []
@@ -118,8 +122,9 @@ class AgentEvaluator:
         start_time = time.time()
         
         try:
-            # Run agent
-            agent_response = hr_agent.process_query(question, [])
+            # Run agent as batch traffic so live chat requests are served first
+            with priority(BATCH):
+                agent_response = hr_agent.process_query(question, [], pipeline_mode=self.pipeline_mode)
             
             latency = (time.time() - start_time) * 1000  # Convert to milliseconds
             
@@ -184,6 +189,8 @@ class AgentEvaluator:
                 # Performance
                 "latency": latency,
                 "tokens": tokens,
+                "llm_calls": agent_response.get("llm_calls", 0),
+                "pipeline_mode": agent_response.get("pipeline_mode"),
                 
                 # Human evaluation
                 "human_scores": human_scores,
@@ -212,6 +219,8 @@ class AgentEvaluator:
                 "viz_match": False,
                 "latency": latency,
                 "tokens": 0,
+                "llm_calls": 0,
+                "pipeline_mode": self.pipeline_mode,
                 "extrapolated": False
             }
     
@@ -264,16 +273,17 @@ class AgentEvaluator:
                 if result.get("success"):
                     print(f"\n[{i}/{len(sample)}] G-Eval for Q{test_case['id']}...", end="")
                     
-                    geval_result = self.geval_evaluator.evaluate_overall_reasoning(
-                        test_case["question"],
-                        {
-                            "sql_query": result.get("predicted_sql", ""),
-                            "tables": result.get("table_selection", {}).get("predicted_tables", []),
-                            "visualization": {"visualization_type": result.get("predicted_viz", "")},
-                            "result_columns": []
-                        },
-                        test_case["ground_truth"]
-                    )
+                    with priority(BATCH):
+                        geval_result = self.geval_evaluator.evaluate_overall_reasoning(
+                            test_case["question"],
+                            {
+                                "sql_query": result.get("predicted_sql", ""),
+                                "tables": result.get("table_selection", {}).get("predicted_tables", []),
+                                "visualization": {"visualization_type": result.get("predicted_viz", "")},
+                                "result_columns": []
+                            },
+                            test_case["ground_truth"]
+                        )
                     
                     geval_result["question_id"] = test_case["id"]
                     geval_results.append(geval_result)
@@ -321,6 +331,7 @@ class AgentEvaluator:
                 "total_questions": full_dataset_size,
                 "sample_size": len(sample_results),
                 "extrapolated_count": len(extrapolated_results) - len(sample_results),
+                "pipeline_mode": self.pipeline_mode or settings.PIPELINE_MODE,
                 "evaluation_date": time.strftime("%Y-%m-%d %H:%M:%S")
             },
             "sample_results": sample_results,
@@ -346,6 +357,9 @@ class AgentEvaluator:
         tokens = [r.get("tokens", 0) for r in self.results]
         token_stats = calculate_token_statistics(tokens)
         
+        # LLM round trips per query (multi vs fused pipeline)
+        llm_calls = [r.get("llm_calls", 0) for r in self.results if not r.get("extrapolated")]
+        
         # Completion rate
         completion_stats = calculate_completion_rate(self.results)
         
@@ -360,6 +374,10 @@ class AgentEvaluator:
             },
             "latency": latency_stats,
             "token_efficiency": token_stats,
+            "llm_calls": {
+                "mean": sum(llm_calls) / len(llm_calls) if llm_calls else 0,
+                "total": sum(llm_calls)
+            },
             "completion_rate": completion_stats,
             "accuracy_by_category": accuracy_by_category
         }
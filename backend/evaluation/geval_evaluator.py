@@ -10,6 +10,9 @@ from langchain_community.chat_models import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from app.config import settings
+from app.services.admission import llm_admission
+from app.services.llm_pool import OllamaPool
+from app.services.circuit_breaker import ollama_breaker
 
 
 class GEvalEvaluator:
@@ -17,10 +20,20 @@ class GEvalEvaluator:
     
     def __init__(self):
         try:
-            self.llm = ChatOllama(
-                base_url=settings.OLLAMA_BASE_URL,
-                model=settings.OLLAMA_MODEL,
-                temperature=0.3  # Lower temperature for more consistent evaluation
+            # Same backends and admission queue as the agent, so judge calls are scheduled
+            # at the caller's priority instead of competing with chat traffic directly
+            self.llm = OllamaPool(
+                base_urls=settings.OLLAMA_BASE_URLS or [settings.OLLAMA_BASE_URL],
+                make_llm=lambda url: ChatOllama(
+                    base_url=url,
+                    model=settings.OLLAMA_MODEL,
+                    temperature=0.3,  # Lower temperature for more consistent evaluation
+                    timeout=settings.OLLAMA_TIMEOUT_SECONDS
+                ),
+                eject_after=settings.OLLAMA_EJECT_AFTER_FAILURES,
+                eject_seconds=settings.OLLAMA_EJECT_SECONDS,
+                admission=llm_admission,
+                breaker=ollama_breaker
             )
             self.output_parser = StrOutputParser()
         except Exception as e:
@@ -6,6 +6,7 @@ Runs complete evaluation pipeline and generates report
 
 import sys
 import os
+import argparse
 from pathlib import Path
 
 # Add parent directory to path
@@ -19,6 +20,16 @@ from evaluation.manual_metrics_override import apply_manual_overrides, get_defau
 def main():
     """Main evaluation runner"""
     
+    parser = argparse.ArgumentParser(description="Run the HR Analytics Agent evaluation")
+    parser.add_argument(
+        "--pipeline-mode",
+        choices=["multi", "fused"],
+        default=None,
+        help="Agent pipeline to evaluate (default: PIPELINE_MODE from settings). "
+             "Results are written with a mode suffix so runs can be compared side by side."
+    )
+    args = parser.parse_args()
+    
     print("=" * 80)
     print("HR Analytics Agent - Complete Evaluation Pipeline")
     print("=" * 80)
@@ -44,7 +55,8 @@ def main():
         print("Initializing evaluator...")
         evaluator = AgentEvaluator(
             test_dataset_path=str(test_dataset_path),
-            sample_size=sample_size
+            sample_size=sample_size,
+            pipeline_mode=args.pipeline_mode
         )
         print("✓ Evaluator initialized")
         print()
@@ -87,12 +99,13 @@ def main():
         print("Generating Evaluation Report")
         print("=" * 80)
         
-        report_path = output_dir / "evaluation_report.md"
+        suffix = f"_{args.pipeline_mode}" if args.pipeline_mode else ""
+        report_path = output_dir / f"evaluation_report{suffix}.md"
         report_text = generate_evaluation_report(results, output_path=str(report_path))
         
         # Also save raw results as JSON
         import json
-        results_path = output_dir / "evaluation_results.json"
+        results_path = output_dir / f"evaluation_results{suffix}.json"
         with open(results_path, 'w') as f:
             json.dump(results, f, indent=2, default=str)
         
@@ -115,6 +128,8 @@ def main():
         print(f"Visualization Accuracy: {accuracy.get('visualization_accuracy', 0)*100:.1f}%")
         print(f"Task Completion Rate: {completion.get('completion_rate', 0)*100:.1f}%")
         print(f"Average Latency: {latency.get('mean', 0):.1f}ms (p95: {latency.get('p95', 0):.1f}ms)")
+        print(f"Pipeline Mode: {results['metadata'].get('pipeline_mode')} "
+              f"(avg {metrics.get('llm_calls', {}).get('mean', 0):.2f} LLM calls/query)")
         
         if metrics.get("geval_scores"):
             geval = metrics["geval_scores"]["overall_reasoning"]
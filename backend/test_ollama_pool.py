@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test script for the Ollama backend pool
+Starts local fake Ollama servers (fast, slow and broken) - no real Ollama needed
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.services.llm_pool import OllamaPool, make_chat_ollama
+
+
+def start_fake_ollama(port: int, delay: float = 0.0, fail: bool = False) -> ThreadingHTTPServer:
+    """Serve a minimal streaming /api/chat endpoint on localhost"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            if fail:
+                self.send_response(500)
+                self.end_headers()
+                self.wfile.write(b"model crashed")
+                return
+            lines = [
+                {"message": {"role": "assistant", "content": f"reply from {port}"}, "done": False},
+                {"message": {"role": "assistant", "content": ""}, "done": True}
+            ]
+            body = "\n".join(json.dumps(line) for line in lines).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def print_stats(pool: OllamaPool):
+    for backend in pool.stats():
+        latency = backend["latency_ms"]["mean"] if backend["latency_ms"] else 0
+        print(f"   {backend['url']}: healthy={backend['healthy']} requests={backend['requests']} "
+              f"failures={backend['failures']} ejections={backend['ejections']} mean={latency:.0f}ms")
+
+
+def test_least_outstanding_and_ejection():
+    """Fast backend should take most of the load; broken backend should be ejected"""
+    print("🔍 Testing load balancing and ejection...")
+    servers = [
+        start_fake_ollama(11501, delay=0.05),
+        start_fake_ollama(11502, delay=0.4),
+        start_fake_ollama(11503, fail=True)
+    ]
+    pool = OllamaPool(
+        base_urls=[f"http://127.0.0.1:{s.server_port}" for s in servers],
+        make_llm=make_chat_ollama,
+        eject_after=2,
+        eject_seconds=60
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            replies = list(executor.map(lambda _: pool.invoke("hello").content, range(40)))
+
+        stats = {b["url"]: b for b in pool.stats()}
+        fast, slow, broken = (stats[f"http://127.0.0.1:{p}"] for p in (11501, 11502, 11503))
+        print_stats(pool)
+
+        ok = (
+            len(replies) == 40
+            and all(r.startswith("reply from") for r in replies)
+            and fast["requests"] > slow["requests"]
+            and not broken["healthy"]
+            and broken["ejections"] >= 1
+        )
+        print("✅ Load balancing test passed" if ok else "❌ Load balancing test failed")
+        return ok
+    finally:
+        for server in servers:
+            server.shutdown()
+
+
+def test_streaming_failover():
+    """A stream that fails before the first chunk should move to a healthy backend"""
+    print("🔍 Testing streaming failover...")
+    servers = [start_fake_ollama(11504, fail=True), start_fake_ollama(11505)]
+    pool = OllamaPool(
+        base_urls=[f"http://127.0.0.1:{s.server_port}" for s in servers],
+        make_llm=make_chat_ollama
+    )
+    try:
+        texts = ["".join(chunk.content for chunk in pool.stream("hello")) for _ in range(4)]
+        print_stats(pool)
+        ok = all(text == "reply from 11505" for text in texts)
+        print("✅ Streaming failover test passed" if ok else "❌ Streaming failover test failed")
+        return ok
+    finally:
+        for server in servers:
+            server.shutdown()
+
+
+def test_abandoned_stream():
+    """A stream the consumer stops early should free its slot without recording a latency sample"""
+    print("🔍 Testing abandoned stream...")
+    server = start_fake_ollama(11506)
+    pool = OllamaPool(base_urls=[f"http://127.0.0.1:{server.server_port}"], make_llm=make_chat_ollama)
+    try:
+        stream = pool.stream("hello")
+        next(stream)
+        stream.close()
+        print_stats(pool)
+        backend = pool.stats()[0]
+        ok = backend["outstanding"] == 0 and backend["latency_ms"] is None and backend["failures"] == 0
+        print("✅ Abandoned stream test passed" if ok else "❌ Abandoned stream test failed")
+        return ok
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Ollama Pool Test Suite")
+    print("=" * 60)
+    results = [test_least_outstanding_and_ejection(), test_streaming_failover(), test_abandoned_stream()]
+    print("=" * 60)
+    print(f"{sum(results)}/{len(results)} tests passed")
@@ -94,6 +94,8 @@ function App() {
             columns: response.columns,
             visualization: response.visualization,
             results: response.results,
+            total_rows: response.total_rows,
+            results_handle: response.results_handle,
             insights: response.insights,
             explanation: response.explanation,
           },
@@ -113,6 +115,8 @@ function App() {
               columns: response.columns,
               visualization: response.visualization,
               results: response.results,
+              total_rows: response.total_rows,
+              results_handle: response.results_handle,
               insights: response.insights,
               explanation: response.explanation,
             },
@@ -244,6 +248,8 @@ function App() {
                         <DataVisualization
                           data={message.metadata.results}
                           visualization={message.metadata.visualization}
+                          totalRows={message.metadata.total_rows}
+                          resultsHandle={message.metadata.results_handle}
                         />
                       ) : null}
                     </div>
@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useState } from 'react';
 import {
   BarChart,
   Bar,
@@ -14,7 +14,9 @@ import {
   Legend,
   ResponsiveContainer,
 } from 'recharts';
+import { toast } from 'react-toastify';
 import SingleValueCard from './SingleValueCard';
+import { getResultsPage } from '../services/api';
 
 interface DataVisualizationProps {
   data: any[];
@@ -24,11 +26,66 @@ interface DataVisualizationProps {
     y_axis?: string;
     explanation?: string;
   };
+  totalRows?: number;  // Rows in the full result when data is only its first page
+  resultsHandle?: string;  // Pages through the rest of the result
 }
 
+const TABLE_ROWS_STEP = 100;
+
 const COLORS = ['#8b5cf6', '#3b82f6', '#10b981', '#f59e0b', '#ef4444', '#06b6d4'];
 
-const DataVisualization: React.FC<DataVisualizationProps> = ({ data, visualization }) => {
+const DataVisualization: React.FC<DataVisualizationProps> = ({ data, visualization, totalRows, resultsHandle }) => {
+  // Rows fetched so far; later pages are requested only when the user asks for more
+  const [rows, setRows] = useState<any[]>(data || []);
+  const [nextOffset, setNextOffset] = useState<number | null>(
+    resultsHandle && data && totalRows && data.length < totalRows ? data.length : null
+  );
+  const [visibleRows, setVisibleRows] = useState(TABLE_ROWS_STEP);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const total = totalRows ?? rows.length;
+
+  const fetchNextPage = async () => {
+    if (!resultsHandle || nextOffset === null) return;
+    setLoadingMore(true);
+    try {
+      const page = await getResultsPage(resultsHandle, nextOffset);
+      setRows((loaded) => [...loaded, ...page.rows]);
+      setNextOffset(page.next_offset);
+    } catch {
+      toast.error('Failed to load more rows. Please run the query again.');
+      setNextOffset(null);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const showMoreRows = async () => {
+    if (visibleRows + TABLE_ROWS_STEP > rows.length) {
+      await fetchNextPage();
+    }
+    setVisibleRows((visible) => visible + TABLE_ROWS_STEP);
+  };
+
+  const loadMoreFooter = (shown: number, onLoadMore: () => void, canLoadMore: boolean) => (
+    <div className="flex items-center justify-between px-6 py-3 text-sm text-slate-400 bg-slate-800/30 border-t border-slate-700/50">
+      <span>Showing first {shown} of {total} rows</span>
+      {canLoadMore && (
+        <button
+          onClick={onLoadMore}
+          disabled={loadingMore}
+          className="px-3 py-1 rounded-lg text-slate-200 bg-slate-700/60 hover:bg-slate-700 disabled:opacity-50 disabled:cursor-not-allowed transition-colors"
+        >
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
+    </div>
+  );
+
+  // Charts plot the rows loaded so far and can fetch the next page
+  const chartFooter = rows.length < total
+    ? loadMoreFooter(rows.length, fetchNextPage, nextOffset !== null)
+    : null;
+
   if (!data || data.length === 0) {
     return (
       <div className="bg-gray-800 border border-gray-700 rounded-lg p-8 text-center text-gray-400">
@@ -46,7 +103,7 @@ const DataVisualization: React.FC<DataVisualizationProps> = ({ data, visualizati
   }
 
   // Prepare data for charts
-  const chartData = data.map((row) => {
+  const chartData = rows.map((row) => {
     const entry: any = {};
     Object.keys(row).forEach((key) => {
       const value = row[key];
@@ -104,6 +161,7 @@ const DataVisualization: React.FC<DataVisualizationProps> = ({ data, visualizati
             </defs>
           </BarChart>
         </ResponsiveContainer>
+        {chartFooter}
       </div>
     );
   }
@@ -146,6 +204,7 @@ const DataVisualization: React.FC<DataVisualizationProps> = ({ data, visualizati
             />
           </LineChart>
         </ResponsiveContainer>
+        {chartFooter}
       </div>
     );
   }
@@ -183,6 +242,7 @@ const DataVisualization: React.FC<DataVisualizationProps> = ({ data, visualizati
             />
           </PieChart>
         </ResponsiveContainer>
+        {chartFooter}
       </div>
     );
   }
@@ -202,7 +262,7 @@ const DataVisualization: React.FC<DataVisualizationProps> = ({ data, visualizati
             </tr>
           </thead>
           <tbody>
-            {data.slice(0, 100).map((row, idx) => (
+            {rows.slice(0, visibleRows).map((row, idx) => (
               <tr 
                 key={idx} 
                 className="border-t border-slate-700/50 hover:bg-slate-700/30 transition-colors"
@@ -216,11 +276,8 @@ const DataVisualization: React.FC<DataVisualizationProps> = ({ data, visualizati
             ))}
           </tbody>
         </table>
-        {data.length > 100 && (
-          <div className="px-6 py-3 text-sm text-slate-400 bg-slate-800/30 border-t border-slate-700/50">
-            Showing first 100 of {data.length} rows
-          </div>
-        )}
+        {Math.min(visibleRows, rows.length) < total &&
+          loadMoreFooter(Math.min(visibleRows, rows.length), showMoreRows, visibleRows < rows.length || nextOffset !== null)}
       </div>
     </div>
   );
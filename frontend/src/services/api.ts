@@ -12,7 +12,9 @@ export interface QueryResponse {
   session_id: string;
   answer: string;
   sql_query?: string;
-  results?: any[];
+  results?: any[];  // First page of rows
+  total_rows?: number;
+  results_handle?: string;  // Set when there are more rows than the first page
   tables?: string[];
   columns?: Record<string, string[]>;
   visualization?: {
@@ -35,6 +37,21 @@ const api = axios.create({
   },
 });
 
+export interface ResultsPage {
+  handle: string;
+  offset: number;
+  limit: number;
+  total_rows: number;
+  rows: any[];
+  next_offset: number | null;
+}
+
+export const getResultsPage = async (handle: string, offset: number): Promise<ResultsPage> => {
+  const response = await api.get<ResultsPage>(`/api/results/${handle}`, { params: { offset } });
+  return response.data;
+};
+
+// Returns the first page of rows; fetch the rest with getResultsPage as they are needed
 export const queryHR = async (request: QueryRequest): Promise<QueryResponse> => {
   const response = await api.post<QueryResponse>('/api/query', request);
   return response.data;
@@ -11,6 +11,8 @@ export interface Message {
     columns?: Record<string, string[]>;
     visualization?: any;
     results?: any[];
+    total_rows?: number;
+    results_handle?: string;
     insights?: string[];
     explanation?: string;
     error?: boolean;